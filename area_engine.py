@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import heapq
+
+import numpy as np
+
+import instrumentation
+from geo_utils import haversine_to_many
+from parallel_analysis import run_sharded
+from quantile_sketch import build_quantile_columns, quantile_metrics
+from ring_analysis import build_ring_columns, ring_metrics
+from spatial_index import GridIndex
+
+SEARCH_RADIUS_KM = 3.0
+# 詳細清單列出的最近競爭者數量
+NEAREST_COUNT = 5
+
+def nearest_entries(entries, k=NEAREST_COUNT):
+    """由含 'distance' 的周邊清單取出最近的 k 筆（以有界堆積選取，距離相同時保持原順序）"""
+    return heapq.nsmallest(k, entries, key=lambda entry: entry['distance'])
+
+def nearest_competitors(lat, lon, external_parking, k=NEAREST_COUNT, external_index=None,
+                        predicate=None, max_radius_km=None):
+    """查詢單一座標最近的 k 個外部停車場，回傳依距離由近到遠排列的清單
+    
+    可傳入已建立的 external_index 重複查詢；predicate 限定納入的停車場
+    （例如只看有臨停服務的），max_radius_km 限制最大距離。
+    """
+    if external_index is None:
+        external_index = GridIndex(
+            (external['lat'], external['lon']) for external in external_parking
+        )
+    mask = None
+    if predicate is not None:
+        mask = np.array([bool(predicate(external)) for external in external_parking], dtype=bool)
+    
+    indices, distances = external_index.query_nearest(lat, lon, k, max_radius_km, mask)
+    competitors = []
+    for j, distance in zip(indices.tolist(), distances.tolist()):
+        external = external_parking[j]
+        competitors.append({
+            'id': external['id'],
+            'name': external['name'],
+            'distance': distance,
+            'day_rate': external['day_rate'],
+            'night_rate': external['night_rate'],
+            'monthly_rate': external['monthly_rate'],
+            'space_number': external['space_number']
+        })
+    return competitors
+
+def build_context(external_parking, reports, radii=None):
+    """建立所有報表共用的分析環境，回傳可傳給 analyze_uspace 的參數組
+    
+    reports 為 {報表名稱: 報表定義}，報表定義包含：
+      predicate - 外部停車場是否納入此報表的競爭者（None 表示全部納入）
+      metrics   - metrics(uspace, nearby) 回傳結果列，nearby 為半徑內的
+                  [(外部停車場, 距離km), ...]，依外部停車場原始順序排列
+    所有報表共用同一個空間索引；predicate 預先算成布林陣列；
+    計算費率分位數用的費率陣列也只在此建立一次。
+    """
+    external_index = GridIndex(
+        (external['lat'], external['lon']) for external in external_parking
+    )
+    masks = {}
+    for name, report in reports.items():
+        predicate = report.get('predicate')
+        if predicate is not None:
+            masks[name] = np.array([bool(predicate(external)) for external in external_parking], dtype=bool)
+    ring_columns = build_ring_columns(external_parking) if radii else None
+    quantile_columns = build_quantile_columns(external_parking)
+    return (external_parking, external_index, reports, masks, radii, ring_columns, quantile_columns)
+
+def analyze_uspace(uspace, external_parking, external_index, reports, masks, radii=None, ring_columns=None,
+                   quantile_columns=None):
+    """以一次候選搜尋計算單一USpace停車場在所有報表的結果列，回傳 {報表名稱: 結果列}"""
+    search_radius = max([SEARCH_RADIUS_KM] + list(radii or []))
+    candidates = external_index.query_radius_candidates(uspace['lat'], uspace['lon'], search_radius)
+    distances = haversine_to_many(
+        uspace['lat'], uspace['lon'],
+        external_index.lats[candidates], external_index.lons[candidates]
+    )
+    within = distances <= SEARCH_RADIUS_KM
+    instrumentation.count('distance_evaluations', len(candidates))
+    instrumentation.count('candidate_hits', int(np.count_nonzero(within)))
+    
+    rows = {}
+    for name, report in reports.items():
+        if name in masks:
+            included = masks[name][candidates]
+            report_candidates = candidates[included]
+            report_distances = distances[included]
+            report_within = within[included]
+        else:
+            report_candidates, report_distances, report_within = candidates, distances, within
+        
+        nearby = [
+            (external_parking[j], distance)
+            for j, distance in zip(report_candidates[report_within].tolist(), report_distances[report_within].tolist())
+        ]
+        row = report['metrics'](uspace, nearby)
+        if quantile_columns is not None:
+            row.update(quantile_metrics(report_candidates[report_within], quantile_columns, '周邊'))
+        if radii:
+            row.update(ring_metrics(report_candidates, report_distances, ring_columns, radii, quantile_columns))
+        rows[name] = row
+    return rows
+
+def run_area_reports(data, reports, workers=1, radii=None):
+    """一次掃描所有USpace停車場，同時產生多份周邊分析報表
+    
+    回傳 {報表名稱: 結果列清單}；workers > 1 時依空間方塊分片平行計算。
+    """
+    uspace_parking = data['uspace_parking']
+    with instrumentation.stage('area_scan', rows_in=len(uspace_parking)) as record:
+        context = build_context(data['external_parking'], reports, radii)
+        
+        if workers > 1:
+            # 依空間方塊分片，以多行程平行計算
+            rows_by_uspace = run_sharded(uspace_parking, analyze_uspace, context, workers)
+        else:
+            rows_by_uspace = [
+                analyze_uspace(uspace, *context)
+                for uspace in instrumentation.track(uspace_parking)
+            ]
+        record['rows_out'] = len(rows_by_uspace)
+    
+    return {name: [rows[name] for rows in rows_by_uspace] for name in reports}
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import argparse
+
+import instrumentation
+import uspace_area_analysis
+import uspace_area_analysis_filtered
+from area_engine import SEARCH_RADIUS_KM, run_area_reports
+from incremental_analysis import build_snapshot, save_snapshot
+from ring_analysis import parse_radii
+
+# 以一次掃描同時產生的周邊分析報表
+REPORTS = {
+    'area': uspace_area_analysis.REPORT,
+    'area_filtered': uspace_area_analysis_filtered.REPORT
+}
+
+def analyze_all_reports(data, workers=1, radii=None):
+    """以共用的候選搜尋同時計算所有報表，回傳 {報表名稱: 結果列清單}"""
+    return run_area_reports(data, REPORTS, workers, radii)
+
+def main():
+    parser = argparse.ArgumentParser(description='以單次掃描同時產生USpace周邊分析與過濾後分析')
+    parser.add_argument('--workers', type=int, default=1, help='平行計算的行程數（預設1，不平行）')
+    parser.add_argument('--radii', type=parse_radii,
+                        help='額外輸出的半徑圈（公里，以逗號分隔），例如 1,3,5')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+    
+    print("開始USpace停車場周邊分析（全部報表）...")
+    
+    data = uspace_area_analysis.load_parking_data()
+    print(f"USpace停車場數量: {len(data['uspace_parking'])}")
+    print(f"外部停車場數量: {len(data['external_parking'])}")
+    
+    reports = analyze_all_reports(data, workers=args.workers, radii=args.radii)
+    
+    uspace_area_analysis.save_to_csv(reports['area'], radii=args.radii)
+    uspace_area_analysis_filtered.save_to_csv(reports['area_filtered'], radii=args.radii)
+    
+    # 過濾後報表的增量更新快照，與單獨執行時相同
+    search_radius = max([SEARCH_RADIUS_KM] + (args.radii or []))
+    save_snapshot(build_snapshot(data['uspace_parking'], data['external_parking'], search_radius),
+                  uspace_area_analysis_filtered.STATE_FILE)
+    
+    uspace_area_analysis.generate_summary_stats(reports['area'])
+    uspace_area_analysis_filtered.generate_summary_stats(reports['area_filtered'])
+    
+    print("\n分析完成！")
+    
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
+
+if __name__ == "__main__":
+    main()
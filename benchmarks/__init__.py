@@ -0,0 +1,9 @@
+"""停車場資料處理流程的效能基準測試
+
+synthetic_data 產生模擬全台分布的USpace與外部停車場CSV，
+run_benchmarks 依序量測各處理階段的時間與記憶體並輸出JSON結果。
+
+在專案根目錄執行：
+    python -m benchmarks.run_benchmarks --sizes 10k,100k
+    python -m benchmarks.run_benchmarks --sizes 10k --compare benchmarks/results/<先前結果>.json
+"""
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import create_embedded_map
+import fix_city_names
+import format_filtered_analysis
+import format_price_analysis
+import instrumentation
+import simple_data_cleaner
+import uspace_area_analysis
+import uspace_area_analysis_filtered
+from benchmarks.synthetic_data import format_size, generate_dataset, parse_size
+from parking_table import ParkingTable, save_parking_table_binary
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+RESULTS_VERSION = 1
+# 1M 規模的周邊分析耗時很長，需另外以 --sizes 指定
+DEFAULT_SIZES = '10k,100k'
+
+# 地圖伺服器量測：每個檔案的請求次數（埠號由系統挑選未使用的埠）
+MAP_SERVER_FILES = ['parking_map.html', 'parking_data.bin', 'parking_data_fixed.json', 'parking_map_embedded.html']
+MAP_SERVER_REQUESTS = 5
+# 並行量測：同時連線的客戶端數量，每個客戶端以保持連線送出 MAP_SERVER_REQUESTS 次請求
+MAP_SERVER_CLIENTS = 8
+MAP_SERVER_STARTUP_TIMEOUT = 10
+
+@contextlib.contextmanager
+def measure(results, stage, rows=None, verbose=False):
+    """以 instrumentation.stage 量測區塊，結果（含計數器）附加到 results
+    
+    verbose 為 False 時，區塊內的 print 輸出會被捨棄。
+    """
+    with instrumentation.stage(stage, rows_in=rows) as record:
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+                yield record
+    results.append(record)
+    print(f"  {stage}: {record['wall_s']:.3f}s（CPU {record['cpu_s']:.3f}s，記憶體高峰 {record['peak_rss_mb']}MB）")
+
+def _free_port():
+    """向系統取得目前未使用的本機埠號"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_for_port(port, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+def _concurrent_requests(port, filename, clients, requests):
+    """多個客戶端同時以保持連線（HTTP/1.1 keep-alive）重複下載同一檔案"""
+    errors = []
+    
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            for _ in range(requests):
+                connection.request('GET', '/' + filename)
+                connection.getresponse().read()
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+        finally:
+            connection.close()
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'clients': clients,
+        'requests': clients * requests,
+        'errors': len(errors),
+        'wall_s': round(elapsed, 4),
+        'requests_per_s': round(clients * requests / elapsed, 1) if elapsed > 0 else None
+    }
+
+def benchmark_map_server(workdir, results, requests=MAP_SERVER_REQUESTS, port=None):
+    """在工作目錄啟動 start_map_server.py，量測啟動時間與各檔案的下載延遲"""
+    port = port or _free_port()
+    record = {'stage': 'map_server', 'port': port, 'files': {}}
+    results.append(record)
+    shutil.copy(os.path.join(REPO_DIR, 'start_map_server.py'), workdir)
+    
+    start = time.perf_counter()
+    # 伺服器程式複製到工作目錄執行，其匯入的模組仍由專案目錄載入
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    process = subprocess.Popen([sys.executable, 'start_map_server.py', '--port', str(port)],
+                               cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_for_port(port, process, MAP_SERVER_STARTUP_TIMEOUT):
+            record['error'] = f"無法在 {port} 埠啟動伺服器（可能已被占用）"
+            print(f"  map_server: {record['error']}")
+            return record
+        record['startup_s'] = round(time.perf_counter() - start, 4)
+        
+        for filename in MAP_SERVER_FILES:
+            if not os.path.exists(os.path.join(workdir, filename)):
+                continue
+            latencies = []
+            size = 0
+            for _ in range(requests):
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                request_start = time.perf_counter()
+                connection.request('GET', '/' + filename)
+                response = connection.getresponse()
+                size = len(response.read())
+                latencies.append(time.perf_counter() - request_start)
+                connection.close()
+            median = float(np.median(latencies))
+            record['files'][filename] = {
+                'bytes': size,
+                'median_s': round(median, 4),
+                'max_s': round(max(latencies), 4),
+                'throughput_mb_s': round(size / 1024 / 1024 / median, 2) if median > 0 else None
+            }
+            print(f"  map_server {filename}: {median * 1000:.1f}ms（{instrumentation.to_mb(size)}MB）")
+        record['concurrent'] = _concurrent_requests(port, MAP_SERVER_FILES[0], MAP_SERVER_CLIENTS, requests)
+        print(f"  map_server 並行 {MAP_SERVER_CLIENTS} 個客戶端: {record['concurrent']['requests_per_s']} 請求/秒")
+        record['server_peak_rss_mb'] = instrumentation.to_mb(instrumentation.process_peak_rss(process.pid))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return record
+
+def run_size(total, workdir, seed=42, verbose=False, map_server=True):
+    """以 total 個模擬停車場跑完整流程，回傳此規模的量測結果"""
+    stages = []
+    instrumentation.reset()
+    instrumentation.configure(verbose=verbose)
+    print(f"\n=== {format_size(total)} 個停車場 ===")
+    
+    with measure(stages, 'generate_csv', total, verbose):
+        dataset = generate_dataset(total, workdir, seed)
+    
+    # 後續腳本都以目前目錄的固定檔名讀寫
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # simple_data_cleaner.main 實際執行的串流流程（分批清洗去重，並寫出精簡格式、彙總與資料庫）；
+        # 在其他階段之前量測，記憶體高峰不受之後載入的完整資料影響
+        with measure(stages, 'stream_parking_data', total, verbose) as record:
+            statistics, _ = simple_data_cleaner.write_parking_outputs(
+                dataset['uspace_file'], dataset['external_file'], force_store=True)
+            record['rows_out'] = statistics['total_count']
+        
+        # 以下為非串流的函數（pipeline 使用），逐步量測
+        with measure(stages, 'load_csv_data', total, verbose):
+            uspace_raw = simple_data_cleaner.load_csv_data(dataset['uspace_file'])
+            external_raw = simple_data_cleaner.load_csv_data(dataset['external_file'])
+        
+        with measure(stages, 'clean_and_standardize', len(uspace_raw) + len(external_raw), verbose):
+            uspace_std = simple_data_cleaner.standardize_uspace_data(
+                simple_data_cleaner.clean_coordinate_data(uspace_raw))
+            external_std = simple_data_cleaner.standardize_external_data(
+                simple_data_cleaner.clean_coordinate_data(external_raw))
+        del uspace_raw, external_raw
+        
+        with measure(stages, 'remove_duplicates', len(uspace_std) + len(external_std), verbose) as record:
+            external_deduped = simple_data_cleaner.remove_duplicates(uspace_std, external_std)
+            record['removed'] = len(external_std) - len(external_deduped)
+        del external_std
+        
+        combined = uspace_std + external_deduped
+        data = {
+            'uspace_parking': uspace_std,
+            'external_parking': external_deduped,
+            'combined': combined,
+            'statistics': {
+                'uspace_count': len(uspace_std),
+                'external_count': len(external_deduped),
+                'total_count': len(combined)
+            }
+        }
+        with measure(stages, 'normalize_and_save', len(combined), verbose):
+            data = fix_city_names.normalize_parking_data(data)
+            simple_data_cleaner.save_parking_data(data, 'parking_data_fixed.json')
+            save_parking_table_binary(ParkingTable.from_parking_data(data), 'parking_data.bin')
+        
+        with measure(stages, 'analyze_uspace_areas', len(data['uspace_parking']), verbose):
+            results = uspace_area_analysis.analyze_uspace_areas(data)
+            uspace_area_analysis.save_to_csv(results)
+        
+        with measure(stages, 'analyze_uspace_areas_filtered', len(data['uspace_parking']), verbose):
+            results = uspace_area_analysis_filtered.analyze_uspace_areas(data)
+            uspace_area_analysis_filtered.save_to_csv(results)
+        del results
+        
+        with measure(stages, 'format_price_analysis', len(data['uspace_parking']), verbose):
+            format_price_analysis.save_formatted_csv(format_price_analysis.create_readable_format())
+        
+        with measure(stages, 'format_filtered_analysis', len(data['uspace_parking']), verbose):
+            format_filtered_analysis.save_formatted_csv(format_filtered_analysis.create_readable_filtered_format())
+        
+        shutil.copy(os.path.join(REPO_DIR, 'parking_map.html'), workdir)
+        with measure(stages, 'create_embedded_map', len(combined), verbose):
+            create_embedded_map.create_embedded_map()
+        del data, combined
+        
+        if map_server:
+            benchmark_map_server(workdir, stages)
+    finally:
+        os.chdir(previous_dir)
+    
+    dataset = {key: value for key, value in dataset.items() if not key.endswith('_file')}
+    return {'size': format_size(total), 'dataset': dataset, 'stages': stages}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def default_output_filename(commit):
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(RESULTS_DIR, f"{stamp}-{(commit or 'unknown')[:8]}.json")
+
+def compare_results(baseline, current):
+    """逐階段比較兩次結果的牆鐘時間與記憶體高峰"""
+    baseline_runs = {run['size']: run for run in baseline['runs']}
+    print(f"\n=== 與 {(baseline.get('commit') or 'unknown')[:8]} 比較 ===")
+    for run in current['runs']:
+        previous = baseline_runs.get(run['size'])
+        if previous is None:
+            continue
+        previous_stages = {stage['stage']: stage for stage in previous['stages']}
+        print(f"{run['size']}:")
+        for stage in run['stages']:
+            old = previous_stages.get(stage['stage'])
+            if not old or 'wall_s' not in stage or 'wall_s' not in old:
+                continue
+            ratio = stage['wall_s'] / old['wall_s'] if old['wall_s'] > 0 else float('inf')
+            print(f"  {stage['stage']}: {old['wall_s']:.3f}s -> {stage['wall_s']:.3f}s（{ratio:.2f}x），"
+                  f"記憶體 {old['peak_rss_mb']}MB -> {stage['peak_rss_mb']}MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='以模擬全台資料量測停車場處理流程各階段的時間與記憶體')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'停車場總數，以逗號分隔，例如 10k,100k,1M（預設 {DEFAULT_SIZES}）')
+    parser.add_argument('--seed', type=int, default=42, help='模擬資料的亂數種子')
+    parser.add_argument('--output', help='結果JSON檔名（預設寫到 benchmarks/results/）')
+    parser.add_argument('--compare', help='與先前的結果JSON比較')
+    parser.add_argument('--workdir', help='工作目錄（預設使用暫存目錄，結束後刪除）')
+    parser.add_argument('--skip-map-server', action='store_true', help='不量測地圖伺服器')
+    parser.add_argument('--verbose', action='store_true', help='顯示各階段原本的輸出')
+    args = parser.parse_args()
+    
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    commit = git_commit()
+    output = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'seed': args.seed,
+        'runs': []
+    }
+    
+    for total in sizes:
+        workdir = args.workdir or tempfile.mkdtemp(prefix='parking-benchmark-')
+        os.makedirs(workdir, exist_ok=True)
+        try:
+            output['runs'].append(run_size(total, workdir, args.seed, args.verbose, not args.skip_map_server))
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+    
+    filename = args.output or default_output_filename(commit)
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已儲存到 {filename}")
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(json.load(f), output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import math
+import os
+
+import numpy as np
+
+# 模擬用的城市群聚：(城市, 中心緯度, 中心經度, 停車場比例, 分布半徑km, 區域)
+# 比例大致依都會區停車場數量分配，雙北最密集
+CITY_CLUSTERS = [
+    ('台北市', 25.0478, 121.5319, 0.24, 5, ['中正區', '大同區', '中山區', '松山區', '大安區', '萬華區',
+                                          '信義區', '士林區', '北投區', '內湖區', '南港區', '文山區']),
+    ('新北市', 25.0120, 121.4657, 0.22, 9, ['板橋區', '三重區', '中和區', '永和區', '新莊區', '新店區',
+                                          '土城區', '蘆洲區', '汐止區', '樹林區']),
+    ('桃園市', 24.9937, 121.3010, 0.09, 9, ['桃園區', '中壢區', '平鎮區', '八德區', '蘆竹區', '龜山區']),
+    ('台中市', 24.1477, 120.6736, 0.12, 8, ['西屯區', '北屯區', '南屯區', '西區', '北區', '南區', '東區', '大里區']),
+    ('台南市', 22.9999, 120.2270, 0.07, 7, ['東區', '中西區', '北區', '安平區', '永康區', '南區']),
+    ('高雄市', 22.6273, 120.3014, 0.11, 8, ['苓雅區', '前鎮區', '三民區', '新興區', '鼓山區', '左營區', '鳳山區']),
+    ('新竹市', 24.8039, 120.9647, 0.03, 4, ['東區', '北區', '香山區']),
+    ('新竹縣', 24.8270, 121.0130, 0.02, 6, ['竹北市', '竹東鎮', '湖口鄉']),
+    ('基隆市', 25.1276, 121.7392, 0.02, 3, ['仁愛區', '中正區', '信義區', '安樂區']),
+    ('彰化縣', 24.0809, 120.5387, 0.03, 8, ['彰化市', '員林市', '鹿港鎮']),
+    ('嘉義市', 23.4801, 120.4491, 0.015, 3, ['東區', '西區']),
+    ('宜蘭縣', 24.7570, 121.7530, 0.015, 6, ['宜蘭市', '羅東鎮', '礁溪鄉']),
+    ('花蓮縣', 23.9769, 121.6044, 0.01, 5, ['花蓮市', '吉安鄉']),
+    ('屏東縣', 22.6690, 120.4862, 0.01, 6, ['屏東市', '潮州鎮']),
+    ('南投縣', 23.9096, 120.6846, 0.01, 6, ['南投市', '草屯鎮', '埔里鎮'])
+]
+
+# 原始資料中部分城市使用「臺」字，由 fix_city_names 統一
+CITY_VARIANTS = {'台北市': '臺北市', '台中市': '臺中市', '台南市': '臺南市'}
+CITY_VARIANT_RATIO = 0.05
+
+# 城市費率係數（相對於台北市）
+CITY_PRICE_FACTORS = {'台北市': 1.0, '新北市': 0.85, '桃園市': 0.7, '台中市': 0.7, '高雄市': 0.7}
+DEFAULT_PRICE_FACTOR = 0.55
+
+# 日間每小時費率的常見級距與比例（依現有外部停車場資料估計）
+DAY_RATE_CHOICES = (20, 25, 30, 35, 40, 50, 60, 80, 100, 120, 150, 200)
+DAY_RATE_WEIGHTS = (0.14, 0.04, 0.22, 0.04, 0.10, 0.08, 0.09, 0.16, 0.08, 0.02, 0.02, 0.01)
+USPACE_NIGHT_RATES = (10, 20, 30)
+
+ROADS = ['中山路', '中正路', '民生路', '民權路', '復興路', '光復路', '和平路', '建國路', '忠孝路', '仁愛路',
+         '信義路', '成功路', '自由路', '文化路', '中華路', '公園路', '博愛路', '大同路', '三民路', '四維路']
+BUILDING_TYPES = ('lock', 'supernode', 'luckypa', 'subway', 'aiguard', 'elevator', 'recognition', 'all')
+BUILDING_TYPE_WEIGHTS = (0.54, 0.15, 0.14, 0.10, 0.03, 0.02, 0.01, 0.01)
+FINANCIAL_CLASSES = ('uspace_owned', 'agent_owned')
+FINANCIAL_CLASS_WEIGHTS = (0.88, 0.12)
+
+USPACE_FRACTION = 0.25
+DUPLICATE_RATIO = 0.02
+INVALID_COORDINATE_RATIO = 0.005
+
+WEEKDAYS = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+USPACE_FIELDNAMES = (['id', 'name', 'lat', 'lon', 'city', 'zone', 'address', 'space_number'] +
+                     [f"{day}day_rate" for day in WEEKDAYS] +
+                     ['夜間費率', 'building_type', 'financial_class'])
+EXTERNAL_FIELDNAMES = ['id', 'name', 'lat', 'lon', 'city', 'district', 'address_info', 'space_number',
+                       'weekday_day', 'weekend_day', 'weekday_night', 'weekend_night', 'monthly_rate']
+
+def parse_size(text):
+    """解析停車場數量，支援 10k、100k、1M 等寫法"""
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('m'):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+def format_size(count):
+    if count >= 1000000 and count % 1000000 == 0:
+        return f"{count // 1000000}M"
+    if count >= 1000 and count % 1000 == 0:
+        return f"{count // 1000}k"
+    return str(count)
+
+def _district_centers(rng):
+    """每個區域在城市中心附近取一個子中心，回傳 [(城市, 區域, 緯度, 經度, 分布半徑km, 比例)]"""
+    centers = []
+    for city, lat, lon, weight, spread_km, districts in CITY_CLUSTERS:
+        for district in districts:
+            distance = spread_km * math.sqrt(rng.random()) * 0.8
+            angle = rng.random() * 2 * math.pi
+            centers.append((
+                city, district,
+                lat + distance * math.cos(angle) / 111.0,
+                lon + distance * math.sin(angle) / (111.0 * math.cos(math.radians(lat))),
+                spread_km / 3,
+                weight / len(districts)
+            ))
+    return centers
+
+def sample_locations(rng, count, centers):
+    """依區域比例抽樣，並在區域子中心附近以常態分布散布座標"""
+    weights = np.array([center[5] for center in centers])
+    cluster = rng.choice(len(centers), size=count, p=weights / weights.sum())
+    center_lats = np.array([center[2] for center in centers])[cluster]
+    center_lons = np.array([center[3] for center in centers])[cluster]
+    sigmas = np.array([center[4] for center in centers])[cluster]
+    lats = center_lats + rng.normal(0, 1, count) * sigmas / 111.0
+    lons = center_lons + rng.normal(0, 1, count) * sigmas / (111.0 * np.cos(np.radians(center_lats)))
+    return cluster, lats, lons
+
+def sample_day_rates(rng, cities):
+    """依常見級距抽樣日間費率，再乘上城市係數並取整到5元"""
+    base = rng.choice(DAY_RATE_CHOICES, size=len(cities), p=np.array(DAY_RATE_WEIGHTS) / sum(DAY_RATE_WEIGHTS))
+    factors = np.array([CITY_PRICE_FACTORS.get(city, DEFAULT_PRICE_FACTOR) for city in cities])
+    return np.maximum(np.round(base * factors / 5) * 5, 10)
+
+def _raw_city(rng, city):
+    variant = CITY_VARIANTS.get(city)
+    return variant if variant and rng.random() < CITY_VARIANT_RATIO else city
+
+def _rate_text(value):
+    return '' if value is None or value <= 0 else f"{value:.1f}"
+
+def _coordinate_text(rng, lat, lon):
+    """少數列故意給缺值或0，讓座標清洗有資料可過濾"""
+    if rng.random() < INVALID_COORDINATE_RATIO:
+        return ('', '') if rng.random() < 0.5 else ('0', '0')
+    return (f"{lat:.7f}", f"{lon:.7f}")
+
+def generate_uspace_csv(filename, count, rng, centers):
+    """產生USpace停車場CSV，回傳 [(名稱, 緯度, 經度, 城市, 區域)] 供產生重複資料"""
+    cluster, lats, lons = sample_locations(rng, count, centers)
+    cities = [centers[c][0] for c in cluster]
+    day_rates = sample_day_rates(rng, cities)
+    has_day_rate = rng.random(count) >= 0.10
+    has_night_rate = rng.random(count) >= 0.69
+    night_rates = rng.choice(USPACE_NIGHT_RATES, size=count, p=(0.6, 0.25, 0.15))
+    weekend_extra = np.where(rng.random(count) < 0.3, 10, 0)
+    space_numbers = np.clip(np.round(rng.lognormal(np.log(4), 1.5, count)), 1, 800).astype(int)
+    has_space_number = rng.random(count) >= 0.11
+    building_types = rng.choice(BUILDING_TYPES, size=count, p=BUILDING_TYPE_WEIGHTS)
+    financial_classes = rng.choice(FINANCIAL_CLASSES, size=count, p=FINANCIAL_CLASS_WEIGHTS)
+    roads = rng.choice(ROADS, size=count)
+    numbers = rng.integers(1, 400, size=count)
+    
+    lots = []
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(USPACE_FIELDNAMES)
+        for i in range(count):
+            city, district = centers[cluster[i]][0], centers[cluster[i]][1]
+            name = f"USPACE{district}{roads[i]}{i}號"
+            day_rate = float(day_rates[i]) if has_day_rate[i] else None
+            weekend_rate = day_rate + weekend_extra[i] if day_rate else None
+            writer.writerow([
+                f"us-{i:08d}", name, *_coordinate_text(rng, lats[i], lons[i]),
+                _raw_city(rng, city), district, f"{name}{city}{district}{roads[i]}{numbers[i]}號",
+                space_numbers[i] if has_space_number[i] else '',
+                *[_rate_text(day_rate)] * 5, *[_rate_text(weekend_rate)] * 2,
+                _rate_text(float(night_rates[i])) if has_night_rate[i] else '',
+                building_types[i], financial_classes[i]
+            ])
+            lots.append((name, lats[i], lons[i], city, district))
+    return lots
+
+def generate_external_csv(filename, count, rng, centers, uspace_lots=()):
+    """產生外部停車場CSV；約 DUPLICATE_RATIO 的資料是USpace停車場附近的重複登錄"""
+    duplicate_count = min(int(count * DUPLICATE_RATIO), len(uspace_lots))
+    regular_count = count - duplicate_count
+    cluster, lats, lons = sample_locations(rng, regular_count, centers)
+    cities = [centers[c][0] for c in cluster]
+    day_rates = sample_day_rates(rng, cities)
+    has_rates = rng.random(regular_count) >= 0.11
+    weekend_extra = np.where(rng.random(regular_count) < 0.2, 10, 0)
+    night_factors = rng.choice((0.5, 1.0), size=regular_count, p=(0.3, 0.7))
+    price_factors = np.array([CITY_PRICE_FACTORS.get(city, DEFAULT_PRICE_FACTOR) for city in cities])
+    monthly_rates = np.round(rng.lognormal(np.log(4600), 0.55, regular_count) * price_factors / 100) * 100
+    has_monthly_rate = rng.random(regular_count) >= 0.13
+    space_numbers = np.clip(np.round(rng.lognormal(np.log(66), 1.1, regular_count)), 1, 2000).astype(int)
+    space_numbers[rng.random(regular_count) < 0.03] = 0
+    roads = rng.choice(ROADS, size=regular_count)
+    numbers = rng.integers(1, 800, size=regular_count)
+    
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXTERNAL_FIELDNAMES)
+        for i in range(regular_count):
+            city, district = centers[cluster[i]][0], centers[cluster[i]][1]
+            day_rate = float(day_rates[i]) if has_rates[i] else None
+            night_rate = max(round(day_rate * night_factors[i] / 5) * 5, 10) if day_rate else None
+            writer.writerow([
+                f"{i:032x}", f"{roads[i]}{numbers[i]}號{district}停車場{i}",
+                *_coordinate_text(rng, lats[i], lons[i]),
+                _raw_city(rng, city), district, f"{roads[i]}{numbers[i]}號",
+                space_numbers[i],
+                _rate_text(day_rate), _rate_text(day_rate + weekend_extra[i] if day_rate else None),
+                _rate_text(night_rate), _rate_text(night_rate),
+                _rate_text(float(monthly_rates[i])) if has_monthly_rate[i] else ''
+            ])
+        
+        # 與USpace停車場位置相近、名稱相似的重複資料
+        for k, j in enumerate(rng.choice(len(uspace_lots), size=duplicate_count, replace=False).tolist()):
+            name, lat, lon, city, district = uspace_lots[j]
+            day_rate = float(sample_day_rates(rng, [city])[0])
+            writer.writerow([
+                f"dup{k:029x}", name.replace('USPACE', '') + '停車場',
+                f"{lat + rng.normal(0, 0.0001):.7f}", f"{lon + rng.normal(0, 0.0001):.7f}",
+                city, district, '', int(rng.integers(5, 200)),
+                _rate_text(day_rate), _rate_text(day_rate), '', '', ''
+            ])
+
+def generate_dataset(total, directory, seed=42, uspace_fraction=USPACE_FRACTION):
+    """產生共 total 個停車場的USpace與外部停車場CSV，回傳資料集資訊"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    centers = _district_centers(rng)
+    uspace_count = max(1, int(total * uspace_fraction))
+    external_count = total - uspace_count
+    
+    uspace_file = os.path.join(directory, 'uspace.csv')
+    external_file = os.path.join(directory, 'external.csv')
+    uspace_lots = generate_uspace_csv(uspace_file, uspace_count, rng, centers)
+    generate_external_csv(external_file, external_count, rng, centers, uspace_lots)
+    
+    return {
+        'total': total,
+        'seed': seed,
+        'uspace_file': uspace_file,
+        'external_file': external_file,
+        'uspace_rows': uspace_count,
+        'external_rows': external_count,
+        'uspace_bytes': os.path.getsize(uspace_file),
+        'external_bytes': os.path.getsize(external_file)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='產生模擬全台分布的USpace與外部停車場CSV')
+    parser.add_argument('size', type=parse_size, help='停車場總數，例如 10k、100k、1M')
+    parser.add_argument('--output-dir', default='.', help='輸出目錄（預設為目前目錄）')
+    parser.add_argument('--seed', type=int, default=42, help='亂數種子')
+    parser.add_argument('--uspace-fraction', type=float, default=USPACE_FRACTION, help='USpace停車場所占比例')
+    args = parser.parse_args()
+    
+    dataset = generate_dataset(args.size, args.output_dir, args.seed, args.uspace_fraction)
+    print(f"USpace停車場: {dataset['uspace_rows']} 筆 -> {dataset['uspace_file']}")
+    print(f"外部停車場: {dataset['external_rows']} 筆 -> {dataset['external_file']}")
+
+if __name__ == "__main__":
+    main()
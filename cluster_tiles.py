@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+import argparse
+import math
+import re
+import threading
+import time
+
+import numpy as np
+
+from parking_api import DATA_FILE, ParkingQueryIndex, select_arguments
+from parking_table import RATE_COLUMNS
+
+# 地圖圖磚為 256 像素，每個圖磚分成 4x4 個 64 像素的格子，每格最多一個聚合點
+TILE_SIZE = 256
+CELL_SIZE = 64
+CELLS_PER_TILE = TILE_SIZE // CELL_SIZE
+CELL_SHIFT = int(math.log2(CELLS_PER_TILE))
+# 預先聚合的最大縮放層級；更近的層級直接回傳圖磚內的個別停車場
+CLUSTER_MAX_ZOOM = 16
+MAX_TILE_ZOOM = 22
+TILE_PATH_PATTERN = re.compile(r'^/tiles/(\d+)/(\d+)/(\d+)\.json$')
+
+# 單一停車場（未聚合）回傳的欄位，與地圖頁面的彈出視窗一致
+TILE_POINT_FIELDS = ['name', 'lat', 'lon', 'city', 'district', 'address', 'space_number',
+                     'day_rate', 'night_rate', 'monthly_rate', 'source', 'building_type']
+
+def mercator_xy(lat, lon):
+    """經緯度轉成 Web Mercator 的正規化座標（0~1，與 Leaflet / OSM 圖磚相同）"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    y = (1 - np.log(np.tan(np.radians(lat)) + 1 / np.cos(np.radians(lat))) / math.pi) / 2
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+def tile_bbox(z, x, y):
+    """圖磚的經緯度範圍 (west, south, east, north)"""
+    n = 2 ** z
+    
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+def parse_tile_path(path):
+    """'/tiles/{z}/{x}/{y}.json' -> (z, x, y)，不是圖磚路徑時回傳None"""
+    match = TILE_PATH_PATTERN.match(path)
+    if not match:
+        return None
+    z, x, y = (int(value) for value in match.groups())
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        raise ValueError(f"圖磚座標超出範圍: {z}/{x}/{y}")
+    return z, x, y
+
+def aggregate_cells(index, ids, zoom):
+    """依 zoom 層級的格子聚合指定的停車場，回傳各格的度量（以欄位名稱為鍵的陣列）
+    
+    每格記錄數量、各來源數量、車位數、座標總和（算重心）與各費率的正值總和及筆數，
+    皆可直接相加，較粗層級的格子由較細層級合併而得。
+    """
+    x, y = mercator_xy(index.lat[ids], index.lon[ids])
+    scale = 2 ** (zoom + CELL_SHIFT)
+    keys, groups = np.unique((x * scale).astype(np.int64) * scale + (y * scale).astype(np.int64),
+                             return_inverse=True)
+    groups = groups.ravel()
+    group_count = len(keys)
+    
+    source = index.table['source']
+    codes = source.codes[ids]
+    spaces = index.table['space_number'][ids]
+    cells = {
+        'cell_x': keys // scale,
+        'cell_y': keys % scale,
+        'count': np.bincount(groups, minlength=group_count),
+        'uspace': np.bincount(groups, weights=codes == source.code_of('uspace'), minlength=group_count),
+        'external': np.bincount(groups, weights=codes == source.code_of('external'), minlength=group_count),
+        'spaces': np.bincount(groups, weights=np.where(spaces > 0, spaces, 0), minlength=group_count),
+        'lat_sum': np.bincount(groups, weights=index.lat[ids], minlength=group_count),
+        'lon_sum': np.bincount(groups, weights=index.lon[ids], minlength=group_count),
+        # 每格的第一筆停車場，格內只有一筆時直接回傳該停車場
+        'first': np.full(group_count, len(index), dtype=np.int64)
+    }
+    np.minimum.at(cells['first'], groups, ids)
+    for field in RATE_COLUMNS:
+        rates = index.table[field][ids]
+        positive = rates > 0
+        cells[f'{field}_sum'] = np.bincount(groups, weights=np.where(positive, rates, 0), minlength=group_count)
+        cells[f'{field}_count'] = np.bincount(groups, weights=positive, minlength=group_count)
+    return cells
+
+def merge_up(cells, zoom):
+    """將 zoom 層級的格子合併成 zoom - 1 層級（每 2x2 格合為一格）"""
+    parent_x = cells['cell_x'] >> 1
+    parent_y = cells['cell_y'] >> 1
+    scale = 2 ** (zoom - 1 + CELL_SHIFT)
+    keys, parents = np.unique(parent_x * scale + parent_y, return_inverse=True)
+    parents = parents.ravel()
+    merged = {'cell_x': keys // scale, 'cell_y': keys % scale}
+    for name, values in cells.items():
+        if name in ('cell_x', 'cell_y'):
+            continue
+        if name == 'first':
+            merged[name] = np.full(len(keys), np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(merged[name], parents, values)
+        else:
+            merged[name] = np.bincount(parents, weights=values, minlength=len(keys))
+    return merged
+
+def tile_features(index, cells, rows=None):
+    """格子轉成圖磚內容：多筆的格子為聚合點，只有一筆的格子回傳該停車場"""
+    if rows is None:
+        rows = np.arange(len(cells['count']))
+    counts = cells['count'][rows]
+    single = counts == 1
+    clusters = []
+    for row in rows[~single].tolist():
+        count = int(cells['count'][row])
+        cluster = {
+            'lat': round(float(cells['lat_sum'][row] / count), 6),
+            'lon': round(float(cells['lon_sum'][row] / count), 6),
+            'count': count,
+            'uspace': int(cells['uspace'][row]),
+            'external': int(cells['external'][row]),
+            'spaces': int(cells['spaces'][row])
+        }
+        for field in RATE_COLUMNS:
+            # 平均只計有費率的停車場，與 rollup_cube 相同；沒有資料時為0
+            rated = cells[f'{field}_count'][row]
+            cluster[field] = round(float(cells[f'{field}_sum'][row] / rated), 2) if rated else 0
+        clusters.append(cluster)
+    points = index.records(np.sort(cells['first'][rows[single]]), TILE_POINT_FIELDS)
+    return {'clusters': clusters, 'points': points}
+
+class ClusterTiles:
+    """各縮放層級預先聚合的停車場格子，依圖磚查詢
+    
+    先在 CLUSTER_MAX_ZOOM 層級依格子聚合所有停車場，再逐層將 2x2 格合併為上一層的一格，
+    因此每一層的聚合點都由下一層合併而得（階層式），不需重新掃描停車場。
+    各層的格子依所屬圖磚排序，查詢單一圖磚只需二分搜尋。
+    """
+    
+    def __init__(self, index, max_zoom=CLUSTER_MAX_ZOOM):
+        self.index = index
+        self.max_zoom = max_zoom
+        self.levels = {}
+        ids = np.arange(len(index), dtype=np.int64)
+        cells = aggregate_cells(index, ids, max_zoom)
+        for zoom in range(max_zoom, -1, -1):
+            tile_keys = (cells['cell_x'] >> CELL_SHIFT) * (2 ** zoom) + (cells['cell_y'] >> CELL_SHIFT)
+            order = np.argsort(tile_keys, kind='stable')
+            self.levels[zoom] = (tile_keys[order], {name: values[order] for name, values in cells.items()})
+            if zoom > 0:
+                cells = merge_up(cells, zoom)
+    
+    def cell_count(self, zoom):
+        return len(self.levels[zoom][0])
+    
+    def tile(self, z, x, y, params=None):
+        """圖磚 z/x/y 的聚合點與個別停車場
+        
+        沒有篩選條件時使用預先聚合的結果；有篩選條件（city、district、source、費率）時，
+        只對圖磚範圍內符合條件的停車場即時聚合。超過 max_zoom 的層級不再聚合。
+        """
+        arguments = select_arguments(dict(params or {}, bbox=''))
+        filtered = any(value is not None for name, value in arguments.items() if name not in ('bbox', 'rate_field'))
+        if z <= self.max_zoom and not filtered:
+            tile_keys, cells = self.levels[z]
+            key = x * (2 ** z) + y
+            rows = np.arange(np.searchsorted(tile_keys, key, side='left'),
+                             np.searchsorted(tile_keys, key, side='right'))
+            return dict(z=z, x=x, y=y, **tile_features(self.index, cells, rows))
+        
+        arguments['bbox'] = tile_bbox(z, x, y)
+        ids = self.index.select(**arguments)
+        # 落在圖磚邊界上的停車場只屬於一個圖磚
+        px, py = mercator_xy(self.index.lat[ids], self.index.lon[ids])
+        ids = ids[((px * 2 ** z).astype(np.int64) == x) & ((py * 2 ** z).astype(np.int64) == y)]
+        if z > self.max_zoom:
+            return dict(z=z, x=x, y=y, clusters=[], points=self.index.records(ids, TILE_POINT_FIELDS))
+        return dict(z=z, x=x, y=y, **tile_features(self.index, aggregate_cells(self.index, ids, z)))
+
+class ClusterTileCache:
+    """伺服器共用的聚合圖磚；ParkingApi 的索引重新建立時一併重新聚合"""
+    
+    def __init__(self, parking_api):
+        self.parking_api = parking_api
+        self.tiles = None
+        self.lock = threading.Lock()
+    
+    def get_tiles(self):
+        index = self.parking_api.get_index()
+        with self.lock:
+            if self.tiles is None or self.tiles.index is not index:
+                self.tiles = ClusterTiles(index)
+            return self.tiles
+    
+    def tile(self, z, x, y, params=None):
+        return self.get_tiles().tile(z, x, y, params)
+
+def main():
+    parser = argparse.ArgumentParser(description='建立各縮放層級的停車場聚合並測試圖磚查詢時間')
+    parser.add_argument('input', nargs='?', default=DATA_FILE, help='停車場資料檔')
+    parser.add_argument('--max-zoom', type=int, default=CLUSTER_MAX_ZOOM, help='預先聚合的最大縮放層級')
+    args = parser.parse_args()
+    
+    index = ParkingQueryIndex.from_file(args.input)
+    start = time.perf_counter()
+    tiles = ClusterTiles(index, args.max_zoom)
+    print(f"預先聚合 {len(index)} 筆停車場: {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    for zoom in range(args.max_zoom + 1):
+        tile_keys, _ = tiles.levels[zoom]
+        per_tile = np.unique(tile_keys, return_counts=True)[1]
+        print(f"  層級 {zoom:2d}: {tiles.cell_count(zoom):7d} 格，{len(per_tile):6d} 個圖磚，每圖磚最多 {per_tile.max() if len(per_tile) else 0} 格")
+
+if __name__ == "__main__":
+    main()
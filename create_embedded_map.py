@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 import json
 
-def create_embedded_map():
-    # 讀取修正後的停車場資料
-    with open('parking_data_fixed.json', 'r', encoding='utf-8') as f:
-        parking_data = json.load(f)
-    
+from parking_table import read_parking_data
+
+def render_embedded_map(parking_data):
+    """將停車場資料嵌入地圖HTML模板，回傳HTML內容"""
     # 讀取HTML模板
     with open('parking_map.html', 'r', encoding='utf-8') as f:
         html_content = f.read()
@@ -79,6 +78,14 @@ def create_embedded_map():
                        new_load_function + 
                        html_content[end_pos:])
     
+    return html_content
+
+def create_embedded_map():
+    # 讀取修正後的停車場資料
+    parking_data = read_parking_data('parking_data_fixed.json')
+    
+    html_content = render_embedded_map(parking_data)
+    
     # 儲存新的HTML檔案
     with open('parking_map_embedded.html', 'w', encoding='utf-8') as f:
         f.write(html_content)
@@ -1,10 +1,16 @@
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
 import json
 
-def load_and_clean_data():
-    """載入並清洗USpace和外部停車場資料"""
+from dedup_engine import find_duplicate_pairs
+
+DAY_RATE_COLUMNS = [f"{day}day_rate" for day in ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']]
+
+def load_and_clean_data(distance_model='geodesic'):
+    """載入並清洗USpace和外部停車場資料
+    
+    distance_model 可選 'geodesic'（精確橢球距離）或 'haversine'（快速球面距離）。
+    """
     
     # 載入USpace停車場資料
     print("載入USpace停車場資料...")
@@ -24,7 +30,7 @@ def load_and_clean_data():
     external_cleaned = clean_external_data(external_df)
     
     # 移除重複的USpace停車場（可能出現在外部資料中）
-    external_deduped = remove_duplicates(uspace_cleaned, external_cleaned)
+    external_deduped = remove_duplicates(uspace_cleaned, external_cleaned, distance_model=distance_model)
     
     # 統一資料格式
     uspace_standardized = standardize_uspace_data(uspace_cleaned)
@@ -66,115 +72,87 @@ def clean_external_data(df):
     print(f"外部停車場清洗後數量: {len(df_clean)}")
     return df_clean
 
-def remove_duplicates(uspace_df, external_df, distance_threshold=50):
+def remove_duplicates(uspace_df, external_df, distance_threshold=50, distance_model='geodesic'):
     """移除外部資料中與USpace停車場重複的停車場"""
-    duplicates = []
-    
     print("檢查重複停車場...")
-    for idx, external_row in external_df.iterrows():
-        external_lat, external_lon = external_row['lat'], external_row['lon']
-        external_name = str(external_row['name']).lower()
-        
-        for _, uspace_row in uspace_df.iterrows():
-            uspace_lat, uspace_lon = uspace_row['lat'], uspace_row['lon']
-            uspace_name = str(uspace_row['name']).lower()
-            
-            # 計算距離
-            distance = geodesic(
-                (external_lat, external_lon), 
-                (uspace_lat, uspace_lon)
-            ).meters
-            
-            # 如果距離很近，檢查名稱相似性
-            if distance < distance_threshold:
-                # 簡單的名稱相似性檢查
-                if (external_name in uspace_name or 
-                    uspace_name in external_name or
-                    any(word in external_name for word in uspace_name.split() if len(word) > 2)):
-                    duplicates.append(idx)
-                    print(f"發現重複: {external_row['name']} <-> {uspace_row['name']} (距離: {distance:.1f}m)")
-                    break
+    
+    # 以欄位陣列進行空間分格比對，只對候選配對計算距離與名稱相似度
+    duplicate_pairs = find_duplicate_pairs(
+        external_df['lat'].to_numpy(dtype=np.float64),
+        external_df['lon'].to_numpy(dtype=np.float64),
+        external_df['name'].astype(str).to_numpy(),
+        uspace_df['lat'].to_numpy(dtype=np.float64),
+        uspace_df['lon'].to_numpy(dtype=np.float64),
+        uspace_df['name'].astype(str).to_numpy(),
+        distance_threshold=distance_threshold,
+        distance_model=distance_model
+    )
+    
+    for i, j, distance in duplicate_pairs:
+        print(f"發現重複: {external_df['name'].iloc[i]} <-> {uspace_df['name'].iloc[j]} (距離: {distance:.1f}m)")
     
     # 移除重複項目
+    duplicates = external_df.index[[i for i, _, _ in duplicate_pairs]]
     external_deduped = external_df.drop(duplicates)
     print(f"移除 {len(duplicates)} 個重複停車場")
     print(f"外部停車場去重後數量: {len(external_deduped)}")
     
     return external_deduped
 
+def numeric_column(df, column):
+    """取得數值欄位，缺少的欄位或無法轉換的值視為0"""
+    if column not in df:
+        return pd.Series(0, index=df.index, dtype=np.float64)
+    return pd.to_numeric(df[column], errors='coerce').fillna(0)
+
+def text_column(df, column):
+    """取得文字欄位，缺少的欄位視為空字串"""
+    if column not in df:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[column]
+
+def positive_mean(df, columns):
+    """逐列計算大於0的費率平均值，沒有有效費率時為0"""
+    rates = pd.DataFrame({column: numeric_column(df, column) for column in columns}, index=df.index)
+    return rates.where(rates > 0).mean(axis=1).fillna(0)
+
 def standardize_uspace_data(df):
     """統一USpace資料格式"""
-    standardized = []
-    
-    for _, row in df.iterrows():
-        # 計算平均日間費率
-        day_rates = [
-            row.get('星期一day_rate', 0) or 0,
-            row.get('星期二day_rate', 0) or 0,
-            row.get('星期三day_rate', 0) or 0,
-            row.get('星期四day_rate', 0) or 0,
-            row.get('星期五day_rate', 0) or 0,
-            row.get('星期六day_rate', 0) or 0,
-            row.get('星期日day_rate', 0) or 0
-        ]
-        avg_day_rate = np.mean([rate for rate in day_rates if rate > 0]) if any(rate > 0 for rate in day_rates) else 0
-        
-        standardized.append({
-            'id': row['id'],
-            'name': row['name'],
-            'lat': row['lat'],
-            'lon': row['lon'],
-            'city': row['city'],
-            'district': row.get('zone', ''),
-            'address': row.get('address', ''),
-            'space_number': row.get('space_number', 0),
-            'day_rate': avg_day_rate,
-            'night_rate': row.get('夜間費率', 0) or 0,
-            'monthly_rate': 0,  # USpace資料中沒有月租費
-            'source': 'uspace',
-            'building_type': row.get('building_type', ''),
-            'financial_class': row.get('financial_class', '')
-        })
-    
-    return pd.DataFrame(standardized)
+    return pd.DataFrame({
+        'id': df['id'],
+        'name': df['name'],
+        'lat': df['lat'],
+        'lon': df['lon'],
+        'city': df['city'],
+        'district': text_column(df, 'zone'),
+        'address': text_column(df, 'address'),
+        'space_number': numeric_column(df, 'space_number').astype(np.int64),
+        'day_rate': positive_mean(df, DAY_RATE_COLUMNS),
+        'night_rate': numeric_column(df, '夜間費率'),
+        'monthly_rate': 0,  # USpace資料中沒有月租費
+        'source': 'uspace',
+        'building_type': text_column(df, 'building_type'),
+        'financial_class': text_column(df, 'financial_class')
+    }).reset_index(drop=True)
 
 def standardize_external_data(df):
     """統一外部停車場資料格式"""
-    standardized = []
-    
-    for _, row in df.iterrows():
-        # 計算平均日間費率
-        day_rates = [
-            row.get('weekday_day', 0) or 0,
-            row.get('weekend_day', 0) or 0
-        ]
-        avg_day_rate = np.mean([rate for rate in day_rates if rate > 0]) if any(rate > 0 for rate in day_rates) else 0
-        
-        # 計算平均夜間費率
-        night_rates = [
-            row.get('weekday_night', 0) or 0,
-            row.get('weekend_night', 0) or 0
-        ]
-        avg_night_rate = np.mean([rate for rate in night_rates if rate > 0]) if any(rate > 0 for rate in night_rates) else 0
-        
-        standardized.append({
-            'id': row['id'],
-            'name': row['name'],
-            'lat': row['lat'],
-            'lon': row['lon'],
-            'city': row['city'],
-            'district': row.get('district', ''),
-            'address': row.get('address_info', ''),
-            'space_number': row.get('space_number', 0),
-            'day_rate': avg_day_rate,
-            'night_rate': avg_night_rate,
-            'monthly_rate': row.get('monthly_rate', 0) or 0,
-            'source': 'external',
-            'building_type': '',
-            'financial_class': ''
-        })
-    
-    return pd.DataFrame(standardized)
+    return pd.DataFrame({
+        'id': df['id'],
+        'name': df['name'],
+        'lat': df['lat'],
+        'lon': df['lon'],
+        'city': df['city'],
+        'district': text_column(df, 'district'),
+        'address': text_column(df, 'address_info'),
+        'space_number': numeric_column(df, 'space_number').astype(np.int64),
+        'day_rate': positive_mean(df, ['weekday_day', 'weekend_day']),
+        'night_rate': positive_mean(df, ['weekday_night', 'weekend_night']),
+        'monthly_rate': numeric_column(df, 'monthly_rate'),
+        'source': 'external',
+        'building_type': '',
+        'financial_class': ''
+    }).reset_index(drop=True)
 
 def save_cleaned_data(uspace_df, external_df):
     """儲存清洗後的資料"""
@@ -203,8 +181,15 @@ def save_cleaned_data(uspace_df, external_df):
     return combined_df
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='清洗USpace與外部停車場資料')
+    parser.add_argument('--distance-model', choices=['geodesic', 'haversine'], default='geodesic',
+                        help='去重距離模型：geodesic（精確）或 haversine（快速）')
+    args = parser.parse_args()
+    
     # 執行資料清洗
-    uspace_data, external_data = load_and_clean_data()
+    uspace_data, external_data = load_and_clean_data(args.distance_model)
     combined_data = save_cleaned_data(uspace_data, external_data)
     
     print("\n資料統計:")
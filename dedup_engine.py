@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import instrumentation
+from geo_utils import coordinate_arrays, haversine_pairs
+from spatial_index import candidate_pairs_within
+
+def name_bigrams(name):
+    """取得名稱的字元雙字組（bigram）集合，略過含空白的組合
+    
+    中文名稱沒有空格分詞，以相鄰兩字作為比對單位。
+    """
+    name = name.lower()
+    return {
+        name[k:k + 2] for k in range(len(name) - 1)
+        if not name[k].isspace() and not name[k + 1].isspace()
+    }
+
+def build_bigram_index(names):
+    """建立 bigram -> 名稱索引集合 的倒排索引
+    
+    names 為 {索引: 名稱} 對應，回傳 (倒排索引, {索引: bigram集合})。
+    """
+    index = {}
+    bigrams_by_id = {}
+    for i, name in names.items():
+        bigrams_by_id[i] = name_bigrams(name)
+        for bigram in bigrams_by_id[i]:
+            index.setdefault(bigram, set()).add(i)
+    return index, bigrams_by_id
+
+def bigram_similarity(bigrams_a, bigrams_b):
+    """以 Dice 係數計算兩個 bigram 集合的相似度"""
+    if not bigrams_a or not bigrams_b:
+        return 0.0
+    return 2 * len(bigrams_a & bigrams_b) / (len(bigrams_a) + len(bigrams_b))
+
+def is_similar_name(name_a, name_b, bigrams_a, bigrams_b, name_similarity=None):
+    """名稱相似性檢查：包含關係、英文詞比對；指定 name_similarity 時，bigram 相似度達門檻也視為相似"""
+    if (name_a in name_b or
+        name_b in name_a or
+        any(word in name_a for word in name_b.split() if len(word) > 2)):
+        return True
+    return name_similarity is not None and bigram_similarity(bigrams_a, bigrams_b) >= name_similarity
+
+def pair_distances(lats1, lons1, lats2, lons2, distance_model='haversine'):
+    """計算點對距離（米），可選擇快速的 haversine 或精確的 geodesic 模型"""
+    if distance_model == 'haversine':
+        return haversine_pairs(lats1, lons1, lats2, lons2, unit='m')
+    if distance_model == 'geodesic':
+        from geopy.distance import geodesic
+        return np.array([
+            geodesic((lat1, lon1), (lat2, lon2)).meters
+            for lat1, lon1, lat2, lon2 in zip(lats1.tolist(), lons1.tolist(), lats2.tolist(), lons2.tolist())
+        ], dtype=np.float64)
+    raise ValueError(f"不支援的距離模型: {distance_model}（可用: haversine, geodesic）")
+
+def find_duplicate_pairs(external_lats, external_lons, external_names,
+                         uspace_lats, uspace_lons, uspace_names,
+                         distance_threshold=50, name_similarity=None, distance_model='haversine'):
+    """以欄位陣列找出與USpace停車場重複的外部停車場
+    
+    先以空間網格及名稱 bigram 倒排索引篩選候選配對，只對候選配對計算相似度。
+    name_similarity 預設為None，只使用原本的包含關係與英文詞比對；
+    指定門檻（例如0.5）時，bigram Dice 相似度達門檻的名稱也視為重複。
+    回傳 [(外部索引, USpace索引, 距離(米)), ...]，每個外部停車場只保留
+    依USpace原始順序第一個符合的配對。
+    """
+    if len(external_lats) == 0 or len(uspace_lats) == 0:
+        return []
+    
+    external_lats = np.asarray(external_lats, dtype=np.float64)
+    external_lons = np.asarray(external_lons, dtype=np.float64)
+    uspace_lats = np.asarray(uspace_lats, dtype=np.float64)
+    uspace_lons = np.asarray(uspace_lons, dtype=np.float64)
+    
+    # 第一層：空間網格，並以精確距離過濾
+    # geodesic 與球面距離差異小於0.5%，外接框放寬1%確保不漏掉候選
+    search_radius_km = distance_threshold / 1000  # 米轉公里
+    if distance_model != 'haversine':
+        search_radius_km *= 1.01
+    external_idx, uspace_idx = candidate_pairs_within(
+        external_lats, external_lons, uspace_lats, uspace_lons, search_radius_km
+    )
+    distances = pair_distances(
+        external_lats[external_idx], external_lons[external_idx],
+        uspace_lats[uspace_idx], uspace_lons[uspace_idx],
+        distance_model
+    )
+    near = distances < distance_threshold
+    instrumentation.count('dedup_distance_evaluations', len(distances))
+    instrumentation.count('dedup_near_pairs', int(np.count_nonzero(near)))
+    external_idx = external_idx[near]
+    uspace_idx = uspace_idx[near]
+    distances = distances[near]
+    if len(external_idx) == 0:
+        return []
+    
+    # 第二層：名稱 bigram 倒排索引，只需建立與空間候選相關的USpace名稱
+    candidate_names = {
+        j: str(uspace_names[j]).lower() for j in np.unique(uspace_idx).tolist()
+    }
+    bigram_index, uspace_bigrams = build_bigram_index(candidate_names)
+    
+    duplicates = []
+    name_comparisons = 0
+    group_starts = np.flatnonzero(np.r_[True, external_idx[1:] != external_idx[:-1]])
+    group_ends = np.r_[group_starts[1:], len(external_idx)]
+    
+    for start, end in zip(group_starts.tolist(), group_ends.tolist()):
+        i = int(external_idx[start])
+        external_name = str(external_names[i]).lower()
+        external_bigrams = name_bigrams(external_name)
+        spatial_candidates = uspace_idx[start:end].tolist()
+        
+        if external_bigrams:
+            name_candidates = set()
+            for bigram in external_bigrams:
+                name_candidates |= bigram_index.get(bigram, set()).intersection(spatial_candidates)
+        else:
+            name_candidates = None
+        
+        for k, j in enumerate(spatial_candidates):
+            # 雙方都有 bigram 卻沒有任何共同 bigram 時不可能相似，直接略過
+            if name_candidates is not None and uspace_bigrams[j] and j not in name_candidates:
+                continue
+            name_comparisons += 1
+            if is_similar_name(external_name, candidate_names[j],
+                               external_bigrams, uspace_bigrams[j], name_similarity):
+                duplicates.append((i, j, float(distances[start + k])))
+                break
+    
+    instrumentation.count('dedup_name_comparisons', name_comparisons)
+    instrumentation.count('duplicates_found', len(duplicates))
+    return duplicates
+
+def find_duplicates(uspace_data, external_data, distance_threshold=50, name_similarity=None,
+                    distance_model='haversine'):
+    """找出與USpace停車場重複的外部停車場（停車場記錄清單版本）"""
+    external_lats, external_lons = coordinate_arrays(external_data)
+    uspace_lats, uspace_lons = coordinate_arrays(uspace_data)
+    return find_duplicate_pairs(
+        external_lats, external_lons, [external['name'] for external in external_data],
+        uspace_lats, uspace_lons, [uspace['name'] for uspace in uspace_data],
+        distance_threshold, name_similarity, distance_model
+    )
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from geo_utils import EARTH_RADIUS
+from parking_table import read_parking_data
+from ring_analysis import circle_area_km2
+
+# 台灣範圍（與資料清洗的座標檢查一致）
+TAIWAN_BOUNDS = (21.5, 25.5, 119.5, 122.5)
+KM_PER_DEGREE = 2 * math.pi * EARTH_RADIUS['km'] / 360
+CELL_SIZE_KM = 0.25
+DEFAULT_RADIUS_KM = 3.0
+KERNELS = ('disk', 'gaussian')
+# 高斯核在此倍數的標準差之外截斷
+GAUSSIAN_TRUNCATE = 3.0
+SURFACE_VERSION = 1
+
+HEATMAP_FILE = 'density_heatmap.json'
+# 熱度圖以此百分位數的密度為最高色階，避免少數極端格子壓低其他區域的顏色
+HEATMAP_PERCENTILE = 99.5
+
+def _kernel(kernel, radius_km, cell_size_km):
+    """建立以格子為單位的卷積核，卷積後的單位為「每平方公里」
+    
+    disk 核：半徑內的停車場數除以圓面積（與周邊分析的競爭密度定義相同）；
+    gaussian 核：以 radius_km 為標準差的常態分布密度。
+    """
+    if kernel == 'disk':
+        reach = radius_km
+    elif kernel == 'gaussian':
+        reach = radius_km * GAUSSIAN_TRUNCATE
+    else:
+        raise ValueError(f"不支援的卷積核: {kernel}（可用: {', '.join(KERNELS)}）")
+    
+    half = int(math.ceil(reach / cell_size_km))
+    offsets = np.arange(-half, half + 1) * cell_size_km
+    distance_sq = offsets[:, None] ** 2 + offsets[None, :] ** 2
+    if kernel == 'disk':
+        return np.where(distance_sq <= radius_km * radius_km, 1.0 / circle_area_km2(radius_km), 0.0)
+    weights = np.exp(-distance_sq / (2 * radius_km * radius_km)) / (2 * math.pi * radius_km * radius_km)
+    return np.where(distance_sq <= reach * reach, weights, 0.0)
+
+def fft_convolve(grid, kernel):
+    """以 FFT 計算二維卷積，輸出與 grid 同大小（核心置中）"""
+    rows = grid.shape[0] + kernel.shape[0] - 1
+    cols = grid.shape[1] + kernel.shape[1] - 1
+    spectrum = np.fft.rfft2(grid, (rows, cols)) * np.fft.rfft2(kernel, (rows, cols))
+    full = np.fft.irfft2(spectrum, (rows, cols))
+    top = kernel.shape[0] // 2
+    left = kernel.shape[1] // 2
+    result = full[top:top + grid.shape[0], left:left + grid.shape[1]]
+    # 浮點誤差可能產生極小的負值
+    result[result < 1e-9] = 0.0
+    return result
+
+class DensitySurface:
+    """全台網格上的外部停車場密度（每平方公里），可在 O(1) 時間查詢任意座標
+    
+    網格以台灣中心緯度換算經度間距，使每格約為 cell_size_km 見方；
+    在台灣的緯度範圍內東西向誤差約在2%以內。
+    """
+    
+    def __init__(self, values, lat_min, lon_min, lat_step, lon_step, kernel, radius_km, cell_size_km):
+        self.values = values
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.kernel = kernel
+        self.radius_km = radius_km
+        self.cell_size_km = cell_size_km
+    
+    @classmethod
+    def build(cls, lats, lons, weights=None, kernel='disk', radius_km=DEFAULT_RADIUS_KM,
+              cell_size_km=CELL_SIZE_KM, bounds=TAIWAN_BOUNDS):
+        """將座標一次分箱到網格，再以 FFT 卷積成密度面
+        
+        weights 為每個停車場的權重（例如車格數），None 表示每個停車場計1。
+        """
+        lat_min, lat_max, lon_min, lon_max = bounds
+        lat_step = cell_size_km / KM_PER_DEGREE
+        lon_step = cell_size_km / (KM_PER_DEGREE * math.cos(math.radians((lat_min + lat_max) / 2)))
+        shape = (int(math.ceil((lat_max - lat_min) / lat_step)), int(math.ceil((lon_max - lon_min) / lon_step)))
+        
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        rows = np.floor((lats - lat_min) / lat_step).astype(np.int64)
+        cols = np.floor((lons - lon_min) / lon_step).astype(np.int64)
+        inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[inside]
+        counts = np.bincount(rows[inside] * shape[1] + cols[inside], weights=weights,
+                             minlength=shape[0] * shape[1]).reshape(shape)
+        
+        values = fft_convolve(counts.astype(np.float64), _kernel(kernel, radius_km, cell_size_km))
+        return cls(values.astype(np.float32), lat_min, lon_min, lat_step, lon_step, kernel, radius_km, cell_size_km)
+    
+    @classmethod
+    def from_parking_data(cls, data, **options):
+        """以外部停車場建立競爭密度面"""
+        external_parking = data['external_parking']
+        return cls.build([parking['lat'] for parking in external_parking],
+                         [parking['lon'] for parking in external_parking], **options)
+    
+    @property
+    def bounds(self):
+        rows, cols = self.values.shape
+        return (self.lat_min, self.lat_min + rows * self.lat_step,
+                self.lon_min, self.lon_min + cols * self.lon_step)
+    
+    def sample(self, lats, lons):
+        """查詢座標所在格子的密度（每平方公里），範圍外為0；可傳入單一座標或陣列"""
+        scalar = np.ndim(lats) == 0
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        rows = np.floor((lats - self.lat_min) / self.lat_step).astype(np.int64)
+        cols = np.floor((lons - self.lon_min) / self.lon_step).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.values.shape[0]) & (cols >= 0) & (cols < self.values.shape[1])
+        result = np.zeros(len(lats), dtype=np.float64)
+        result[inside] = self.values[rows[inside], cols[inside]]
+        return float(result[0]) if scalar else result
+    
+    def save(self, filename):
+        np.savez_compressed(
+            filename, values=self.values,
+            metadata=np.array(json.dumps({
+                'version': SURFACE_VERSION,
+                'lat_min': self.lat_min, 'lon_min': self.lon_min,
+                'lat_step': self.lat_step, 'lon_step': self.lon_step,
+                'kernel': self.kernel, 'radius_km': self.radius_km, 'cell_size_km': self.cell_size_km
+            }))
+        )
+        return filename
+    
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as archive:
+            metadata = json.loads(str(archive['metadata']))
+            values = archive['values']
+        if metadata.get('version') != SURFACE_VERSION:
+            raise ValueError(f"不支援的密度面版本: {metadata.get('version')}")
+        return cls(values, metadata['lat_min'], metadata['lon_min'], metadata['lat_step'],
+                   metadata['lon_step'], metadata['kernel'], metadata['radius_km'], metadata['cell_size_km'])
+
+def _mercator_y(lats):
+    return np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+
+def write_png(filename, rgba):
+    """將 (列, 行, 4) 的 uint8 陣列寫成PNG（列0為影像最上方）"""
+    height, width, _ = rgba.shape
+    raw = b''.join(b'\x00' + rgba[row].tobytes() for row in range(height))
+    
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 9)))
+        f.write(chunk(b'IEND', b''))
+
+def heatmap_rgba(surface):
+    """將密度面轉成地圖疊加用的影像，回傳 (RGBA陣列, [[南, 西], [北, 東]], 最高色階密度)
+    
+    只保留有密度的範圍；Leaflet 的影像疊加以麥卡托投影線性拉伸，
+    因此各列依麥卡托座標重新取樣，使熱區與底圖對齊。
+    """
+    occupied = np.argwhere(surface.values > 0)
+    if len(occupied) == 0:
+        return None, None, 0.0
+    (row_min, col_min), (row_max, col_max) = occupied.min(axis=0), occupied.max(axis=0)
+    values = surface.values[row_min:row_max + 1, col_min:col_max + 1]
+    south = surface.lat_min + row_min * surface.lat_step
+    north = surface.lat_min + (row_max + 1) * surface.lat_step
+    west = surface.lon_min + col_min * surface.lon_step
+    east = surface.lon_min + (col_max + 1) * surface.lon_step
+    
+    # 影像由北到南排列，每列對應等間距的麥卡托座標
+    mercator = np.linspace(_mercator_y(north), _mercator_y(south), values.shape[0], endpoint=False)
+    mercator += (_mercator_y(south) - _mercator_y(north)) / values.shape[0] / 2
+    lats = np.degrees(2 * np.arctan(np.exp(mercator)) - np.pi / 2)
+    rows = np.clip(((lats - south) / surface.lat_step).astype(np.int64), 0, values.shape[0] - 1)
+    values = values[rows]
+    
+    scale = float(np.percentile(values[values > 0], HEATMAP_PERCENTILE))
+    level = np.clip(values / scale, 0, 1) if scale > 0 else np.zeros_like(values)
+    rgba = np.zeros(values.shape + (4,), dtype=np.uint8)
+    # 由黃到紅的色階，密度越高越不透明
+    rgba[..., 0] = 255
+    rgba[..., 1] = (220 * (1 - level)).astype(np.uint8)
+    rgba[..., 2] = (60 * (1 - level)).astype(np.uint8)
+    rgba[..., 3] = np.where(values > 0, 40 + 180 * level, 0).astype(np.uint8)
+    return rgba, [[south, west], [north, east]], scale
+
+def save_heatmap(surface, filename=HEATMAP_FILE):
+    """寫出熱度圖PNG與說明JSON（影像檔名、範圍、色階），供 parking_map.html 疊加顯示"""
+    rgba, bounds, scale = heatmap_rgba(surface)
+    image = os.path.splitext(filename)[0] + '.png'
+    if rgba is not None:
+        write_png(image, rgba)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({
+            'image': os.path.basename(image) if rgba is not None else None,
+            'bounds': bounds,
+            'max_density': round(scale, 2),
+            'kernel': surface.kernel,
+            'radius_km': surface.radius_km,
+            'cell_size_km': surface.cell_size_km
+        }, f, ensure_ascii=False, indent=2)
+    return filename
+
+def score_sites(surface, sites, lat_field='lat', lon_field='lon'):
+    """為候選地點（含座標的字典清單）加上周邊競爭密度，座標無效者為空白"""
+    scored = []
+    for site in sites:
+        try:
+            density = round(surface.sample(float(site[lat_field]), float(site[lon_field])), 2)
+        except (KeyError, ValueError, TypeError):
+            density = ''
+        scored.append(dict(site, 競爭密度_每平方公里外部停車場數=density))
+    return scored
+
+def main():
+    parser = argparse.ArgumentParser(description='建立全台外部停車場競爭密度面，輸出地圖熱度圖並可為候選地點評分')
+    parser.add_argument('--input', default='parking_data_fixed.json', help='停車場資料檔')
+    parser.add_argument('--kernel', choices=KERNELS, default='disk', help='卷積核（disk 為半徑內數量，gaussian 為平滑密度）')
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS_KM, help='半徑或高斯標準差（公里）')
+    parser.add_argument('--cell-size', type=float, default=CELL_SIZE_KM, help='網格大小（公里）')
+    parser.add_argument('--surface', help='另存密度面（.npz），之後可以 DensitySurface.load 載入')
+    parser.add_argument('--score', help='候選地點CSV（需有 lat、lon 欄位），輸出加上密度欄位的CSV')
+    args = parser.parse_args()
+    
+    data = read_parking_data(args.input)
+    surface = DensitySurface.from_parking_data(data, kernel=args.kernel, radius_km=args.radius,
+                                               cell_size_km=args.cell_size)
+    print(f"密度面網格: {surface.values.shape[0]} x {surface.values.shape[1]}，最高密度 {surface.values.max():.2f} 停車場/平方公里")
+    
+    save_heatmap(surface)
+    print(f"熱度圖已儲存到 {HEATMAP_FILE}")
+    if args.surface:
+        surface.save(args.surface)
+        print(f"密度面已儲存到 {args.surface}")
+    
+    if args.score:
+        with open(args.score, 'r', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames + ['競爭密度_每平方公里外部停車場數']
+            sites = score_sites(surface, reader)
+        output = os.path.splitext(args.score)[0] + '_density.csv'
+        with open(output, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(sites)
+        print(f"候選地點評分已儲存到 {output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,97 @@
 #!/usr/bin/env python3
+import argparse
 import json
 
+import instrumentation
+
+from parking_table import read_parking_data
+from rollup_cube import RollupCube, rollup_filename
+
+CITY_MAPPING = {
+    '臺北市': '台北市',
+    '臺中市': '台中市',
+    '臺南市': '台南市',
+    '臺東縣': '台東縣'
+}
+
 def normalize_city_name(city):
     """統一城市名稱"""
-    city_mapping = {
-        '臺北市': '台北市',
-        '臺中市': '台中市', 
-        '臺南市': '台南市',
-        '臺東縣': '台東縣'
-    }
-    return city_mapping.get(city, city)
+    return CITY_MAPPING.get(city, city)
 
-def fix_city_names():
-    """修正城市名稱不一致問題"""
-    print("載入停車場資料...")
-    with open('parking_data.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
+def normalize_parking_data(data):
+    """回傳城市名稱已統一的停車場資料副本（不修改傳入的資料）"""
     print("修正城市名稱...")
     
-    # 修正所有資料的城市名稱
+    fixed = dict(data)
+    fixed_count = 0
+    
+    # 修正所有資料的城市名稱（逐筆記錄只在 --verbose 時輸出）
     for dataset_key in ['uspace_parking', 'external_parking', 'combined']:
         if dataset_key in data:
+            fixed_items = []
             for item in data[dataset_key]:
                 original_city = item.get('city', '')
                 normalized_city = normalize_city_name(original_city)
                 if original_city != normalized_city:
-                    print(f"修正: {original_city} -> {normalized_city}")
-                    item['city'] = normalized_city
+                    instrumentation.log(f"修正: {original_city} -> {normalized_city}")
+                    item = dict(item, city=normalized_city)
+                    fixed_count += 1
+                fixed_items.append(item)
+            fixed[dataset_key] = fixed_items
+    print(f"共修正 {fixed_count} 筆城市名稱")
     
     # 重新計算統計資訊
-    uspace_count = len(data['uspace_parking'])
-    external_count = len(data['external_parking'])
-    total_count = len(data['combined'])
-    
-    data['statistics'] = {
-        'uspace_count': uspace_count,
-        'external_count': external_count,
-        'total_count': total_count
+    fixed['statistics'] = {
+        'uspace_count': len(fixed['uspace_parking']),
+        'external_count': len(fixed['external_parking']),
+        'total_count': len(fixed['combined'])
     }
     
+    return fixed
+
+def print_city_statistics(cube):
+    """顯示修正後的統計（直接查詢彙總結果）"""
+    print('\n修正後的城市統計:')
+    for city, cell in sorted(cube.breakdown('city').items()):
+        uspace_cnt = cube.count(city=city, source='uspace')
+        external_cnt = cube.count(city=city, source='external')
+        print(f'  {city}: 總計{cell["count"]} (USpace: {uspace_cnt}, 外部: {external_cnt})')
+
+def fix_city_names():
+    """修正城市名稱不一致問題"""
+    print("載入停車場資料...")
+    data = read_parking_data('parking_data.json')
+    
+    with instrumentation.stage('normalize_city_names', rows_in=len(data.get('combined', []))) as record:
+        data = normalize_parking_data(data)
+        record['rows_out'] = len(data['combined'])
+    
     # 儲存修正後的資料
     with open('parking_data_fixed.json', 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
     print("修正完成！已儲存為 parking_data_fixed.json")
     
-    # 顯示修正後的統計
-    city_count = {}
-    source_city_count = {'uspace': {}, 'external': {}}
+    # 清洗時已存放的彙總只需將城市改名合併，沒有（或已過期）時才重新掃描資料建立
+    cube = RollupCube.load_current('parking_data.json')
+    if cube is not None:
+        cube = cube.rename('city', CITY_MAPPING)
+    else:
+        cube = RollupCube.from_parking_data(data)
+    cube.save(rollup_filename('parking_data_fixed.json'))
     
-    for item in data['combined']:
-        city = item['city']
-        source = item['source']
-        
-        city_count[city] = city_count.get(city, 0) + 1
-        source_city_count[source][city] = source_city_count[source].get(city, 0) + 1
+    print_city_statistics(cube)
+
+def main():
+    parser = argparse.ArgumentParser(description='統一停車場資料的城市名稱，輸出 parking_data_fixed.json')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
     
-    print('\n修正後的城市統計:')
-    for city, count in sorted(city_count.items()):
-        uspace_cnt = source_city_count['uspace'].get(city, 0)
-        external_cnt = source_city_count['external'].get(city, 0)
-        print(f'  {city}: 總計{count} (USpace: {uspace_cnt}, 外部: {external_cnt})')
+    fix_city_names()
+    
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
 
 if __name__ == "__main__":
-    fix_city_names()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import math
+
+import numpy as np
+
+# 地球半径，依單位區分（與原本各腳本的 calculate_distance 一致）
+EARTH_RADIUS = {
+    'km': 6371,
+    'm': 6371000
+}
+
+def _earth_radius(unit):
+    try:
+        return EARTH_RADIUS[unit]
+    except KeyError:
+        raise ValueError(f"不支援的距離單位: {unit}（可用: {', '.join(EARTH_RADIUS)}）")
+
+def _haversine(lat1, lon1, lat2, lon2, radius):
+    """Haversine 核心公式，支援 NumPy 廣播"""
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = np.radians(lat2 - lat1)
+    delta_lon = np.radians(lon2 - lon1)
+    
+    sin_dlat = np.sin(delta_lat / 2)
+    sin_dlon = np.sin(delta_lon / 2)
+    a = (sin_dlat * sin_dlat +
+         np.cos(lat1_rad) * np.cos(lat2_rad) *
+         sin_dlon * sin_dlon)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    return radius * c
+
+def haversine(lat1, lon1, lat2, lon2, unit='km'):
+    """計算兩點間的距離（單一點對）"""
+    R = _earth_radius(unit)
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+    
+    a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(delta_lon/2) * math.sin(delta_lon/2))
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    
+    return R * c
+
+def haversine_to_many(lat, lon, lats, lons, unit='km'):
+    """計算一個點到多個點的距離，回傳長度為 len(lats) 的距離向量"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return _haversine(float(lat), float(lon), lats, lons, _earth_radius(unit))
+
+def haversine_pairs(lats1, lons1, lats2, lons2, unit='km'):
+    """逐一計算兩組等長點陣列對應位置的距離，回傳距離向量"""
+    lats1 = np.asarray(lats1, dtype=np.float64)
+    lons1 = np.asarray(lons1, dtype=np.float64)
+    lats2 = np.asarray(lats2, dtype=np.float64)
+    lons2 = np.asarray(lons2, dtype=np.float64)
+    return _haversine(lats1, lons1, lats2, lons2, _earth_radius(unit))
+
+def haversine_matrix(lats1, lons1, lats2, lons2, unit='km'):
+    """計算兩組點之間的距離矩陣，形狀為 (len(lats1), len(lats2))"""
+    lats1 = np.asarray(lats1, dtype=np.float64)[:, np.newaxis]
+    lons1 = np.asarray(lons1, dtype=np.float64)[:, np.newaxis]
+    lats2 = np.asarray(lats2, dtype=np.float64)[np.newaxis, :]
+    lons2 = np.asarray(lons2, dtype=np.float64)[np.newaxis, :]
+    return _haversine(lats1, lons1, lats2, lons2, _earth_radius(unit))
+
+def coordinate_arrays(records, lat_field='lat', lon_field='lon'):
+    """將停車場記錄的座標轉為 NumPy 陣列，無效座標以 NaN 表示"""
+    lats = np.full(len(records), np.nan)
+    lons = np.full(len(records), np.nan)
+    for i, record in enumerate(records):
+        try:
+            lats[i] = float(record[lat_field])
+            lons[i] = float(record[lon_field])
+        except (KeyError, ValueError, TypeError):
+            lats[i] = lons[i] = np.nan
+    return lats, lons
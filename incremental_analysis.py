@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from geo_utils import coordinate_arrays, haversine_pairs
+from spatial_index import candidate_pairs_within
+
+def record_hash(record):
+    """計算單筆停車場記錄內容的雜湊值"""
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def records_hash(records):
+    """計算整份停車場清單（含順序）的雜湊值"""
+    digest = hashlib.sha1()
+    for record in records:
+        digest.update(record_hash(record).encode('ascii'))
+    return digest.hexdigest()
+
+def build_snapshot(uspace_parking, external_parking, radius_km):
+    """建立本次分析的輸入快照，供下次增量更新比對"""
+    return {
+        'radius_km': radius_km,
+        'uspace_hash': records_hash(uspace_parking),
+        'external': {
+            external['id']: [record_hash(external), external['lat'], external['lon']]
+            for external in external_parking
+        }
+    }
+
+def load_snapshot(filename):
+    """載入前次分析快照，不存在時回傳None"""
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_snapshot(snapshot, filename):
+    """儲存分析快照"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+def diff_external(previous_snapshot, external_parking):
+    """以 id 與內容雜湊比對外部停車場，回傳 (新增, 移除, 變更) 的 id 清單及受影響座標"""
+    previous = previous_snapshot['external']
+    current = {external['id']: external for external in external_parking}
+    
+    added = [external_id for external_id in current if external_id not in previous]
+    removed = [external_id for external_id in previous if external_id not in current]
+    changed = [
+        external_id for external_id in current
+        if external_id in previous and previous[external_id][0] != record_hash(current[external_id])
+    ]
+    
+    # 受影響的位置：新增與變更後的新座標，以及移除與變更前的舊座標
+    positions = []
+    for external_id in added + changed:
+        positions.append((current[external_id]['lat'], current[external_id]['lon']))
+    for external_id in removed + changed:
+        positions.append((previous[external_id][1], previous[external_id][2]))
+    
+    return added, removed, changed, positions
+
+def find_affected_uspace(uspace_parking, positions, radius_km):
+    """找出半徑內有任一異動位置的USpace停車場索引（依原始順序）"""
+    if not positions:
+        return []
+    
+    position_lats, position_lons = coordinate_arrays(
+        [{'lat': lat, 'lon': lon} for lat, lon in positions]
+    )
+    uspace_lats, uspace_lons = coordinate_arrays(uspace_parking)
+    
+    position_idx, uspace_idx = candidate_pairs_within(
+        position_lats, position_lons, uspace_lats, uspace_lons, radius_km
+    )
+    distances = haversine_pairs(
+        position_lats[position_idx], position_lons[position_idx],
+        uspace_lats[uspace_idx], uspace_lons[uspace_idx]
+    )
+    # 略為放寬門檻，避免邊界上的浮點誤差漏掉需要重算的停車場
+    return np.unique(uspace_idx[distances <= radius_km * (1 + 1e-9)]).tolist()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+METRICS_VERSION = 1
+# 進度列最短更新間隔（秒），避免大量輸出拖慢迴圈
+PROGRESS_INTERVAL = 0.5
+PROGRESS_WIDTH = 30
+# 記憶體取樣間隔（秒）
+RSS_SAMPLE_INTERVAL = 0.01
+
+# 整個行程共用的量測狀態：設定、已完成的階段、進行中的階段與累計計數器
+_state = {
+    'verbose': False,
+    'progress': False,
+    'stages': [],
+    'active': [],
+    'counters': {}
+}
+
+def configure(verbose=None, progress=None):
+    """設定是否輸出逐筆記錄（verbose）與進度列（progress），預設皆關閉"""
+    if verbose is not None:
+        _state['verbose'] = verbose
+    if progress is not None:
+        _state['progress'] = progress
+
+def reset():
+    """清除已記錄的階段與計數器"""
+    _state['stages'] = []
+    _state['active'] = []
+    _state['counters'] = {}
+
+def add_arguments(parser):
+    """加入共用的量測相關命令列參數"""
+    parser.add_argument('--verbose', action='store_true', help='輸出逐筆處理記錄（例如每個重複停車場）')
+    parser.add_argument('--progress', action='store_true', help='在標準錯誤輸出顯示進度列')
+    parser.add_argument('--metrics', help='將各階段的時間、記憶體與計數器寫入此JSON檔')
+
+def configure_from_args(args):
+    configure(verbose=args.verbose, progress=args.progress)
+
+def current_rss():
+    """目前行程的常駐記憶體（位元組）；無 /proc 時以歷史最大值代替"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss()
+
+def peak_rss():
+    """行程至今的最高常駐記憶體（位元組）"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def process_peak_rss(pid):
+    """其他行程的最高常駐記憶體（位元組），無法取得時回傳None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def to_mb(size):
+    return None if size is None else round(size / 1024 / 1024, 2)
+
+def log(message):
+    """逐筆處理記錄，只在 verbose 時輸出"""
+    if _state['verbose']:
+        print(message)
+
+def count(name, n=1):
+    """累加熱點迴圈的計數器（例如距離計算次數），同時計入所有進行中的階段
+    
+    呼叫端應以批次為單位累加，不要在逐元素的迴圈內呼叫。
+    """
+    counters = _state['counters']
+    counters[name] = counters.get(name, 0) + n
+    for record in _state['active']:
+        record['counters'][name] = record['counters'].get(name, 0) + n
+
+def counters():
+    """目前累計的計數器副本"""
+    return dict(_state['counters'])
+
+def merge_counters(counts):
+    """合併其他行程回傳的計數器增量（平行計算時使用）"""
+    for name, n in counts.items():
+        count(name, n)
+
+def counter_delta(before, after):
+    return {name: n - before.get(name, 0) for name, n in after.items() if n != before.get(name, 0)}
+
+@contextlib.contextmanager
+def stage(name, rows_in=None):
+    """量測一個處理階段的牆鐘時間、CPU時間、記憶體高峰與計數器
+    
+    區塊內可設定 record['rows_out']；結束後記錄會加入 metrics() 的結果。
+    記憶體以背景執行緒定期取樣常駐記憶體，記錄區塊期間的最高值與增量。
+    """
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, 'counters': {}}
+    baseline = current_rss()
+    peak = [baseline]
+    stop = threading.Event()
+    
+    def sample():
+        while not stop.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], current_rss())
+    
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    _state['active'].append(record)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = round(time.perf_counter() - wall_start, 4)
+        record['cpu_s'] = round(time.process_time() - cpu_start, 4)
+        stop.set()
+        sampler.join()
+        peak[0] = max(peak[0], current_rss())
+        record['peak_rss_mb'] = to_mb(peak[0])
+        record['rss_delta_mb'] = to_mb(peak[0] - baseline)
+        _state['active'].remove(record)
+        _state['stages'].append(record)
+        log(f"[{name}] {record['wall_s']:.3f}s（CPU {record['cpu_s']:.3f}s，記憶體高峰 {record['peak_rss_mb']}MB）")
+
+class Progress:
+    """節流的進度列，輸出到標準錯誤；未啟用 progress 時不輸出任何內容"""
+    
+    def __init__(self, total=None, label='處理進度'):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.enabled = _state['progress']
+        self.last_render = 0.0
+    
+    def update(self, n=1):
+        self.done += n
+        if self.enabled:
+            now = time.perf_counter()
+            if now - self.last_render >= PROGRESS_INTERVAL:
+                self.last_render = now
+                self.render()
+    
+    def render(self):
+        if self.total:
+            filled = int(PROGRESS_WIDTH * self.done / self.total)
+            bar = '#' * filled + '.' * (PROGRESS_WIDTH - filled)
+            text = f"{self.label} [{bar}] {self.done}/{self.total} ({self.done / self.total * 100:.1f}%)"
+        else:
+            text = f"{self.label}: {self.done}"
+        sys.stderr.write('\r' + text)
+        sys.stderr.flush()
+    
+    def close(self):
+        if self.enabled:
+            self.render()
+            sys.stderr.write('\n')
+            sys.stderr.flush()
+
+def track(iterable, total=None, label='處理進度'):
+    """逐項產生 iterable 的內容並更新進度列"""
+    if total is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+    progress = Progress(total, label)
+    try:
+        for item in iterable:
+            yield item
+            progress.update()
+    finally:
+        progress.close()
+
+def metrics():
+    """已完成階段與累計計數器的量測結果"""
+    return {
+        'version': METRICS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'peak_rss_mb': to_mb(peak_rss()),
+        'stages': list(_state['stages']),
+        'counters': counters()
+    }
+
+def write_metrics(filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(metrics(), f, ensure_ascii=False, indent=2)
+    print(f"量測結果已儲存到 {filename}")
+    return filename
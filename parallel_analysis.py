@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import math
+import multiprocessing
+
+import instrumentation
+
+# 工作行程共用的唯讀資料（fork 時直接繼承父行程記憶體，不需逐一序列化）
+_shared = {}
+
+def shard_by_tile(uspace_parking, shard_count, tile_km=10.0):
+    """依空間方塊將USpace停車場分片，回傳每個分片的索引清單
+    
+    同一方塊的停車場盡量放在同一分片，查詢時共用相近的網格；
+    方塊依大小由大到小分配給目前最輕的分片，使各分片工作量接近。
+    """
+    tile_deg = tile_km / 111.0  # 約略換算，僅用於分組
+    tiles = {}
+    for i, uspace in enumerate(uspace_parking):
+        try:
+            key = (math.floor(float(uspace['lat']) / tile_deg), math.floor(float(uspace['lon']) / tile_deg))
+        except (ValueError, TypeError):
+            key = None
+        tiles.setdefault(key, []).append(i)
+    
+    # 過大的方塊（如市中心）再切成多塊，避免單一分片拖慢整體
+    shard_count = max(1, min(shard_count, len(uspace_parking)))
+    max_shard_size = math.ceil(len(uspace_parking) / shard_count)
+    pieces = []
+    for members in tiles.values():
+        for start in range(0, len(members), max_shard_size):
+            pieces.append(members[start:start + max_shard_size])
+    
+    shards = [[] for _ in range(shard_count)]
+    for members in sorted(pieces, key=len, reverse=True):
+        min(shards, key=len).extend(members)
+    
+    return [sorted(shard) for shard in shards if shard]
+
+def _init_worker(shared):
+    """非 fork 平台的工作行程初始化：每個行程只接收一次共用資料"""
+    _shared.update(shared)
+
+def _analyze_shard(indices):
+    analyze_fn = _shared['analyze_fn']
+    uspace_parking = _shared['uspace_parking']
+    context = _shared['context']
+    # 工作行程中累加的計數器不會反映到父行程，改以增量隨結果回傳
+    before = instrumentation.counters()
+    results = [(i, analyze_fn(uspace_parking[i], *context)) for i in indices]
+    return results, instrumentation.counter_delta(before, instrumentation.counters())
+
+def run_sharded(uspace_parking, analyze_fn, context, workers, shards_per_worker=4):
+    """以多行程平行計算每個USpace停車場的結果，並依原始順序合併
+    
+    analyze_fn(uspace, *context) 必須是模組層級函數；context（外部停車場清單、
+    空間索引等）在各工作行程間唯讀共用，不隨每個分片重新傳送。
+    """
+    shards = shard_by_tile(uspace_parking, workers * shards_per_worker)
+    shared = {
+        'analyze_fn': analyze_fn,
+        'uspace_parking': uspace_parking,
+        'context': context
+    }
+    
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # 先放入模組變數再 fork，工作行程以寫入時複製的方式共用記憶體
+        _shared.update(shared)
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(shared,))
+    
+    results = [None] * len(uspace_parking)
+    progress = instrumentation.Progress(len(uspace_parking))
+    try:
+        with pool:
+            for shard_results, shard_counters in pool.imap_unordered(_analyze_shard, shards):
+                for i, result in shard_results:
+                    results[i] = result
+                instrumentation.merge_counters(shard_counters)
+                progress.update(len(shard_results))
+    finally:
+        _shared.clear()
+        progress.close()
+    
+    return results
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+import argparse
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from parking_table import FIELDS, RATE_COLUMNS, CategoryColumn, read_parking_table
+from rollup_cube import RollupCube
+
+# 地圖頁面優先載入的資料檔（與 parking_map.html 相同）
+DATA_FILE = 'parking_data.bin'
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+# 可做為篩選條件的類別欄位；多個值以逗號分隔表示「任一」
+FILTER_FIELDS = ('city', 'district', 'source')
+
+def parse_bbox(text):
+    """'west,south,east,north'（與 Leaflet toBBoxString 相同）"""
+    try:
+        west, south, east, north = (float(value) for value in text.split(','))
+    except ValueError:
+        raise ValueError(f"bbox 格式錯誤，應為 west,south,east,north: {text}")
+    if south > north or west > east:
+        raise ValueError(f"bbox 範圍錯誤: {text}")
+    return west, south, east, north
+
+def _column_values(column, ids):
+    """取出指定列的值，型別與 parking_data.json 一致"""
+    if isinstance(column, np.ndarray):
+        return column[ids].tolist()
+    if isinstance(column, CategoryColumn):
+        categories = column.categories
+        return [categories[code] for code in column.codes[ids].tolist()]
+    return [column[i] for i in ids.tolist()]
+
+class ParkingQueryIndex:
+    """停車場資料的記憶體內查詢索引
+    
+    座標依緯度排序，範圍查詢以二分搜尋取得緯度帶後再比對經度；
+    城市、區域、來源各建一份「值 -> 列索引」的倒排索引。
+    查詢時先取最小的候選集合，其餘條件以向量化遮罩過濾。
+    有資料檔旁的彙總立方體（rollup）時，篩選選項與只依城市、區域、來源篩選的統計直接查詢彙總。
+    """
+    
+    def __init__(self, table, rollup=None):
+        self.table = table
+        self.rollup = rollup
+        self.lat = table['lat']
+        self.lon = table['lon']
+        self.lat_order = np.argsort(self.lat, kind='stable')
+        self.sorted_lat = self.lat[self.lat_order]
+        self.postings = {}
+        for field in FILTER_FIELDS:
+            column = table[field]
+            order = np.argsort(column.codes, kind='stable')
+            bounds = np.searchsorted(column.codes[order], np.arange(len(column.categories) + 1))
+            self.postings[field] = {
+                category: order[bounds[code]:bounds[code + 1]]
+                for code, category in enumerate(column.categories)
+            }
+    
+    @classmethod
+    def from_file(cls, filename=DATA_FILE):
+        return cls(read_parking_table(filename), RollupCube.load_current(filename))
+    
+    def __len__(self):
+        return len(self.table)
+    
+    def facets(self):
+        """篩選選項：各城市的區域清單與資料來源"""
+        if self.rollup is not None:
+            return {
+                'total': self.rollup.count(),
+                'cities': {
+                    name: sorted(district for district in self.rollup.breakdown('district', city=name) if district)
+                    for name in sorted(self.rollup.breakdown('city')) if name
+                },
+                'sources': sorted(source for source in self.rollup.breakdown('source') if source)
+            }
+        
+        cities = {}
+        city = self.table['city']
+        district = self.table['district']
+        pairs = np.unique(np.column_stack([city.codes, district.codes]), axis=0)
+        for city_code, district_code in pairs.tolist():
+            name = city.categories[city_code]
+            if name:
+                cities.setdefault(name, [])
+                if district.categories[district_code]:
+                    cities[name].append(district.categories[district_code])
+        return {
+            'total': len(self),
+            'cities': {name: sorted(districts) for name, districts in sorted(cities.items())},
+            'sources': sorted(source for source in self.postings['source'] if source)
+        }
+    
+    def select(self, bbox=None, min_rate=None, max_rate=None, rate_field='day_rate', **filters):
+        """回傳符合條件的列索引（依原始順序）
+        
+        bbox 為 (west, south, east, north)；filters 為 city / district / source 的值或值清單；
+        費率條件與地圖頁面的價格區間一致：高於 min_rate、不超過 max_rate（沒有費率視為0）。
+        """
+        candidates = []
+        if bbox is not None:
+            west, south, east, north = bbox
+            start = np.searchsorted(self.sorted_lat, south, side='left')
+            stop = np.searchsorted(self.sorted_lat, north, side='right')
+            candidates.append(self.lat_order[start:stop])
+        wanted = {}
+        for field, value in filters.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"不支援的篩選條件: {field}")
+            if not value:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            wanted[field] = values
+            postings = [self.postings[field].get(v) for v in values]
+            postings = [ids for ids in postings if ids is not None]
+            candidates.append(np.concatenate(postings) if postings else np.empty(0, dtype=np.int64))
+        
+        if not candidates:
+            ids = np.arange(len(self), dtype=np.int64)
+        else:
+            ids = min(candidates, key=len)
+        
+        mask = np.ones(len(ids), dtype=bool)
+        if bbox is not None:
+            lats = self.lat[ids]
+            lons = self.lon[ids]
+            mask &= (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+        for field, values in wanted.items():
+            column = self.table[field]
+            codes = [column.code_of(value) for value in values]
+            mask &= np.isin(column.codes[ids], codes)
+        if min_rate is not None or max_rate is not None:
+            if rate_field not in RATE_COLUMNS:
+                raise ValueError(f"不支援的費率欄位: {rate_field}")
+            rates = self.table[rate_field][ids]
+            if min_rate is not None:
+                mask &= rates > min_rate
+            if max_rate is not None:
+                mask &= rates <= max_rate
+        return np.sort(ids[mask])
+    
+    def records(self, ids, fields=FIELDS):
+        """指定列的記錄（只含 fields 欄位）"""
+        columns = []
+        for field in fields:
+            values = _column_values(self.table[field], ids)
+            if field in RATE_COLUMNS:
+                # 與 parking_data.json 一致：沒有費率時為整數0
+                values = [value if value else 0 for value in values]
+            columns.append(values)
+        return [dict(zip(fields, row)) for row in zip(*columns)]
+    
+    def summary(self, ids):
+        """符合條件的停車場統計（與地圖頁面的統計卡片相同）"""
+        source = self.table['source']
+        codes = source.codes[ids]
+        spaces = self.table['space_number'][ids]
+        return {
+            'total': len(ids),
+            'uspace': int(np.count_nonzero(codes == source.code_of('uspace'))),
+            'external': int(np.count_nonzero(codes == source.code_of('external'))),
+            'spaces': int(spaces[spaces > 0].sum())
+        }
+    
+    def rollup_summary(self, arguments):
+        """只有城市、區域、來源條件且各只有一個值時，由彙總取得 summary；其餘情形回傳None"""
+        if self.rollup is None or arguments['bbox'] is not None:
+            return None
+        if arguments['min_rate'] is not None or arguments['max_rate'] is not None:
+            return None
+        filters = {}
+        for field in FILTER_FIELDS:
+            values = arguments.get(field)
+            if values is not None:
+                if len(values) != 1:
+                    return None
+                filters[field] = values[0]
+        
+        cell = self.rollup.get(**filters)
+        summary = {'total': cell['count'] if cell else 0, 'spaces': int(cell['spaces']) if cell else 0}
+        for source in ('uspace', 'external'):
+            wanted = filters.get('source', source) == source
+            summary[source] = self.rollup.count(**dict(filters, source=source)) if wanted else 0
+        return {name: summary[name] for name in ('total', 'uspace', 'external', 'spaces')}
+    
+    def bounds(self, ids):
+        """符合條件的停車場範圍 [[south, west], [north, east]]，沒有資料時為None"""
+        if len(ids) == 0:
+            return None
+        lats = self.lat[ids]
+        lons = self.lon[ids]
+        return [[float(lats.min()), float(lons.min())], [float(lats.max()), float(lons.max())]]
+
+def _optional_float(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} 必須為數字: {value}")
+
+def _positive_int(params, name, default):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} 必須為正整數: {value}")
+    if value < 1:
+        raise ValueError(f"{name} 必須為正整數: {value}")
+    return value
+
+def select_arguments(params):
+    """將查詢參數轉成 ParkingQueryIndex.select 的參數"""
+    arguments = {
+        field: params[field].split(',') for field in FILTER_FIELDS if params.get(field)
+    }
+    arguments.update(
+        bbox=parse_bbox(params['bbox']) if params.get('bbox') else None,
+        min_rate=_optional_float(params, 'min_rate'),
+        max_rate=_optional_float(params, 'max_rate'),
+        rate_field=params.get('rate_field') or 'day_rate'
+    )
+    return arguments
+
+def query(index, params):
+    """處理 /api/parking 的查詢參數（皆為字串），回傳回應內容
+    
+    參數：bbox、city、district、source（可用逗號分隔多個值）、min_rate、max_rate、
+    rate_field（預設 day_rate）、fields（以逗號分隔的欄位）、page（由1開始）、page_size。
+    """
+    fields = FIELDS
+    if params.get('fields'):
+        fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise ValueError(f"未知的欄位: {', '.join(unknown)}")
+    page = _positive_int(params, 'page', 1)
+    page_size = min(_positive_int(params, 'page_size', PAGE_SIZE), MAX_PAGE_SIZE)
+    
+    arguments = select_arguments(params)
+    ids = index.select(**arguments)
+    start = (page - 1) * page_size
+    return {
+        'total': len(ids),
+        'page': page,
+        'page_size': page_size,
+        'pages': math.ceil(len(ids) / page_size),
+        'summary': index.rollup_summary(arguments) or index.summary(ids),
+        'bounds': index.bounds(ids),
+        'results': index.records(ids[start:start + page_size], fields)
+    }
+
+class ParkingApi:
+    """伺服器共用的查詢索引；資料檔變更時於下次請求重新建立"""
+    
+    def __init__(self, filename=DATA_FILE):
+        self.filename = filename
+        self.index = None
+        self.mtime = None
+        self.lock = threading.Lock()
+    
+    def get_index(self):
+        mtime = os.path.getmtime(self.filename)
+        with self.lock:
+            if self.index is None or mtime != self.mtime:
+                self.index = ParkingQueryIndex.from_file(self.filename)
+                self.mtime = mtime
+            return self.index
+    
+    def query(self, params):
+        return query(self.get_index(), params)
+    
+    def facets(self):
+        return self.get_index().facets()
+
+def main():
+    parser = argparse.ArgumentParser(description='測試 /api/parking 查詢的回應時間')
+    parser.add_argument('input', nargs='?', default=DATA_FILE, help='停車場資料檔')
+    parser.add_argument('--bbox', default='121.45,24.98,121.62,25.10', help='west,south,east,north')
+    parser.add_argument('--repeat', type=int, default=100, help='重複查詢次數')
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    index = ParkingQueryIndex.from_file(args.input)
+    print(f"建立索引: {len(index)} 筆，{(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    params = {'bbox': args.bbox}
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = query(index, params)
+        timings.append(time.perf_counter() - start)
+    print(f"範圍內 {result['total']} 筆，第1頁 {len(result['results'])} 筆")
+    print(f"查詢時間中位數 {np.median(timings) * 1000:.2f} ms，最大 {max(timings) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from geo_utils import haversine_to_many
+from parking_table import (CATEGORY_COLUMNS, COORDINATE_COLUMNS, FIELDS, INT_COLUMNS, RATE_COLUMNS,
+                           STRING_COLUMNS, ParkingTable, read_parking_table)
+from spatial_index import radius_to_degree_span
+
+STORE_VERSION = 1
+SQLITE_MAGIC = b'SQLite format 3\x00'
+BUILDINGS_CSV = '建物.csv'
+
+# 建物.csv 的欄位與資料表欄位的對應
+BUILDING_FIELDS = [
+    ('id', 'id', 'TEXT'),
+    ('group_key_id', 'group_key_id', 'TEXT'),
+    ('name', 'name', 'TEXT'),
+    ('space_number', 'space_number', 'INTEGER'),
+    ('in_operation', 'in_operation', 'INTEGER'),
+    ('building_type', 'building_type', 'TEXT'),
+    ('thirdparty_name', 'thirdparty_name', 'TEXT'),
+    ('lat', 'lat', 'REAL'),
+    ('lon', 'lon', 'REAL'),
+    ('city', 'city', 'TEXT'),
+    ('district', 'zone', 'TEXT'),
+    ('address', 'concat(b.city,b.zone,b.road)', 'TEXT')
+]
+
+# 可用於查詢條件的欄位：停車場依城市、區域、來源，建物依城市、區域
+FILTER_FIELDS = {
+    'parking': ('city', 'district', 'source'),
+    'buildings': ('city', 'district')
+}
+
+def _column_type(field):
+    if field in COORDINATE_COLUMNS or field in RATE_COLUMNS:
+        return 'REAL'
+    if field in INT_COLUMNS:
+        return 'INTEGER'
+    return 'TEXT'
+
+def _schema():
+    parking_columns = ', '.join(f'{field} {_column_type(field)}' for field in FIELDS)
+    building_columns = ', '.join(f'{field} {column_type}' for field, _, column_type in BUILDING_FIELDS)
+    statements = [
+        'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+        f'CREATE TABLE parking (rowid INTEGER PRIMARY KEY, {parking_columns})',
+        f'CREATE TABLE buildings (rowid INTEGER PRIMARY KEY, {building_columns})'
+    ]
+    for table, fields in FILTER_FIELDS.items():
+        # R*Tree 以 rowid 對應資料表，存放座標的外接框（點資料的上下界相同）
+        statements.append(f'CREATE VIRTUAL TABLE {table}_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+        statements.extend(f'CREATE INDEX {table}_{field} ON {table}({field})' for field in fields)
+    return statements
+
+def store_filename(data_filename):
+    """資料庫與資料檔放在一起，例如 parking_data_fixed.json -> parking_data_fixed.db"""
+    return f"{os.path.splitext(data_filename)[0]}.db"
+
+def is_store_file(filename):
+    """依檔頭判斷是否為 SQLite 資料庫"""
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _parse_bbox(bbox):
+    """bbox 可為 (west, south, east, north) 序列或 'west,south,east,north' 字串（與 Leaflet toBBoxString 相同）"""
+    if isinstance(bbox, str):
+        bbox = bbox.split(',')
+    west, south, east, north = (float(value) for value in bbox)
+    return west, south, east, north
+
+class ParkingStore:
+    """以 SQLite 儲存停車場與建物資料的共用後端
+    
+    座標建有 R*Tree 空間索引，城市、區域、來源建有一般索引；
+    半徑與範圍查詢只讀取索引命中的列，不必載入整份JSON或CSV。
+    """
+    
+    def __init__(self, filename, create=False):
+        if not create and not os.path.exists(filename):
+            raise FileNotFoundError(f"找不到資料庫: {filename}")
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.row_factory = sqlite3.Row
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        self.connection.close()
+    
+    @classmethod
+    def create(cls, filename):
+        """建立（或覆寫）空的資料庫"""
+        if os.path.exists(filename):
+            os.remove(filename)
+        store = cls(filename, create=True)
+        with store.connection:
+            for statement in _schema():
+                store.connection.execute(statement)
+            store.set_meta('version', STORE_VERSION)
+        return store
+    
+    def set_meta(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, json.dumps(value)))
+    
+    def meta(self, key, default=None):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+    
+    def _insert(self, table, fields, rows, start=1):
+        """由 rowid = start 起依序新增資料，並將新增的列加入空間索引"""
+        placeholders = ', '.join('?' * len(fields))
+        self.connection.executemany(
+            f'INSERT INTO {table} (rowid, {", ".join(fields)}) VALUES (?, {placeholders})',
+            ((i, *row) for i, row in enumerate(rows, start=start))
+        )
+        self.connection.execute(
+            f'INSERT INTO {table}_rtree SELECT rowid, lat, lat, lon, lon FROM {table} WHERE rowid >= ?', (start,)
+        )
+    
+    def import_parking_table(self, table):
+        """匯入 ParkingTable（覆寫既有的停車場資料），保留原本的排列順序"""
+        with self.connection:
+            self.connection.execute('DELETE FROM parking')
+            self.connection.execute('DELETE FROM parking_rtree')
+            self._insert('parking', FIELDS, _parking_rows(table))
+    
+    def append_parking_table(self, table):
+        """將 ParkingTable 接在既有的停車場資料之後（分批匯入時使用）"""
+        with self.connection:
+            start = self.connection.execute('SELECT COALESCE(MAX(rowid), 0) + 1 FROM parking').fetchone()[0]
+            self._insert('parking', FIELDS, _parking_rows(table), start)
+    
+    def import_buildings(self, csv_file=BUILDINGS_CSV):
+        """匯入 建物.csv（覆寫既有的建物資料），座標無法解析的列略過"""
+        rows = []
+        with open(csv_file, 'r', encoding='utf-8-sig') as f:
+            for record in csv.DictReader(f):
+                row = []
+                try:
+                    for _, column, column_type in BUILDING_FIELDS:
+                        value = record.get(column) or ''
+                        if column_type == 'REAL':
+                            value = float(value)
+                        elif column_type == 'INTEGER':
+                            value = int(value) if value else 0
+                        row.append(value)
+                except ValueError:
+                    continue
+                rows.append(row)
+        with self.connection:
+            self.connection.execute('DELETE FROM buildings')
+            self.connection.execute('DELETE FROM buildings_rtree')
+            self._insert('buildings', [field for field, _, _ in BUILDING_FIELDS], rows)
+        return len(rows)
+    
+    def is_current(self, sources, params=None):
+        """資料庫內容是否由相同內容的來源檔（與相同的處理參數）匯入（可略過重新匯入）"""
+        recorded = self.meta('sources', {})
+        return self.meta('version') == STORE_VERSION and self.meta('params') == params and all(
+            os.path.exists(source) and recorded.get(source) == file_digest(source) for source in sources
+        )
+    
+    def record_sources(self, sources, params=None):
+        with self.connection:
+            self.set_meta('sources', {source: file_digest(source) for source in sources})
+            self.set_meta('params', params)
+            self.set_meta('imported_at', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    
+    def _select(self, table, bbox=None, limit=None, offset=0, **filters):
+        """依範圍（R*Tree）與屬性條件查詢，回傳 sqlite3.Row 清單，依匯入順序排列"""
+        unknown = set(filters) - set(FILTER_FIELDS[table])
+        if unknown:
+            raise ValueError(f"不支援的查詢條件: {', '.join(sorted(unknown))}")
+        
+        clauses = []
+        params = []
+        if bbox is not None:
+            west, south, east, north = _parse_bbox(bbox)
+            clauses.append(
+                f'rowid IN (SELECT id FROM {table}_rtree '
+                'WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?)'
+            )
+            params.extend([south, north, west, east])
+        for field, value in filters.items():
+            if value is None:
+                continue
+            # 多個值以清單傳入時視為「任一」
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f'{field} IN ({", ".join("?" * len(values))})')
+            params.extend(values)
+        
+        sql = f'SELECT * FROM {table}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY rowid'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([limit, offset])
+        return self.connection.execute(sql, params).fetchall()
+    
+    def _select_radius(self, table, lat, lon, radius_km, **filters):
+        """半徑查詢：先以 R*Tree 取外接框內的候選，再以 Haversine 距離篩選，依距離排序"""
+        lat_span, lon_span = radius_to_degree_span(lat, radius_km)
+        rows = self._select(table, (lon - lon_span, lat - lat_span, lon + lon_span, lat + lat_span), **filters)
+        if not rows:
+            return []
+        distances = haversine_to_many(lat, lon, [row['lat'] for row in rows], [row['lon'] for row in rows])
+        order = np.argsort(distances, kind='stable')
+        return [(rows[i], float(distances[i])) for i in order.tolist() if distances[i] <= radius_km]
+    
+    def query(self, bbox=None, limit=None, offset=0, **filters):
+        """查詢停車場，例如 store.query(city='台北市', source='external')，回傳記錄（dict）清單"""
+        return [_parking_record(row) for row in self._select('parking', bbox, limit, offset, **filters)]
+    
+    def query_radius(self, lat, lon, radius_km, **filters):
+        """查詢半徑內的停車場，回傳依距離排序的 [(記錄, 距離km), ...]"""
+        return [
+            (_parking_record(row), distance)
+            for row, distance in self._select_radius('parking', lat, lon, radius_km, **filters)
+        ]
+    
+    def query_buildings(self, bbox=None, limit=None, offset=0, **filters):
+        """查詢建物（建物.csv 的內容），回傳記錄（dict）清單"""
+        return [_building_record(row) for row in self._select('buildings', bbox, limit, offset, **filters)]
+    
+    def query_buildings_radius(self, lat, lon, radius_km, **filters):
+        return [
+            (_building_record(row), distance)
+            for row, distance in self._select_radius('buildings', lat, lon, radius_km, **filters)
+        ]
+    
+    def count(self, **filters):
+        """依城市、區域、來源計算停車場數量（只使用索引）"""
+        clauses = [f'{field} = ?' for field, value in filters.items() if value is not None]
+        params = [value for value in filters.values() if value is not None]
+        sql = 'SELECT COUNT(*) FROM parking' + (' WHERE ' + ' AND '.join(clauses) if clauses else '')
+        return self.connection.execute(sql, params).fetchone()[0]
+    
+    def to_parking_data(self):
+        """轉回 parking_data.json 的資料結構"""
+        records = self.query()
+        uspace_parking = [record for record in records if record['source'] == 'uspace']
+        external_parking = [record for record in records if record['source'] == 'external']
+        combined = uspace_parking + external_parking
+        return {
+            'uspace_parking': uspace_parking,
+            'external_parking': external_parking,
+            'combined': combined,
+            'statistics': {
+                'uspace_count': len(uspace_parking),
+                'external_count': len(external_parking),
+                'total_count': len(combined)
+            }
+        }
+    
+    def to_table(self):
+        return ParkingTable.from_records(self.query())
+
+def _parking_rows(table):
+    columns = []
+    for field in FIELDS:
+        column = table[field]
+        if field in RATE_COLUMNS:
+            # 與 parking_data.json 一致：沒有費率時存0
+            columns.append([value if value else 0 for value in column.tolist()])
+        else:
+            columns.append(column.tolist())
+    return zip(*columns)
+
+def _parking_record(row):
+    """sqlite3.Row 轉成與 parking_data.json 相同欄位順序與型別的記錄"""
+    record = {}
+    for field in FIELDS:
+        value = row[field]
+        if field in RATE_COLUMNS:
+            value = value if value else 0
+        elif field in CATEGORY_COLUMNS or field in STRING_COLUMNS:
+            value = value if value is not None else ''
+        record[field] = value
+    return record
+
+def _building_record(row):
+    return {field: row[field] for field, _, _ in BUILDING_FIELDS}
+
+def store_is_current(filename, sources, params=None):
+    """既有的資料庫是否由相同的來源與參數建立"""
+    if not is_store_file(filename):
+        return False
+    with ParkingStore(filename) as store:
+        return store.is_current(sources, params)
+
+def build_store(data_file='parking_data_fixed.json', buildings_csv=BUILDINGS_CSV, filename=None, force=False):
+    """由停車場資料檔與建物CSV建立資料庫；來源內容未變更時直接沿用既有資料庫"""
+    filename = filename or store_filename(data_file)
+    sources = [data_file] + ([buildings_csv] if buildings_csv and os.path.exists(buildings_csv) else [])
+    if not force and store_is_current(filename, sources):
+        print(f"資料庫 {filename} 已是最新，略過匯入")
+        return filename
+    
+    with ParkingStore.create(filename) as store:
+        store.import_parking_table(read_parking_table(data_file))
+        if len(sources) > 1:
+            store.import_buildings(buildings_csv)
+        store.record_sources(sources)
+    print(f"已建立資料庫 {filename}")
+    return filename
+
+def save_parking_store(table, filename, buildings_csv=BUILDINGS_CSV):
+    """將 ParkingTable（與建物CSV，若存在）寫成資料庫"""
+    with ParkingStore.create(filename) as store:
+        store.import_parking_table(table)
+        if buildings_csv and os.path.exists(buildings_csv):
+            store.import_buildings(buildings_csv)
+    return filename
+
+def main():
+    parser = argparse.ArgumentParser(description='建立或查詢停車場 SQLite 資料庫（R*Tree 空間索引）')
+    parser.add_argument('input', nargs='?', default='parking_data_fixed.json', help='停車場資料檔')
+    parser.add_argument('--db', help='資料庫檔名（預設與資料檔同名，副檔名為 .db）')
+    parser.add_argument('--buildings', default=BUILDINGS_CSV, help='建物CSV檔')
+    parser.add_argument('--force', action='store_true', help='來源未變更也重新匯入')
+    parser.add_argument('--near', help='查詢半徑內的停車場：lat,lon,半徑km')
+    parser.add_argument('--bbox', help='查詢範圍內的停車場：west,south,east,north')
+    parser.add_argument('--city', help='限定城市')
+    parser.add_argument('--district', help='限定區域')
+    parser.add_argument('--source', choices=['uspace', 'external'], help='限定來源')
+    args = parser.parse_args()
+    
+    filename = build_store(args.input, args.buildings, args.db, args.force)
+    filters = {'city': args.city, 'district': args.district, 'source': args.source}
+    
+    with ParkingStore(filename) as store:
+        if args.near:
+            lat, lon, radius_km = (float(value) for value in args.near.split(','))
+            results = store.query_radius(lat, lon, radius_km, **filters)
+            print(f"半徑 {radius_km:g}km 內共 {len(results)} 個停車場")
+            for record, distance in results[:20]:
+                print(f"  {distance:.3f}km  {record['name']}（{record['city']}{record['district']}，日間 {record['day_rate']}）")
+        elif args.bbox or any(value is not None for value in filters.values()):
+            results = store.query(bbox=args.bbox, **filters)
+            print(f"符合條件的停車場共 {len(results)} 個")
+            for record in results[:20]:
+                print(f"  {record['name']}（{record['city']}{record['district']}，日間 {record['day_rate']}）")
+        else:
+            print(f"停車場 {store.count()} 筆（USpace {store.count(source='uspace')}、外部 {store.count(source='external')}）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# 欄位順序與 parking_data.json 中每筆記錄的鍵順序一致
+FIELDS = [
+    'id', 'name', 'lat', 'lon', 'city', 'district', 'address', 'space_number',
+    'day_rate', 'night_rate', 'monthly_rate', 'source', 'building_type', 'financial_class'
+]
+COORDINATE_COLUMNS = ('lat', 'lon')
+RATE_COLUMNS = ('day_rate', 'night_rate', 'monthly_rate')
+INT_COLUMNS = ('space_number',)
+CATEGORY_COLUMNS = ('city', 'district', 'source', 'building_type', 'financial_class')
+STRING_COLUMNS = ('id', 'name', 'address')
+
+# 欄式JSON與二進位格式的識別資訊
+COLUMNAR_FORMAT = 'parking-columnar'
+COLUMNAR_VERSION = 1
+BINARY_MAGIC = b'PKCB'
+BINARY_VERSION = 1
+# 二進位檔開頭：識別碼、版本、保留、筆數、標頭JSON長度（皆為 little-endian）
+BINARY_PREAMBLE = struct.Struct('<4sHHII')
+BINARY_ALIGNMENT = 8
+# 分批寫出時，每次自暫存檔讀回的筆數
+WRITER_BLOCK_ROWS = 65536
+
+class StringColumn:
+    """以單一UTF-8位元組緩衝區加偏移量儲存的字串欄位
+    
+    偏移量為緩衝區內的絕對位置，因此連續切片只需切偏移量陣列，不複製字串內容。
+    """
+    
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+    
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [str(value).encode('utf-8') for value in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            return StringColumn(self.buffer, self.offsets[start:max(start, stop) + 1])
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+    
+    def take(self, indices):
+        return StringColumn.from_strings([self[i] for i in np.asarray(indices).tolist()])
+    
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+    
+    @property
+    def nbytes(self):
+        # 切片共用緩衝區，只計算本欄位實際涵蓋的位元組
+        return int(self.offsets[-1] - self.offsets[0]) + self.offsets.nbytes
+
+class CategoryColumn:
+    """字典編碼的字串欄位：每筆只存整數代碼，相同字串只存一份"""
+    
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+    
+    @classmethod
+    def from_strings(cls, strings):
+        lookup = {}
+        categories = []
+        codes = []
+        for value in strings:
+            value = str(value)
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(categories)
+                categories.append(sys.intern(value))
+            codes.append(code)
+        dtype = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+        return cls(np.array(codes, dtype=dtype), categories)
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return CategoryColumn(self.codes[i], self.categories)
+        return self.categories[self.codes[i]]
+    
+    def take(self, indices):
+        return CategoryColumn(self.codes[np.asarray(indices)], self.categories)
+    
+    def code_of(self, value):
+        """取得字串對應的代碼，不存在時回傳-1"""
+        try:
+            return self.categories.index(value)
+        except ValueError:
+            return -1
+    
+    def tolist(self):
+        return [self.categories[code] for code in self.codes.tolist()]
+    
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+class ParkingTable:
+    """停車場資料的欄式（struct-of-arrays）容器
+    
+    座標與費率為 float64 陣列、車位數為 int32 陣列，城市、區域、來源等
+    重複性高的欄位以字典編碼，名稱、地址等以連續緩衝區儲存。
+    """
+    
+    def __init__(self, columns):
+        self.columns = columns
+    
+    @classmethod
+    def from_records(cls, records):
+        """由停車場記錄（dict）清單建立"""
+        columns = {}
+        for field in COORDINATE_COLUMNS + RATE_COLUMNS:
+            columns[field] = np.array([record.get(field) or 0 for record in records], dtype=np.float64)
+        for field in INT_COLUMNS:
+            columns[field] = np.array([record.get(field) or 0 for record in records], dtype=np.int32)
+        for field in CATEGORY_COLUMNS:
+            columns[field] = CategoryColumn.from_strings(record.get(field, '') for record in records)
+        for field in STRING_COLUMNS:
+            columns[field] = StringColumn.from_strings(record.get(field, '') for record in records)
+        return cls(columns)
+    
+    @classmethod
+    def concat(cls, tables):
+        """依序串接多個 ParkingTable（例如分批建立的資料）"""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.from_records([])
+        
+        columns = {}
+        for field in FIELDS:
+            parts = [table[field] for table in tables]
+            if field in CATEGORY_COLUMNS:
+                # 合併類別清單，並將各批次的代碼換成合併後的代碼
+                lookup = {}
+                categories = []
+                codes = []
+                for part in parts:
+                    for category in part.categories:
+                        if category not in lookup:
+                            lookup[category] = len(categories)
+                            categories.append(category)
+                    remap = np.array([lookup[category] for category in part.categories], dtype=np.int64)
+                    codes.append(remap[part.codes])
+                dtype = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+                columns[field] = CategoryColumn(np.concatenate(codes).astype(dtype), categories)
+            elif field in STRING_COLUMNS:
+                buffers = []
+                offsets = [np.zeros(1, dtype=np.int64)]
+                size = 0
+                for part in parts:
+                    start, end = int(part.offsets[0]), int(part.offsets[-1])
+                    buffers.append(part.buffer[start:end])
+                    offsets.append(part.offsets[1:] - start + size)
+                    size += end - start
+                columns[field] = StringColumn(b''.join(buffers), np.concatenate(offsets))
+            else:
+                columns[field] = np.concatenate(parts)
+        return cls(columns)
+    
+    @classmethod
+    def from_parking_data(cls, data):
+        """由 parking_data.json 的資料結構建立（不使用重複的 combined 清單）"""
+        return cls.from_records(data['uspace_parking'] + data['external_parking'])
+    
+    def __len__(self):
+        return len(self.columns['lat'])
+    
+    def __getitem__(self, field):
+        return self.columns[field]
+    
+    def slice(self, start, stop):
+        """連續範圍的零複製檢視"""
+        return ParkingTable({field: column[start:stop] for field, column in self.columns.items()})
+    
+    def take(self, indices):
+        """依索引挑選列（會複製資料）"""
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {}
+        for field, column in self.columns.items():
+            columns[field] = column[indices] if isinstance(column, np.ndarray) else column.take(indices)
+        return ParkingTable(columns)
+    
+    def source_view(self, source):
+        """取得特定來源的資料；來源連續存放時（一般情況）為零複製檢視"""
+        source_column = self.columns['source']
+        indices = np.flatnonzero(source_column.codes == source_column.code_of(source))
+        if len(indices) == 0:
+            return self.slice(0, 0)
+        if indices[-1] - indices[0] + 1 == len(indices):
+            return self.slice(int(indices[0]), int(indices[-1]) + 1)
+        return self.take(indices)
+    
+    def record(self, i):
+        """取得單筆記錄，型別與原本JSON一致（費率為0時為整數0）"""
+        record = {}
+        for field in FIELDS:
+            value = self.columns[field][i]
+            if field in COORDINATE_COLUMNS:
+                value = float(value)
+            elif field in RATE_COLUMNS:
+                value = float(value) if value else 0
+            elif field in INT_COLUMNS:
+                value = int(value)
+            record[field] = value
+        return record
+    
+    def to_records(self):
+        return [self.record(i) for i in range(len(self))]
+    
+    def to_parking_data(self):
+        """轉回 parking_data.json 的資料結構（combined 於寫出時才產生）"""
+        uspace_parking = self.source_view('uspace').to_records()
+        external_parking = self.source_view('external').to_records()
+        combined = uspace_parking + external_parking
+        return {
+            'uspace_parking': uspace_parking,
+            'external_parking': external_parking,
+            'combined': combined,
+            'statistics': {
+                'uspace_count': len(uspace_parking),
+                'external_count': len(external_parking),
+                'total_count': len(combined)
+            }
+        }
+    
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+def load_parking_table(filename='parking_data_fixed.json'):
+    """載入 parking_data.json 格式的檔案為 ParkingTable"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return ParkingTable.from_parking_data(json.load(f))
+
+def save_parking_table(table, filename):
+    """將 ParkingTable 以 parking_data.json 格式寫出"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(table.to_parking_data(), f, ensure_ascii=False, indent=2)
+    return filename
+
+def save_parking_table_columnar(table, filename):
+    """將 ParkingTable 以欄式JSON（每個欄位一個陣列）寫出
+    
+    城市、區域等字典編碼欄位寫成 {categories, codes}，不重複寫出 combined 清單。
+    """
+    columns = {}
+    for field in FIELDS:
+        column = table[field]
+        if field in CATEGORY_COLUMNS:
+            columns[field] = {'categories': list(column.categories), 'codes': column.codes.tolist()}
+        else:
+            columns[field] = column.tolist()
+    
+    payload = {
+        'format': COLUMNAR_FORMAT,
+        'version': COLUMNAR_VERSION,
+        'count': len(table),
+        'statistics': table.to_parking_data()['statistics'],
+        'columns': columns
+    }
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+    return filename
+
+def _table_from_columnar(payload):
+    if payload.get('version') != COLUMNAR_VERSION:
+        raise ValueError(f"不支援的欄式資料版本: {payload.get('version')}")
+    
+    columns = {}
+    for field in FIELDS:
+        values = payload['columns'][field]
+        if field in COORDINATE_COLUMNS + RATE_COLUMNS:
+            columns[field] = np.array(values, dtype=np.float64)
+        elif field in INT_COLUMNS:
+            columns[field] = np.array(values, dtype=np.int32)
+        elif field in CATEGORY_COLUMNS:
+            categories = values['categories']
+            dtype = np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32
+            columns[field] = CategoryColumn(np.array(values['codes'], dtype=dtype), categories)
+        else:
+            columns[field] = StringColumn.from_strings(values)
+    return ParkingTable(columns)
+
+def _align(size):
+    return (size + BINARY_ALIGNMENT - 1) // BINARY_ALIGNMENT * BINARY_ALIGNMENT
+
+def save_parking_table_binary(table, filename):
+    """將 ParkingTable 以二進位欄式格式寫出
+    
+    檔案結構：固定長度開頭 + 標頭JSON（欄位描述、統計資訊）+ 資料區。
+    資料區內每個區塊皆對齊8位元組，瀏覽器可直接以 TypedArray 讀取：
+      數值欄位 - float64 / int32 陣列
+      字典欄位 - int16（或int32）代碼陣列，類別字串放在標頭
+      字串欄位 - uint32 偏移量陣列（筆數+1）+ UTF-8 位元組
+    """
+    blocks = []
+    size = 0
+    
+    def add_block(data):
+        nonlocal size
+        offset = size
+        blocks.append(data)
+        padding = _align(len(data)) - len(data)
+        if padding:
+            blocks.append(b'\0' * padding)
+        size += len(data) + padding
+        return offset
+    
+    descriptors = []
+    for field in FIELDS:
+        column = table[field]
+        if field in COORDINATE_COLUMNS + RATE_COLUMNS:
+            descriptors.append({'name': field, 'type': 'float64',
+                                'offset': add_block(column.astype('<f8').tobytes())})
+        elif field in INT_COLUMNS:
+            descriptors.append({'name': field, 'type': 'int32',
+                                'offset': add_block(column.astype('<i4').tobytes())})
+        elif field in CATEGORY_COLUMNS:
+            code_type = 'int16' if column.codes.dtype == np.int16 else 'int32'
+            codes = column.codes.astype('<i2' if code_type == 'int16' else '<i4')
+            descriptors.append({'name': field, 'type': 'category', 'code_type': code_type,
+                                'categories': list(column.categories),
+                                'offset': add_block(codes.tobytes())})
+        else:
+            # 切片的偏移量指向共用緩衝區，寫出前改為從0開始
+            start, end = int(column.offsets[0]), int(column.offsets[-1])
+            offsets = (column.offsets - start).astype('<u4')
+            descriptors.append({'name': field, 'type': 'string',
+                                'offset': add_block(offsets.tobytes()),
+                                'data_offset': add_block(column.buffer[start:end]),
+                                'data_length': end - start})
+    
+    with open(filename, 'wb') as f:
+        _write_binary_header(f, len(table), table.to_parking_data()['statistics'], descriptors)
+        for block in blocks:
+            f.write(block)
+    return filename
+
+def _write_binary_header(f, count, statistics, descriptors):
+    header = json.dumps({
+        'statistics': statistics,
+        'columns': descriptors
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    # 以空白補齊標頭，使資料區從對齊的位置開始
+    header += b' ' * (_align(BINARY_PREAMBLE.size + len(header)) - BINARY_PREAMBLE.size - len(header))
+    f.write(BINARY_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION, 0, count, len(header)))
+    f.write(header)
+
+class ParkingTableWriter:
+    """分批累積 ParkingTable 並寫出二進位與欄式JSON格式，輸出與一次寫出整個表格相同
+    
+    每個欄位的資料在 append 時即寫入暫存檔，寫出時再以 WRITER_BLOCK_ROWS 筆為單位讀回，
+    記憶體中只保留各字典欄位的類別清單（城市、區域等，數量與資料筆數無關）。
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.source_counts = {'uspace': 0, 'external': 0}
+        self.spools = {field: tempfile.TemporaryFile() for field in FIELDS}
+        # 字串欄位：spools 存每筆的結束偏移量，string_data 存UTF-8內容
+        self.string_data = {field: tempfile.TemporaryFile() for field in STRING_COLUMNS}
+        self.string_sizes = {field: 0 for field in STRING_COLUMNS}
+        self.categories = {field: [] for field in CATEGORY_COLUMNS}
+        self.lookups = {field: {} for field in CATEGORY_COLUMNS}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        for spool in list(self.spools.values()) + list(self.string_data.values()):
+            spool.close()
+    
+    def append(self, table):
+        for field in FIELDS:
+            column = table[field]
+            spool = self.spools[field]
+            if field in COORDINATE_COLUMNS + RATE_COLUMNS:
+                spool.write(column.astype('<f8').tobytes())
+            elif field in INT_COLUMNS:
+                spool.write(column.astype('<i4').tobytes())
+            elif field in CATEGORY_COLUMNS:
+                # 與 ParkingTable.concat 相同：類別依第一次出現的順序編碼
+                lookup = self.lookups[field]
+                for category in column.categories:
+                    if category not in lookup:
+                        lookup[category] = len(self.categories[field])
+                        self.categories[field].append(category)
+                remap = np.array([lookup[category] for category in column.categories], dtype=np.int64)
+                spool.write(remap[column.codes].astype('<i4').tobytes())
+            else:
+                start, end = int(column.offsets[0]), int(column.offsets[-1])
+                self.string_data[field].write(column.buffer[start:end])
+                spool.write((column.offsets[1:] - start + self.string_sizes[field]).astype('<u4').tobytes())
+                self.string_sizes[field] += end - start
+        
+        source = table['source']
+        for name in self.source_counts:
+            self.source_counts[name] += int(np.count_nonzero(source.codes == source.code_of(name)))
+        self.count += len(table)
+    
+    @property
+    def statistics(self):
+        return {
+            'uspace_count': self.source_counts['uspace'],
+            'external_count': self.source_counts['external'],
+            'total_count': self.source_counts['uspace'] + self.source_counts['external']
+        }
+    
+    def _code_type(self, field):
+        return 'int16' if len(self.categories[field]) < np.iinfo(np.int16).max else 'int32'
+    
+    def _blocks(self, field):
+        """依序讀回欄位資料，每次 WRITER_BLOCK_ROWS 筆"""
+        spool = self.spools[field]
+        dtype = np.dtype('<f8' if field in COORDINATE_COLUMNS + RATE_COLUMNS else '<u4' if field in STRING_COLUMNS else '<i4')
+        spool.seek(0)
+        while True:
+            data = spool.read(WRITER_BLOCK_ROWS * dtype.itemsize)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=dtype)
+    
+    def _string_blocks(self, field):
+        """依序讀回字串欄位，每次回傳 (結束偏移量, 該段UTF-8內容, 該段起點)"""
+        data = self.string_data[field]
+        data.seek(0)
+        start = 0
+        for ends in self._blocks(field):
+            end = int(ends[-1])
+            yield ends, data.read(end - start), start
+            start = end
+    
+    def write_binary(self, filename):
+        """寫出與 save_parking_table_binary 相同的二進位欄式格式"""
+        descriptors = []
+        size = 0
+        
+        def reserve(length):
+            nonlocal size
+            offset = size
+            size += _align(length)
+            return offset
+        
+        for field in FIELDS:
+            if field in COORDINATE_COLUMNS + RATE_COLUMNS:
+                descriptors.append({'name': field, 'type': 'float64', 'offset': reserve(8 * self.count)})
+            elif field in INT_COLUMNS:
+                descriptors.append({'name': field, 'type': 'int32', 'offset': reserve(4 * self.count)})
+            elif field in CATEGORY_COLUMNS:
+                code_type = self._code_type(field)
+                descriptors.append({'name': field, 'type': 'category', 'code_type': code_type,
+                                    'categories': list(self.categories[field]),
+                                    'offset': reserve((2 if code_type == 'int16' else 4) * self.count)})
+            else:
+                descriptors.append({'name': field, 'type': 'string',
+                                    'offset': reserve(4 * (self.count + 1)),
+                                    'data_offset': reserve(self.string_sizes[field]),
+                                    'data_length': self.string_sizes[field]})
+        
+        def pad(f, length):
+            f.write(b'\0' * (_align(length) - length))
+        
+        with open(filename, 'wb') as f:
+            _write_binary_header(f, self.count, self.statistics, descriptors)
+            for field in FIELDS:
+                if field in CATEGORY_COLUMNS:
+                    dtype = '<i2' if self._code_type(field) == 'int16' else '<i4'
+                    for codes in self._blocks(field):
+                        f.write(codes.astype(dtype).tobytes())
+                    pad(f, np.dtype(dtype).itemsize * self.count)
+                elif field in STRING_COLUMNS:
+                    f.write(np.zeros(1, dtype='<u4').tobytes())
+                    self.spools[field].seek(0)
+                    shutil.copyfileobj(self.spools[field], f)
+                    pad(f, 4 * (self.count + 1))
+                    self.string_data[field].seek(0)
+                    shutil.copyfileobj(self.string_data[field], f)
+                    pad(f, self.string_sizes[field])
+                else:
+                    self.spools[field].seek(0)
+                    shutil.copyfileobj(self.spools[field], f)
+                    pad(f, self.spools[field].tell())
+        return filename
+    
+    def write_columnar(self, filename):
+        """寫出與 save_parking_table_columnar 相同的欄式JSON"""
+        
+        def dump(value):
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        
+        def write_array(f, blocks):
+            f.write('[')
+            first = True
+            for values in blocks:
+                if not values:
+                    continue
+                if not first:
+                    f.write(',')
+                f.write(dump(values)[1:-1])
+                first = False
+            f.write(']')
+        
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(dump({'format': COLUMNAR_FORMAT, 'version': COLUMNAR_VERSION, 'count': self.count,
+                          'statistics': self.statistics})[:-1])
+            f.write(',"columns":{')
+            for k, field in enumerate(FIELDS):
+                if k:
+                    f.write(',')
+                f.write(f'{dump(field)}:')
+                if field in CATEGORY_COLUMNS:
+                    f.write(f'{{"categories":{dump(self.categories[field])},"codes":')
+                    write_array(f, (codes.tolist() for codes in self._blocks(field)))
+                    f.write('}')
+                elif field in STRING_COLUMNS:
+                    write_array(f, (
+                        [data[begin - start:end - start].decode('utf-8')
+                         for begin, end in zip([start] + ends[:-1].tolist(), ends.tolist())]
+                        for ends, data, start in self._string_blocks(field)
+                    ))
+                else:
+                    write_array(f, (values.tolist() for values in self._blocks(field)))
+            f.write('}}')
+        return filename
+
+def _table_from_binary(content):
+    magic, version, _, count, header_length = BINARY_PREAMBLE.unpack_from(content)
+    if magic != BINARY_MAGIC:
+        raise ValueError("不是停車場二進位資料檔")
+    if version != BINARY_VERSION:
+        raise ValueError(f"不支援的二進位資料版本: {version}")
+    
+    header_start = BINARY_PREAMBLE.size
+    header = json.loads(content[header_start:header_start + header_length].decode('utf-8'))
+    data_start = header_start + header_length
+    
+    # 數值與代碼欄位直接對應到檔案內容，不另外複製
+    columns = {}
+    for descriptor in header['columns']:
+        field = descriptor['name']
+        offset = data_start + descriptor['offset']
+        if descriptor['type'] == 'float64':
+            columns[field] = np.frombuffer(content, dtype='<f8', count=count, offset=offset)
+        elif descriptor['type'] == 'int32':
+            columns[field] = np.frombuffer(content, dtype='<i4', count=count, offset=offset)
+        elif descriptor['type'] == 'category':
+            dtype = '<i2' if descriptor['code_type'] == 'int16' else '<i4'
+            codes = np.frombuffer(content, dtype=dtype, count=count, offset=offset)
+            columns[field] = CategoryColumn(codes, descriptor['categories'])
+        elif descriptor['type'] == 'string':
+            offsets = np.frombuffer(content, dtype='<u4', count=count + 1, offset=offset).astype(np.int64)
+            data_offset = data_start + descriptor['data_offset']
+            buffer = content[data_offset:data_offset + descriptor['data_length']]
+            columns[field] = StringColumn(buffer, offsets)
+        else:
+            raise ValueError(f"未知的欄位型別: {descriptor['type']}")
+    return ParkingTable(columns)
+
+def _read_parking_file(filename):
+    """讀取任一格式的停車場資料檔，回傳 (ParkingTable 或 None, 原始JSON資料或 None)"""
+    # SQLite 資料庫由 parking_store 讀取（parking_store 依賴本模組，因此在此才匯入）
+    from parking_store import ParkingStore, is_store_file
+    if is_store_file(filename):
+        with ParkingStore(filename) as store:
+            return None, store.to_parking_data()
+    
+    with open(filename, 'rb') as f:
+        content = f.read()
+    if content.startswith(BINARY_MAGIC):
+        return _table_from_binary(content), None
+    
+    payload = json.loads(content.decode('utf-8'))
+    if isinstance(payload, dict) and payload.get('format') == COLUMNAR_FORMAT:
+        return _table_from_columnar(payload), None
+    return None, payload
+
+def read_parking_table(filename):
+    """讀取 parking_data.json、欄式JSON、二進位格式或 SQLite 資料庫（依內容自動判斷）為 ParkingTable"""
+    table, data = _read_parking_file(filename)
+    return table if table is not None else ParkingTable.from_parking_data(data)
+
+def read_parking_data(filename):
+    """讀取任一格式的停車場資料，回傳 parking_data.json 的資料結構"""
+    table, data = _read_parking_file(filename)
+    return table.to_parking_data() if table is not None else data
+
+def compact_filenames(filename):
+    """由 parking_data.json 檔名推得欄式JSON與二進位檔名"""
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}.columnar.json", f"{stem}.bin"
+
+def main():
+    parser = argparse.ArgumentParser(description='將 parking_data.json 轉換為欄式JSON與二進位格式')
+    parser.add_argument('input', nargs='?', default='parking_data.json', help='來源停車場資料檔')
+    args = parser.parse_args()
+    
+    table = read_parking_table(args.input)
+    columnar_file, binary_file = compact_filenames(args.input)
+    save_parking_table_columnar(table, columnar_file)
+    save_parking_table_binary(table, binary_file)
+    
+    # 比較檔案大小與載入時間
+    print(f"共 {len(table)} 筆停車場資料")
+    for filename in [args.input, columnar_file, binary_file]:
+        start = time.time()
+        read_parking_table(filename)
+        elapsed = time.time() - start
+        print(f"  {filename}: {os.path.getsize(filename) / 1024:.1f} KB，載入 {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
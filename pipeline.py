@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+import argparse
+import ast
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+
+import area_engine
+import area_reports
+import create_embedded_map
+import density_surface
+import fix_city_names
+import format_filtered_analysis
+import format_price_analysis
+import instrumentation
+import parking_store
+import parking_table
+import price_histogram
+import quantile_sketch
+import rollup_cube
+import simple_data_cleaner
+import uspace_area_analysis
+import uspace_area_analysis_filtered
+
+CACHE_DIR = '.pipeline_cache'
+# 記錄各檔案由哪個快取鍵寫出，檔案未變動且鍵相同時不需重新寫出
+ARTIFACT_MANIFEST = 'artifacts.json'
+# 專案內模組所在的目錄；快取鍵包含階段模組直接或間接匯入的所有專案內模組
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def file_hash(filename):
+    """計算檔案內容的SHA-256雜湊值"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def imported_module_names(filename):
+    """模組原始碼中 import 的模組名稱（含函數內的匯入）"""
+    with open(filename, 'rb') as f:
+        tree = ast.parse(f.read(), filename)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names.add(node.module)
+            # from package import module
+            names.update(f"{node.module}.{alias.name}" for alias in node.names)
+    return names
+
+def project_module_file(name):
+    """專案內模組的檔案路徑，不是專案內模組（標準函式庫、第三方套件）時回傳None"""
+    base = os.path.join(PROJECT_DIR, *name.split('.'))
+    for filename in (f"{base}.py", os.path.join(base, '__init__.py')):
+        if os.path.isfile(filename):
+            return filename
+    return None
+
+def module_closure(modules):
+    """模組及其直接或間接匯入的專案內模組檔案（排序後的相對路徑）"""
+    files = set()
+    pending = [module.__file__ for module in modules]
+    while pending:
+        filename = os.path.abspath(pending.pop())
+        if filename in files:
+            continue
+        files.add(filename)
+        for name in imported_module_names(filename):
+            dependency = project_module_file(name)
+            if dependency is not None:
+                pending.append(dependency)
+    return sorted(os.path.relpath(filename, PROJECT_DIR) for filename in files)
+
+def save_json(data, filename):
+    """儲存JSON檔案"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def save_text(text, filename):
+    """儲存文字檔案"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def build_stages(parking_json=None,
+                 uspace_csv=simple_data_cleaner.USPACE_CSV,
+                 external_csv=simple_data_cleaner.EXTERNAL_CSV):
+    """定義流程各階段（DAG）
+    
+    每個階段包含：
+      deps     - 依賴的上游階段，其輸出依序作為 run 的參數
+      run      - 執行函數
+      params   - 影響輸出的參數（納入快取鍵）
+      sources  - 讀取的來源檔案（內容雜湊納入快取鍵）
+      modules  - 實作所在模組（程式碼變更時快取失效）
+      artifact - (檔名, 寫出函數)，None 表示不產生檔案
+    """
+    if parking_json:
+        # 直接從既有的 parking_data.json 開始，不重新清洗CSV
+        parking_data_stage = {
+            'deps': [],
+            'run': lambda: parking_table.read_parking_data(parking_json),
+            'params': {'parking_json': parking_json},
+            'sources': [parking_json],
+            'modules': [parking_table],
+            'artifact': None
+        }
+    else:
+        parking_data_stage = {
+            'deps': [],
+            'run': lambda: simple_data_cleaner.build_parking_data(uspace_csv, external_csv),
+            'params': {'uspace_csv': uspace_csv, 'external_csv': external_csv},
+            'sources': [uspace_csv, external_csv],
+            'modules': [simple_data_cleaner],
+            'artifact': ('parking_data.json', simple_data_cleaner.save_parking_data)
+        }
+    
+    return {
+        'parking_data': parking_data_stage,
+        'parking_data_fixed': {
+            'deps': ['parking_data'],
+            'run': fix_city_names.normalize_parking_data,
+            'params': {},
+            'sources': [],
+            'modules': [fix_city_names],
+            'artifact': ('parking_data_fixed.json', save_json)
+        },
+        'parking_data_binary': {
+            'deps': ['parking_data'],
+            'run': parking_table.ParkingTable.from_parking_data,
+            'params': {},
+            'sources': [],
+            'modules': [parking_table],
+            'artifact': ('parking_data.bin', parking_table.save_parking_table_binary)
+        },
+        'parking_data_columnar': {
+            'deps': ['parking_data_binary'],
+            'run': lambda table: table,
+            'params': {},
+            'sources': [],
+            'modules': [],
+            'artifact': ('parking_data.columnar.json', parking_table.save_parking_table_columnar)
+        },
+        'parking_store': {
+            'deps': ['parking_data_binary'],
+            'run': lambda table: table,
+            'params': {},
+            'sources': [source for source in [parking_store.BUILDINGS_CSV] if os.path.exists(source)],
+            'modules': [parking_store, parking_table],
+            'artifact': ('parking_data.db', parking_store.save_parking_store)
+        },
+        'rollup': {
+            'deps': ['parking_data_fixed'],
+            'run': rollup_cube.RollupCube.from_parking_data,
+            'params': {},
+            'sources': [],
+            'modules': [rollup_cube, parking_table, price_histogram, quantile_sketch],
+            'artifact': ('parking_data_fixed.rollup.json', lambda cube, filename: cube.save(filename))
+        },
+        'density_surface': {
+            'deps': ['parking_data_fixed'],
+            'run': density_surface.DensitySurface.from_parking_data,
+            'params': {},
+            'sources': [],
+            'modules': [density_surface],
+            'artifact': (density_surface.HEATMAP_FILE, density_surface.save_heatmap)
+        },
+        'area_reports': {
+            'deps': ['parking_data_fixed'],
+            'run': area_reports.analyze_all_reports,
+            'params': {},
+            'sources': [],
+            'modules': [area_reports, area_engine, price_histogram, quantile_sketch, uspace_area_analysis,
+                        uspace_area_analysis_filtered],
+            'artifact': None
+        },
+        'area_analysis': {
+            'deps': ['area_reports'],
+            'run': lambda reports: reports['area'],
+            'params': {},
+            'sources': [],
+            'modules': [uspace_area_analysis, price_histogram],
+            'artifact': ('uspace_area_analysis.csv', lambda results, _: uspace_area_analysis.save_to_csv(results))
+        },
+        'area_analysis_filtered': {
+            'deps': ['area_reports'],
+            'run': lambda reports: reports['area_filtered'],
+            'params': {},
+            'sources': [],
+            'modules': [uspace_area_analysis_filtered, price_histogram],
+            'artifact': ('uspace_area_analysis_filtered.csv',
+                         lambda results, _: uspace_area_analysis_filtered.save_to_csv(results))
+        },
+        'price_range_analysis': {
+            'deps': ['area_analysis'],
+            'run': format_price_analysis.create_readable_format,
+            'params': {},
+            'sources': [],
+            'modules': [format_price_analysis, price_histogram],
+            'artifact': ('uspace_price_range_analysis.csv',
+                         lambda results, _: format_price_analysis.save_formatted_csv(results))
+        },
+        'filtered_price_analysis': {
+            'deps': ['area_analysis_filtered'],
+            'run': format_filtered_analysis.create_readable_filtered_format,
+            'params': {},
+            'sources': [],
+            'modules': [format_filtered_analysis, price_histogram],
+            'artifact': ('uspace_filtered_price_analysis.csv',
+                         lambda results, _: format_filtered_analysis.save_formatted_csv(results))
+        },
+        'embedded_map': {
+            'deps': ['parking_data_fixed'],
+            'run': create_embedded_map.render_embedded_map,
+            'params': {},
+            'sources': ['parking_map.html'],
+            'modules': [create_embedded_map],
+            'artifact': ('parking_map_embedded.html', save_text)
+        }
+    }
+
+def resolve_order(stages, targets):
+    """依相依關係排序，回傳執行目標所需的所有階段（拓撲排序）"""
+    order = []
+    visiting = set()
+    
+    def visit(name):
+        if name in order:
+            return
+        if name not in stages:
+            raise ValueError(f"未知的流程階段: {name}")
+        if name in visiting:
+            raise ValueError(f"流程階段出現循環相依: {name}")
+        visiting.add(name)
+        for dep in stages[name]['deps']:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+    
+    for target in targets:
+        visit(target)
+    return order
+
+def compute_cache_keys(stages, order):
+    """以輸入、參數與程式碼雜湊計算每個階段的快取鍵
+    
+    程式碼包含階段模組以及其直接或間接匯入的專案內模組，
+    修改任何被用到的模組（例如去重或距離計算）都會使快取失效。
+    """
+    keys = {}
+    code_hashes = {}
+    for name in order:
+        stage = stages[name]
+        code = {}
+        for filename in module_closure(stage['modules']):
+            if filename not in code_hashes:
+                code_hashes[filename] = file_hash(os.path.join(PROJECT_DIR, filename))
+            code[filename] = code_hashes[filename]
+        key_source = {
+            'stage': name,
+            'params': stage['params'],
+            'deps': [keys[dep] for dep in stage['deps']],
+            'sources': [file_hash(source) for source in stage['sources']],
+            'code': code
+        }
+        keys[name] = hashlib.sha256(
+            json.dumps(key_source, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+    return keys
+
+def cache_path(name, key):
+    return os.path.join(CACHE_DIR, f"{name}-{key[:16]}.pkl")
+
+def missing_sources(stages, order):
+    """執行這些階段需要但不存在的來源檔案"""
+    missing = []
+    for name in order:
+        for source in stages[name]['sources']:
+            if not os.path.exists(source) and source not in missing:
+                missing.append(source)
+    return missing
+
+def artifact_signature(filename):
+    """檔案的大小與修改時間，檔案不存在時回傳None"""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_artifact_manifest():
+    try:
+        with open(os.path.join(CACHE_DIR, ARTIFACT_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def artifact_current(manifest, filename, key):
+    """檔案是否由相同快取鍵寫出且之後未被修改"""
+    entry = manifest.get(filename)
+    return entry is not None and entry['key'] == key and entry['file'] == artifact_signature(filename)
+
+def run_pipeline(stages, targets, write=None, use_cache=True):
+    """在同一個行程內執行流程，各階段之間直接以記憶體傳遞資料
+    
+    write 為需要寫出檔案的階段名稱集合（None 表示全部），檔案在所有階段完成後才寫出。
+    使用快取時，檔案已由相同快取鍵寫出且未被修改的階段不會載入也不會重新寫出。
+    回傳實際載入或計算的 {階段名稱: 輸出}。
+    """
+    order = resolve_order(stages, targets)
+    keys = compute_cache_keys(stages, order)
+    manifest = load_artifact_manifest() if use_cache else {}
+    
+    def writes(name):
+        return stages[name]['artifact'] is not None and (write is None or name in write)
+    
+    def cached(name):
+        return use_cache and os.path.exists(cache_path(name, keys[name]))
+    
+    current = {name for name in order
+               if writes(name) and artifact_current(manifest, stages[name]['artifact'][0], keys[name])}
+    
+    # 需要寫出且檔案不是最新的階段，以及沒有快取結果的其他目標；再由下游往上游加入需要的輸入
+    needed = set()
+    for name in order:
+        if writes(name):
+            if name not in current:
+                needed.add(name)
+        elif name in targets and not cached(name):
+            needed.add(name)
+    for name in reversed(order):
+        if name in needed and not cached(name):
+            needed.update(stages[name]['deps'])
+    
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    
+    outputs = {}
+    for name in order:
+        if name not in needed:
+            if name in current:
+                print(f"[{name}] {stages[name]['artifact'][0]} 已是最新，略過")
+            else:
+                print(f"[{name}] 快取有效，略過")
+            continue
+        
+        stage = stages[name]
+        path = cache_path(name, keys[name])
+        if use_cache and os.path.exists(path):
+            with open(path, 'rb') as f:
+                outputs[name] = pickle.load(f)
+            print(f"[{name}] 使用快取 {path}")
+            continue
+        
+        print(f"[{name}] 執行中...")
+        with instrumentation.stage(name) as record:
+            result = stage['run'](*[outputs[dep] for dep in stage['deps']])
+        if result is None:
+            raise RuntimeError(f"流程階段 {name} 沒有產生輸出")
+        outputs[name] = result
+        print(f"[{name}] 完成，耗時 {record['wall_s']:.2f} 秒")
+        
+        if use_cache:
+            with open(path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    # 所有階段完成後才寫出檔案
+    for name in order:
+        if not writes(name) or name in current or name not in outputs:
+            continue
+        filename, writer = stages[name]['artifact']
+        writer(outputs[name], filename)
+        print(f"[{name}] 已寫出 {filename}")
+        manifest[filename] = {'stage': name, 'key': keys[name], 'file': artifact_signature(filename)}
+    
+    if use_cache:
+        with open(os.path.join(CACHE_DIR, ARTIFACT_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser(description='以單一行程執行停車場資料處理流程')
+    parser.add_argument('targets', nargs='*',
+                        help='要執行的階段（預設為全部），相依的上游階段會自動加入')
+    parser.add_argument('--parking-json',
+                        help='從既有的停車場資料檔（JSON、欄式JSON或二進位）開始，略過CSV清洗階段')
+    parser.add_argument('--uspace-csv', default=simple_data_cleaner.USPACE_CSV,
+                        help='USpace停車場CSV路徑')
+    parser.add_argument('--external-csv', default=simple_data_cleaner.EXTERNAL_CSV,
+                        help='外部停車場CSV路徑')
+    parser.add_argument('--write', default='all',
+                        help="要寫出檔案的階段，以逗號分隔；'all' 全部寫出，'none' 不寫出")
+    parser.add_argument('--no-cache', action='store_true', help='不使用也不更新階段快取')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+    
+    stages = build_stages(args.parking_json, args.uspace_csv, args.external_csv)
+    targets = args.targets or list(stages)
+    
+    # 來源檔案不存在時直接說明，不在計算快取鍵時才失敗
+    missing = missing_sources(stages, resolve_order(stages, targets))
+    if missing:
+        for source in missing:
+            print(f"找不到檔案: {source}")
+        print("請以 --uspace-csv / --external-csv 指定來源CSV，或以 --parking-json 從既有的停車場資料開始")
+        sys.exit(1)
+    
+    if args.write == 'all':
+        write = None
+    elif args.write == 'none':
+        write = set()
+    else:
+        write = set(args.write.split(','))
+    
+    start = time.time()
+    run_pipeline(stages, targets, write=write, use_cache=not args.no_cache)
+    print(f"\n流程完成！總耗時 {time.time() - start:.2f} 秒")
+    
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
+
+if __name__ == "__main__":
+    main()
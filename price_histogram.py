@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import numpy as np
+
+# 價格區間的上界（元，含上界），超過最後一個上界者歸入最高區間
+PRICE_BIN_EDGES = (30, 50, 80, 120, 200)
+NO_RATE_LABEL = '無收費資訊'
+
+# 低價競爭者：區間上界不超過此金額；高價競爭者：區間下界不低於此金額
+LOW_PRICE_MAX = 50
+HIGH_PRICE_MIN = 120
+
+# 舊版分析結果只有文字摘要欄位（histogram_text 的格式），讀取時作為備援
+HISTOGRAM_TEXT_FIELDS = ('周邊停車場價格區間分布', '周邊停車場價格區間分布_按最高費率')
+
+def price_bin_labels(edges=PRICE_BIN_EDGES):
+    """價格區間名稱，例如 ['0-30元', '31-50元', ..., '200元以上']"""
+    labels = [f"0-{edges[0]:g}元"]
+    labels.extend(f"{low + 1:g}-{high:g}元" for low, high in zip(edges[:-1], edges[1:]))
+    labels.append(f"{edges[-1]:g}元以上")
+    return labels
+
+def histogram_labels(edges=PRICE_BIN_EDGES, include_no_rate=False):
+    return price_bin_labels(edges) + ([NO_RATE_LABEL] if include_no_rate else [])
+
+def histogram_field(label):
+    """價格區間在分析結果中的欄位名稱"""
+    return f"{label}停車場數"
+
+def histogram_fieldnames(edges=PRICE_BIN_EDGES, include_no_rate=False):
+    return [histogram_field(label) for label in histogram_labels(edges, include_no_rate)]
+
+def low_price_labels(edges=PRICE_BIN_EDGES):
+    return [label for label, high in zip(price_bin_labels(edges), edges) if high <= LOW_PRICE_MAX]
+
+def high_price_labels(edges=PRICE_BIN_EDGES):
+    lows = (0,) + tuple(edges)
+    return [label for label, low in zip(price_bin_labels(edges), lows) if low >= HIGH_PRICE_MIN]
+
+def price_histogram(rates, edges=PRICE_BIN_EDGES, include_no_rate=False):
+    """將費率分到各價格區間，回傳依區間順序排列的 {區間名稱: 停車場數}
+    
+    以 searchsorted 一次完成分組。include_no_rate 時，費率為0或缺值者
+    另計為「無收費資訊」；否則依數值歸入最低區間。
+    """
+    rates = np.array([rate or 0 for rate in rates], dtype=np.float64)
+    if include_no_rate:
+        no_rate_count = int(np.count_nonzero(rates <= 0))
+        rates = rates[rates > 0]
+    
+    # side='left' 使剛好等於上界的費率歸入該區間（含上界）
+    bins = np.searchsorted(np.asarray(edges, dtype=np.float64), rates, side='left')
+    counts = np.bincount(bins, minlength=len(edges) + 1).tolist()
+    
+    histogram = dict(zip(price_bin_labels(edges), counts))
+    if include_no_rate:
+        histogram[NO_RATE_LABEL] = no_rate_count
+    return histogram
+
+def histogram_columns(histogram):
+    """將價格區間分布轉為分析結果的數值欄位"""
+    return {histogram_field(label): count for label, count in histogram.items()}
+
+def histogram_text(histogram):
+    """價格區間分布的文字摘要，例如 '0-30元:51場; 31-50元:44場'"""
+    summary = [f"{label}:{count}場" for label, count in histogram.items() if count > 0]
+    return '; '.join(summary) if summary else '無資料'
+
+def parse_histogram_text(text, edges=PRICE_BIN_EDGES, include_no_rate=False):
+    """解析 histogram_text 的文字摘要；未列出的區間為0，'無資料' 表示全部為0"""
+    histogram = dict.fromkeys(histogram_labels(edges, include_no_rate), 0)
+    if text.strip() in ('', '無資料'):
+        return histogram
+    for item in text.split(';'):
+        label, _, count = item.strip().rpartition(':')
+        if label not in histogram or not count.endswith('場'):
+            raise ValueError(f"無法解析價格區間分布: {text}")
+        histogram[label] = int(count[:-1])
+    return histogram
+
+def read_histogram(row, edges=PRICE_BIN_EDGES, include_no_rate=False):
+    """由分析結果列（記憶體中的數值或CSV讀回的字串）取得價格區間分布
+    
+    舊版分析結果沒有各區間的數值欄位時，改為解析文字摘要欄位；
+    兩者都沒有時請重新執行區域分析。
+    """
+    labels = histogram_labels(edges, include_no_rate)
+    if all(histogram_field(label) in row for label in labels):
+        return {label: int(row[histogram_field(label)]) for label in labels}
+    for field in HISTOGRAM_TEXT_FIELDS:
+        if field in row:
+            return parse_histogram_text(row[field], edges, include_no_rate)
+    raise ValueError(f"分析結果缺少價格區間欄位 {histogram_field(labels[0])}，請重新執行區域分析"
+                     "（uspace_area_analysis.py / uspace_area_analysis_filtered.py）")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+import math
+
+import numpy as np
+
+# 分位數的相對誤差上限（0.005 表示回傳值與真實分位數相差不超過0.5%）
+RELATIVE_ACCURACY = 0.005
+SKETCH_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+
+# 計算分位數的費率欄位：(停車場欄位, 報表欄位名稱)
+RATE_QUANTILE_FIELDS = [
+    ('day_rate', '日間臨停費率'),
+    ('night_rate', '夜間臨停費率'),
+    ('monthly_rate', '月租金額')
+]
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+def quantile_label(q):
+    return f"P{round(q * 100)}"
+
+def quantile_fieldnames(prefix, quantiles=SKETCH_QUANTILES):
+    """分位數欄位名稱，例如 '周邊日間臨停費率P50'"""
+    return [f'{prefix}{name}{quantile_label(q)}' for _, name in RATE_QUANTILE_FIELDS for q in quantiles]
+
+def sketch_keys(values):
+    """對數分桶鍵值與正值遮罩；非正值（含缺值）不屬於任何桶，遮罩為False"""
+    values = np.asarray(values, dtype=np.float64)
+    positive = values > 0
+    keys = np.zeros(len(values), dtype=np.int64)
+    keys[positive] = np.ceil(np.log(values[positive]) / _LOG_GAMMA).astype(np.int64)
+    return keys, positive
+
+def key_values(keys):
+    """分桶鍵值對應的代表值（該桶上下界的調和中點，相對誤差不超過 RELATIVE_ACCURACY）"""
+    return 2 * np.power(_GAMMA, np.asarray(keys, dtype=np.float64)) / (_GAMMA + 1)
+
+def histogram_quantiles(counts, offset, quantiles=SKETCH_QUANTILES):
+    """由分桶計數（可為二維，每列一個草圖）計算分位數，沒有資料的列回傳0"""
+    counts = np.atleast_2d(counts)
+    result = np.zeros((len(counts), len(quantiles)), dtype=np.float64)
+    if counts.shape[1] == 0:
+        return result
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    for j, q in enumerate(quantiles):
+        # 以 q*(n-1) 為排名，取第一個累計數量超過此排名的分桶
+        ranks = q * (totals - 1)
+        buckets = (cumulative > ranks[:, None]).argmax(axis=1)
+        result[:, j] = np.where(totals > 0, key_values(buckets + offset), 0.0)
+    return result
+
+class QuantileSketch:
+    """可合併的串流分位數草圖（DDSketch 式的對數分桶）
+    
+    每個正值依 log(值)/log(gamma) 分到一個桶，只記錄各桶的數量；
+    兩個草圖合併時只需將桶的數量相加，不需要回頭讀取原始資料。
+    counts[i] 為鍵值 offset + i 的桶的數量。
+    """
+    
+    def __init__(self, offset=0, counts=None):
+        self.offset = offset
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    
+    @classmethod
+    def from_values(cls, values):
+        keys, positive = sketch_keys(values)
+        keys = keys[positive]
+        if len(keys) == 0:
+            return cls()
+        offset = int(keys.min())
+        return cls(offset, np.bincount(keys - offset))
+    
+    @property
+    def count(self):
+        return int(self.counts.sum())
+    
+    def merge(self, other):
+        """將另一個草圖併入（就地修改），回傳自己"""
+        if not len(other.counts):
+            return self
+        if not len(self.counts):
+            self.offset, self.counts = other.offset, other.counts.copy()
+            return self
+        offset = min(self.offset, other.offset)
+        end = max(self.offset + len(self.counts), other.offset + len(other.counts))
+        counts = np.zeros(end - offset, dtype=np.int64)
+        counts[self.offset - offset:self.offset - offset + len(self.counts)] += self.counts
+        counts[other.offset - offset:other.offset - offset + len(other.counts)] += other.counts
+        self.offset, self.counts = offset, counts
+        return self
+    
+    def quantiles(self, quantiles=SKETCH_QUANTILES):
+        return histogram_quantiles(self.counts, self.offset, quantiles)[0].tolist()
+    
+    def quantile(self, q):
+        return self.quantiles((q,))[0]
+    
+    def to_list(self):
+        """以 [鍵值, 數量, 鍵值, 數量, ...] 的稀疏形式輸出，供寫入JSON"""
+        nonzero = np.flatnonzero(self.counts)
+        pairs = np.empty(2 * len(nonzero), dtype=np.int64)
+        pairs[0::2] = nonzero + self.offset
+        pairs[1::2] = self.counts[nonzero]
+        return pairs.tolist()
+    
+    @classmethod
+    def from_list(cls, pairs):
+        if not pairs:
+            return cls()
+        keys = np.asarray(pairs[0::2], dtype=np.int64)
+        offset = int(keys.min())
+        counts = np.zeros(int(keys.max()) - offset + 1, dtype=np.int64)
+        counts[keys - offset] = pairs[1::2]
+        return cls(offset, counts)
+
+def sketch_codes(values):
+    """將費率轉成分桶代碼，回傳 (代碼陣列, offset, 桶數)
+    
+    代碼為鍵值減去 offset，沒有費率者為 -1；之後任何子集合的草圖
+    都只需對代碼做 bincount，不必排序費率。
+    """
+    keys, positive = sketch_keys(values)
+    if not positive.any():
+        return np.full(len(keys), -1, dtype=np.int64), 0, 1
+    offset = int(keys[positive].min())
+    bucket_count = int(keys[positive].max()) - offset + 1
+    return np.where(positive, keys - offset, -1), offset, bucket_count
+
+def build_quantile_columns(parking_list):
+    """預先將每個停車場的各費率轉成陣列，回傳 {欄位: 費率陣列}（缺值為0）"""
+    return {
+        field: np.array([float(parking.get(field) or 0) for parking in parking_list], dtype=np.float64)
+        for field, _ in RATE_QUANTILE_FIELDS
+    }
+
+def exact_quantiles(rates, quantiles=SKETCH_QUANTILES):
+    """正值費率的精確分位數（np.quantile 線性內插），沒有正值時皆為0
+    
+    單一停車場周邊的停車場數量不多，直接計算精確值；
+    草圖只用於需要合併的彙總（rollup_cube）。
+    """
+    rates = rates[rates > 0]
+    if len(rates) == 0:
+        return [0.0] * len(quantiles)
+    return np.quantile(rates, quantiles).tolist()
+
+def quantile_metrics(indices, quantile_columns, prefix, quantiles=SKETCH_QUANTILES):
+    """計算停車場子集合各費率的精確分位數欄位（四捨五入到小數第2位，無資料為0）"""
+    metrics = {}
+    for field, name in RATE_QUANTILE_FIELDS:
+        values = exact_quantiles(quantile_columns[field][np.asarray(indices, dtype=np.int64)], quantiles)
+        for q, value in zip(quantiles, values):
+            metrics[f'{prefix}{name}{quantile_label(q)}'] = round(value, 2)
+    return metrics
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from quantile_sketch import (RATE_QUANTILE_FIELDS, SKETCH_QUANTILES, exact_quantiles, quantile_fieldnames,
+                             quantile_label)
+
+# 每個半徑圈計算平均值的費率欄位：(停車場欄位, 報表欄位名稱)
+RING_RATE_FIELDS = [
+    ('day_rate', '平均日間臨停費率'),
+    ('night_rate', '平均夜間臨停費率'),
+    ('monthly_rate', '平均月租金額')
+]
+
+def circle_area_km2(radius_km):
+    """圓形面積（平方公里），沿用既有報表以3.14近似圓周率"""
+    return 3.14 * radius_km * radius_km
+
+def parse_radii(text):
+    """解析以逗號分隔的半徑（公里），回傳由小到大排序且不重複的清單"""
+    radii = sorted({float(value) for value in text.split(',') if value.strip()})
+    if not radii or radii[0] <= 0:
+        raise ValueError(f"半徑必須為正數: {text}")
+    return radii
+
+def radius_label(radius_km):
+    return f"{radius_km:g}km"
+
+def ring_fieldnames(radii):
+    """各半徑圈統計欄位名稱，依半徑由小到大排列"""
+    fieldnames = []
+    for radius_km in radii:
+        label = radius_label(radius_km)
+        fieldnames.append(f'{label}內外部停車場數量')
+        fieldnames.append(f'{label}內外部停車場總車格數')
+        fieldnames.extend(f'{label}內{name}' for _, name in RING_RATE_FIELDS)
+        fieldnames.extend(quantile_fieldnames(f'{label}內'))
+        fieldnames.append(f'{label}競爭密度_每平方公里外部停車場數')
+    return fieldnames
+
+def build_ring_columns(external_parking):
+    """將外部停車場的車格數與費率轉成陣列，非正值（含缺值）記為0，不納入平均"""
+    columns = {}
+    for field in ['space_number'] + [field for field, _ in RING_RATE_FIELDS]:
+        values = np.array([float(parking.get(field) or 0) for parking in external_parking], dtype=np.float64)
+        columns[field] = np.where(values > 0, values, 0.0)
+    return columns
+
+def ring_metrics(indices, distances, ring_columns, radii, quantile_columns=None):
+    """一次計算所有半徑圈的數量、車格數、平均費率、費率分位數與競爭密度
+    
+    indices / distances 為候選外部停車場的索引與距離（需涵蓋最大半徑）。
+    依距離排序後計算累加和，每個半徑只需以二分搜尋找到圈內筆數，
+    不必為每個半徑重新篩選。quantile_columns 為 build_quantile_columns
+    的結果，提供時一併計算各圈的費率分位數。
+    """
+    order = np.argsort(distances, kind='stable')
+    sorted_indices = np.asarray(indices)[order]
+    ring_counts = np.searchsorted(np.asarray(distances)[order], radii, side='right').tolist()
+    
+    # 累加和的第k個元素為最近k個停車場的合計
+    totals = {}
+    positive_counts = {}
+    for field, values in ring_columns.items():
+        selected = values[sorted_indices]
+        totals[field] = np.r_[0.0, np.cumsum(selected)]
+        positive_counts[field] = np.r_[0, np.cumsum(selected > 0)]
+    
+    # 各圈的精確分位數：圈內為依距離排序後的前 count 筆
+    ring_quantiles = {}
+    if quantile_columns is not None:
+        for field, _ in RATE_QUANTILE_FIELDS:
+            rates = quantile_columns[field][sorted_indices]
+            ring_quantiles[field] = [exact_quantiles(rates[:count]) for count in ring_counts]
+    
+    metrics = {}
+    for i, (radius_km, count) in enumerate(zip(radii, ring_counts)):
+        label = radius_label(radius_km)
+        metrics[f'{label}內外部停車場數量'] = count
+        metrics[f'{label}內外部停車場總車格數'] = int(totals['space_number'][count])
+        for field, name in RING_RATE_FIELDS:
+            rate_count = positive_counts[field][count]
+            average = totals[field][count] / rate_count if rate_count else 0
+            metrics[f'{label}內{name}'] = round(float(average), 2) if average > 0 else 0
+        for field, name in RATE_QUANTILE_FIELDS:
+            for q, value in zip(SKETCH_QUANTILES, ring_quantiles[field][i] if ring_quantiles else []):
+                metrics[f'{label}內{name}{quantile_label(q)}'] = round(value, 2)
+        metrics[f'{label}競爭密度_每平方公里外部停車場數'] = round(count / circle_area_km2(radius_km), 2)
+    return metrics
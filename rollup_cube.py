@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+
+from parking_table import ParkingTable, RATE_COLUMNS, read_parking_table
+from price_histogram import PRICE_BIN_EDGES, histogram_labels
+from quantile_sketch import SKETCH_QUANTILES, QuantileSketch, histogram_quantiles, sketch_codes
+
+# 彙總維度；'*' 表示該維度已彙總（全部）
+DIMENSIONS = ('city', 'district', 'source', 'price_band')
+ALL = '*'
+ROLLUP_VERSION = 2
+QUANTILES = SKETCH_QUANTILES
+
+# 每個格子的度量，依序存放於檔案中；{費率}_sketch 為可合併的分位數草圖
+MEASURES = ['count', 'spaces'] + [
+    f'{field}_{measure}' for field in RATE_COLUMNS for measure in ('sum', 'count', 'quantiles', 'sketch')
+]
+# 合併兩個立方體時直接相加的度量
+ADDITIVE_MEASURES = ['count', 'spaces'] + [
+    f'{field}_{measure}' for field in RATE_COLUMNS for measure in ('sum', 'count')
+]
+
+def rollup_filename(data_filename):
+    """彙總檔與資料檔放在一起，例如 parking_data_fixed.json -> parking_data_fixed.rollup.json"""
+    return f"{os.path.splitext(data_filename)[0]}.rollup.json"
+
+def price_band_codes(day_rates, edges=PRICE_BIN_EDGES):
+    """以日間費率分出價格帶代碼，對應 histogram_labels(edges, include_no_rate=True)"""
+    codes = np.searchsorted(np.asarray(edges, dtype=np.float64), day_rates, side='left')
+    return np.where(day_rates > 0, codes, len(edges) + 1)
+
+def _quantile_list(quantiles, count):
+    """草圖分位數（四捨五入到小數第2位），沒有正值時為 None"""
+    return [round(float(q), 2) for q in quantiles] if count else None
+
+def _merge_cells(left, right):
+    """合併兩個格子的度量：數量與總和相加，分位數由合併後的草圖重新計算"""
+    cell = {measure: left[measure] + right[measure] for measure in ADDITIVE_MEASURES}
+    for field in RATE_COLUMNS:
+        cell[f'{field}_sum'] = round(cell[f'{field}_sum'], 6)
+        sketch = QuantileSketch.from_list(left[f'{field}_sketch'])
+        sketch.merge(QuantileSketch.from_list(right[f'{field}_sketch']))
+        cell[f'{field}_quantiles'] = _quantile_list(sketch.quantiles(QUANTILES), sketch.count)
+        cell[f'{field}_sketch'] = sketch.to_list()
+    return cell
+
+class RollupCube:
+    """城市 × 區域 × 來源 × 價格帶的彙總立方體
+    
+    建立時一次算出所有維度組合（含彙總的 '*'）的度量，查詢時直接以鍵取得，
+    不需重新掃描停車場資料。費率分位數以 QuantileSketch 近似，
+    不同分片建立的立方體可以 merge 合併。
+    """
+    
+    def __init__(self, cells, price_bins=PRICE_BIN_EDGES):
+        self.cells = cells
+        self.price_bins = tuple(price_bins)
+        # 依「哪些維度未彙總」分組，供 breakdown 使用
+        self.patterns = {}
+        for key in cells:
+            pattern = tuple(value != ALL for value in key)
+            self.patterns.setdefault(pattern, []).append(key)
+    
+    @classmethod
+    def build(cls, table, price_bins=PRICE_BIN_EDGES):
+        """由 ParkingTable 建立彙總立方體"""
+        builder = RollupBuilder(price_bins)
+        builder.add(table)
+        return builder.build()
+    
+    @classmethod
+    def from_parking_data(cls, data, price_bins=PRICE_BIN_EDGES):
+        return cls.build(ParkingTable.from_parking_data(data), price_bins)
+    
+    def _key(self, filters):
+        unknown = set(filters) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"未知的彙總維度: {', '.join(sorted(unknown))}")
+        return tuple(filters.get(dimension, ALL) for dimension in DIMENSIONS)
+    
+    def get(self, **filters):
+        """取得指定維度值的度量，未指定的維度視為全部；沒有資料時回傳None
+        
+        例如 cube.get(city='台北市', source='external')
+        """
+        return self.cells.get(self._key(filters))
+    
+    def count(self, **filters):
+        cell = self.get(**filters)
+        return cell['count'] if cell else 0
+    
+    def average(self, field, **filters):
+        """指定費率欄位（僅計正值）的平均，沒有資料時回傳0"""
+        cell = self.get(**filters)
+        if not cell or not cell[f'{field}_count']:
+            return 0
+        return cell[f'{field}_sum'] / cell[f'{field}_count']
+    
+    def quantiles(self, field, **filters):
+        """指定費率欄位的 QUANTILES 分位數（近似值），沒有資料時回傳None"""
+        cell = self.get(**filters)
+        return cell[f'{field}_quantiles'] if cell else None
+    
+    def merge(self, other):
+        """合併另一個（例如其他分片資料建立的）立方體，回傳新的立方體
+        
+        數量與總和直接相加，分位數由合併後的草圖重新計算，不需讀取原始停車場資料。
+        """
+        if tuple(other.price_bins) != self.price_bins:
+            raise ValueError("價格帶設定不同的彙總立方體無法合併")
+        cells = {}
+        for key in list(self.cells) + [key for key in other.cells if key not in self.cells]:
+            left, right = self.cells.get(key), other.cells.get(key)
+            cells[key] = dict(left or right) if left is None or right is None else _merge_cells(left, right)
+        return RollupCube(cells, self.price_bins)
+    
+    def rename(self, dimension, mapping):
+        """將某個維度的值依 mapping 改名（例如統一城市名稱），回傳新的立方體
+        
+        改名後鍵相同的格子以 merge 相同的方式合併，不需讀取原始停車場資料。
+        """
+        position = DIMENSIONS.index(dimension)
+        cells = {}
+        for key, cell in self.cells.items():
+            value = key[position]
+            key = key[:position] + (mapping.get(value, value),) + key[position + 1:]
+            cells[key] = _merge_cells(cells[key], cell) if key in cells else dict(cell)
+        return RollupCube(cells, self.price_bins)
+    
+    def breakdown(self, dimension, **filters):
+        """依某個維度展開，回傳 {維度值: 度量}，其餘維度依 filters 固定"""
+        key = self._key(filters)
+        position = DIMENSIONS.index(dimension)
+        pattern = tuple(value != ALL or i == position for i, value in enumerate(key))
+        return {
+            cell_key[position]: self.cells[cell_key]
+            for cell_key in self.patterns.get(pattern, [])
+            if all(value == ALL or i == position or cell_key[i] == value for i, value in enumerate(key))
+        }
+    
+    def save(self, filename):
+        """以緊湊的JSON寫出：每個格子為 [維度值..., 度量...]"""
+        payload = {
+            'version': ROLLUP_VERSION,
+            'dimensions': list(DIMENSIONS),
+            'measures': MEASURES,
+            'price_bins': list(self.price_bins),
+            'cells': [list(key) + [cell[measure] for measure in MEASURES] for key, cell in self.cells.items()]
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+        return filename
+    
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        if payload.get('version') != ROLLUP_VERSION:
+            raise ValueError(f"不支援的彙總檔版本: {payload.get('version')}")
+        
+        width = len(payload['dimensions'])
+        cells = {
+            tuple(row[:width]): dict(zip(payload['measures'], row[width:]))
+            for row in payload['cells']
+        }
+        return cls(cells, payload['price_bins'])
+    
+    @classmethod
+    def load_current(cls, data_filename):
+        """載入資料檔旁的彙總檔；彙總檔不存在、版本不符或比資料檔舊時回傳None"""
+        filename = rollup_filename(data_filename)
+        try:
+            if os.path.getmtime(filename) < os.path.getmtime(data_filename):
+                return None
+            return cls.load(filename)
+        except (OSError, ValueError):
+            return None
+
+def _align_histograms(histograms, offset, start, width):
+    """將分桶計數移到以 start 為起點、寬度為 width 的範圍"""
+    aligned = np.zeros((len(histograms), width), dtype=np.int64)
+    if histograms.shape[1]:
+        aligned[:, offset - start:offset - start + histograms.shape[1]] = histograms
+    return aligned
+
+class RollupBuilder:
+    """分批累積彙總立方體
+    
+    只保留最細分組（城市 × 區域 × 來源 × 價格帶皆保留）的數量、車位數、費率總和與筆數，
+    以及分位數草圖的分桶計數，大小只與維度組合數有關、與資料筆數無關；
+    build() 時才由最細分組合併出所有維度組合。RollupCube.build 即為只加入一批的情形。
+    """
+    
+    def __init__(self, price_bins=PRICE_BIN_EDGES):
+        self.price_bins = tuple(price_bins)
+        # 城市、區域、來源的類別依第一次出現的順序編碼（與 ParkingTable.concat 相同）
+        self.categories = [[] for _ in DIMENSIONS[:-1]]
+        self.lookups = [{} for _ in DIMENSIONS[:-1]]
+        self.keys = np.empty((0, len(DIMENSIONS)), dtype=np.int64)
+        self.measures = {measure: np.zeros(0, dtype=np.float64) for measure in ADDITIVE_MEASURES}
+        # 每個費率欄位：(最細分組 × 分桶 的計數, 第一個分桶的鍵值)
+        self.histograms = {field: (np.zeros((0, 0), dtype=np.int64), 0) for field in RATE_COLUMNS}
+    
+    def _codes(self, table):
+        codes = []
+        for d, dimension in enumerate(DIMENSIONS[:-1]):
+            column = table[dimension]
+            lookup = self.lookups[d]
+            for category in column.categories:
+                if category not in lookup:
+                    lookup[category] = len(self.categories[d])
+                    self.categories[d].append(category)
+            remap = np.array([lookup[category] for category in column.categories], dtype=np.int64)
+            codes.append(remap[column.codes])
+        codes.append(price_band_codes(table['day_rate'], self.price_bins))
+        return codes
+    
+    def add(self, table):
+        """加入一批停車場資料（ParkingTable）"""
+        if len(table) == 0:
+            return
+        keys, groups = np.unique(np.column_stack(self._codes(table)), axis=0, return_inverse=True)
+        groups = groups.ravel()
+        spaces = np.where(table['space_number'] > 0, table['space_number'], 0).astype(np.float64)
+        measures = {
+            'count': np.bincount(groups, minlength=len(keys)).astype(np.float64),
+            'spaces': np.bincount(groups, weights=spaces, minlength=len(keys))
+        }
+        histograms = {}
+        for field in RATE_COLUMNS:
+            rates = table[field]
+            positive = rates > 0
+            measures[f'{field}_sum'] = np.bincount(groups, weights=np.where(positive, rates, 0), minlength=len(keys))
+            measures[f'{field}_count'] = np.bincount(groups, weights=positive, minlength=len(keys))
+            codes, offset, bucket_count = sketch_codes(rates)
+            rated = codes >= 0
+            if not rated.any():
+                bucket_count = 0
+            histograms[field] = (np.bincount(
+                groups[rated] * bucket_count + codes[rated], minlength=len(keys) * bucket_count
+            ).reshape(len(keys), bucket_count), offset)
+        
+        # 與先前各批的最細分組合併
+        self.keys, parents = np.unique(np.vstack([self.keys, keys]), axis=0, return_inverse=True)
+        parents = parents.ravel()
+        for measure in ADDITIVE_MEASURES:
+            self.measures[measure] = np.bincount(
+                parents, weights=np.concatenate([self.measures[measure], measures[measure]]), minlength=len(self.keys)
+            )
+        for field in RATE_COLUMNS:
+            parts = [part for part in (self.histograms[field], histograms[field]) if part[0].shape[1]]
+            start = min((offset for _, offset in parts), default=0)
+            width = max((offset + counts.shape[1] for counts, offset in parts), default=start) - start
+            merged = np.zeros((len(self.keys), width), dtype=np.int64)
+            np.add.at(merged, parents, np.vstack([
+                _align_histograms(counts, offset, start, width)
+                for counts, offset in (self.histograms[field], histograms[field])
+            ]))
+            self.histograms[field] = (merged, start)
+    
+    def build(self):
+        """由最細分組彙總出所有維度組合（含彙總的 '*'），回傳 RollupCube"""
+        cells = {}
+        if len(self.keys) == 0:
+            return RollupCube(cells, self.price_bins)
+        
+        labels = self.categories + [histogram_labels(self.price_bins, include_no_rate=True)]
+        # 對每一種維度組合（2^4 種）分組計算：每個最細分組屬於此維度組合的哪一組
+        for kept in itertools.product([True, False], repeat=len(DIMENSIONS)):
+            if any(kept):
+                group_keys, parents = np.unique(self.keys[:, list(kept)], axis=0, return_inverse=True)
+                parents = parents.ravel()
+            else:
+                group_keys = np.empty((1, 0), dtype=np.int64)
+                parents = np.zeros(len(self.keys), dtype=np.int64)
+            group_count = len(group_keys)
+            
+            def total(measure):
+                return np.bincount(parents, weights=self.measures[measure], minlength=group_count)
+            
+            measures = {
+                'count': total('count').astype(np.int64).tolist(),
+                'spaces': total('spaces').astype(np.int64).tolist()
+            }
+            for field in RATE_COLUMNS:
+                measures[f'{field}_sum'] = np.round(total(f'{field}_sum'), 6).tolist()
+                measures[f'{field}_count'] = total(f'{field}_count').astype(np.int64).tolist()
+                
+                finest_histograms, offset = self.histograms[field]
+                histograms = np.zeros((group_count, finest_histograms.shape[1]), dtype=np.int64)
+                np.add.at(histograms, parents, finest_histograms)
+                measures[f'{field}_quantiles'] = [
+                    _quantile_list(quantiles, count)
+                    for quantiles, count in zip(histogram_quantiles(histograms, offset, QUANTILES).tolist(),
+                                                measures[f'{field}_count'])
+                ]
+                measures[f'{field}_sketch'] = [QuantileSketch(offset, row).to_list() for row in histograms]
+            
+            for g, group_key in enumerate(group_keys.tolist()):
+                codes = iter(group_key)
+                key = tuple(
+                    dimension_labels[next(codes)] if keep else ALL
+                    for dimension_labels, keep in zip(labels, kept)
+                )
+                cells[key] = {measure: measures[measure][g] for measure in MEASURES}
+        
+        return RollupCube(cells, self.price_bins)
+
+def main():
+    parser = argparse.ArgumentParser(description='建立停車場資料的城市/區域/來源/價格帶彙總')
+    parser.add_argument('input', nargs='?', default='parking_data_fixed.json', help='停車場資料檔')
+    args = parser.parse_args()
+    
+    cube = RollupCube.build(read_parking_table(args.input))
+    filename = cube.save(rollup_filename(args.input))
+    print(f"已建立 {len(cube.cells)} 個彙總格，儲存為 {filename}")
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,47 @@
+import argparse
+import contextlib
 import csv
 import json
-import math
+import os
+import shutil
+import tempfile
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """計算兩點間的距離（米）"""
-    R = 6371000  # 地球半径（米）
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * 
-         math.sin(delta_lon/2) * math.sin(delta_lon/2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+import instrumentation
+from dedup_engine import find_duplicate_pairs, find_duplicates
+from parking_store import BUILDINGS_CSV, ParkingStore, store_filename, store_is_current
+from parking_table import ParkingTable, ParkingTableWriter
+from rollup_cube import RollupBuilder, rollup_filename
+
+# 串流處理時每批的列數
+CHUNK_SIZE = 10000
+
+def iter_csv_rows(filename):
+    """逐列讀取CSV資料的產生器，不會一次載入整個檔案"""
+    with open(filename, 'r', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+def iter_chunks(rows, chunk_size=CHUNK_SIZE):
+    """將逐列資料切成最多 chunk_size 筆的批次"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 def load_csv_data(filename):
     """載入CSV資料"""
-    data = []
     try:
-        with open(filename, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                data.append(row)
+        return list(iter_csv_rows(filename))
     except FileNotFoundError:
         print(f"找不到檔案: {filename}")
         return []
-    return data
 
-def clean_coordinate_data(data, lat_field='lat', lon_field='lon'):
-    """清洗座標資料"""
-    cleaned = []
-    for row in data:
+def iter_clean_coordinates(rows, lat_field='lat', lon_field='lon'):
+    """逐列清洗座標資料，只產生座標在台灣範圍內的列"""
+    for row in rows:
         try:
             lat = float(row.get(lat_field, 0))
             lon = float(row.get(lon_field, 0))
@@ -42,17 +50,25 @@ def clean_coordinate_data(data, lat_field='lat', lon_field='lon'):
             if 21.5 <= lat <= 25.5 and 119.5 <= lon <= 122.5:
                 row[lat_field] = lat
                 row[lon_field] = lon
-                cleaned.append(row)
+                yield row
         except (ValueError, TypeError):
             continue
-    
-    return cleaned
+
+def clean_coordinate_data(data, lat_field='lat', lon_field='lon'):
+    """清洗座標資料"""
+    return list(iter_clean_coordinates(data, lat_field, lon_field))
 
 def standardize_uspace_data(data):
     """標準化USpace資料"""
-    standardized = []
-    
-    for row in data:
+    return list(iter_standardized_uspace(data))
+
+def standardize_external_data(data):
+    """標準化外部停車場資料"""
+    return list(iter_standardized_external(data))
+
+def iter_standardized_uspace(rows):
+    """逐列標準化USpace資料"""
+    for row in rows:
         try:
             # 計算平均日間費率
             day_rates = []
@@ -84,7 +100,7 @@ def standardize_uspace_data(data):
                 except ValueError:
                     space_number = 0
             
-            standardized.append({
+            yield {
                 'id': row.get('id', ''),
                 'name': row.get('name', ''),
                 'lat': row['lat'],
@@ -99,18 +115,14 @@ def standardize_uspace_data(data):
                 'source': 'uspace',
                 'building_type': row.get('building_type', ''),
                 'financial_class': row.get('financial_class', '')
-            })
+            }
         except Exception as e:
             print(f"處理USpace資料時發生錯誤: {e}")
             continue
-    
-    return standardized
 
-def standardize_external_data(data):
-    """標準化外部停車場資料"""
-    standardized = []
-    
-    for row in data:
+def iter_standardized_external(rows):
+    """逐列標準化外部停車場資料"""
+    for row in rows:
         try:
             # 計算平均日間費率
             day_rates = []
@@ -154,7 +166,7 @@ def standardize_external_data(data):
                 except ValueError:
                     space_number = 0
             
-            standardized.append({
+            yield {
                 'id': row.get('id', ''),
                 'name': row.get('name', ''),
                 'lat': row['lat'],
@@ -169,87 +181,77 @@ def standardize_external_data(data):
                 'source': 'external',
                 'building_type': '',
                 'financial_class': ''
-            })
+            }
         except Exception as e:
             print(f"處理外部資料時發生錯誤: {e}")
             continue
-    
-    return standardized
 
-def remove_duplicates(uspace_data, external_data, distance_threshold=50):
+def remove_duplicates(uspace_data, external_data, distance_threshold=50, name_similarity=None):
     """移除重複的停車場"""
-    duplicates = []
-    
     print("檢查重複停車場...")
-    for i, external in enumerate(external_data):
-        external_lat, external_lon = external['lat'], external['lon']
-        external_name = external['name'].lower()
-        
-        for uspace in uspace_data:
-            uspace_lat, uspace_lon = uspace['lat'], uspace['lon']
-            uspace_name = uspace['name'].lower()
-            
-            # 計算距離
-            distance = calculate_distance(external_lat, external_lon, uspace_lat, uspace_lon)
-            
-            # 如果距離很近，檢查名稱相似性
-            if distance < distance_threshold:
-                # 簡單的名稱相似性檢查
-                if (external_name in uspace_name or 
-                    uspace_name in external_name or
-                    any(word in external_name for word in uspace_name.split() if len(word) > 2)):
-                    duplicates.append(i)
-                    print(f"發現重複: {external['name']} <-> {uspace['name']} (距離: {distance:.1f}m)")
-                    break
+    duplicates = find_duplicates(uspace_data, external_data, distance_threshold, name_similarity)
+    
+    for i, j, distance in duplicates:
+        instrumentation.log(f"發現重複: {external_data[i]['name']} <-> {uspace_data[j]['name']} (距離: {distance:.1f}m)")
     
     # 移除重複項目
-    external_deduped = [external_data[i] for i in range(len(external_data)) if i not in duplicates]
+    duplicate_ids = {i for i, _, _ in duplicates}
+    external_deduped = [external for i, external in enumerate(external_data) if i not in duplicate_ids]
     
     print(f"移除 {len(duplicates)} 個重複停車場")
     print(f"外部停車場去重後數量: {len(external_deduped)}")
     
     return external_deduped
 
-def main():
-    print("開始處理停車場資料...")
-    
+USPACE_CSV = '../建物commit/input/建物費率上限整合_最終版拷貝.csv'
+EXTERNAL_CSV = '../建物commit/input/外部停車場.csv'
+
+def build_parking_data(uspace_file=USPACE_CSV, external_file=EXTERNAL_CSV):
+    """載入、清洗、標準化並去重，回傳 parking_data.json 的資料結構（無法載入時回傳None）"""
     # 載入資料
-    print("載入USpace停車場資料...")
-    uspace_raw = load_csv_data('../建物commit/input/建物費率上限整合_最終版拷貝.csv')
-    
-    print("載入外部停車場資料...")
-    external_raw = load_csv_data('../建物commit/input/外部停車場.csv')
+    with instrumentation.stage('load_csv_data') as record:
+        print("載入USpace停車場資料...")
+        uspace_raw = load_csv_data(uspace_file)
+        
+        print("載入外部停車場資料...")
+        external_raw = load_csv_data(external_file)
+        record['rows_out'] = len(uspace_raw) + len(external_raw)
     
     if not uspace_raw:
         print("無法載入USpace資料！")
-        return
+        return None
     
     if not external_raw:
         print("無法載入外部資料！")
-        return
+        return None
     
     print(f"USpace原始資料: {len(uspace_raw)} 筆")
     print(f"外部原始資料: {len(external_raw)} 筆")
     
     # 清洗座標資料
-    uspace_clean = clean_coordinate_data(uspace_raw)
-    external_clean = clean_coordinate_data(external_raw)
+    with instrumentation.stage('clean_coordinates', rows_in=len(uspace_raw) + len(external_raw)) as record:
+        uspace_clean = clean_coordinate_data(uspace_raw)
+        external_clean = clean_coordinate_data(external_raw)
+        record['rows_out'] = len(uspace_clean) + len(external_clean)
     
     print(f"USpace清洗後: {len(uspace_clean)} 筆")
     print(f"外部清洗後: {len(external_clean)} 筆")
     
     # 標準化資料
-    uspace_std = standardize_uspace_data(uspace_clean)
-    external_std = standardize_external_data(external_clean)
+    with instrumentation.stage('standardize', rows_in=len(uspace_clean) + len(external_clean)) as record:
+        uspace_std = standardize_uspace_data(uspace_clean)
+        external_std = standardize_external_data(external_clean)
+        record['rows_out'] = len(uspace_std) + len(external_std)
     
     # 移除重複
-    external_deduped = remove_duplicates(uspace_std, external_std)
+    with instrumentation.stage('remove_duplicates', rows_in=len(external_std)) as record:
+        external_deduped = remove_duplicates(uspace_std, external_std)
+        record['rows_out'] = len(external_deduped)
     
     # 合併資料
     combined_data = uspace_std + external_deduped
     
-    # 儲存為JSON
-    output_data = {
+    return {
         'uspace_parking': uspace_std,
         'external_parking': external_deduped,
         'combined': combined_data,
@@ -259,24 +261,221 @@ def main():
             'total_count': len(combined_data)
         }
     }
-    
-    with open('parking_data.json', 'w', encoding='utf-8') as f:
+
+def save_parking_data(output_data, filename='parking_data.json'):
+    """儲存為JSON"""
+    with open(filename, 'w', encoding='utf-8') as f:
         json.dump(output_data, f, ensure_ascii=False, indent=2)
+    return filename
+
+def _spool_records(spool, records):
+    """將記錄以 json.dump(indent=2) 時在清單中的格式寫入暫存檔，每筆前加上逗號分隔"""
+    for record in records:
+        spool.write(',\n    ')
+        spool.write(json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n    '))
+
+def _write_record_list(f, key, spools):
+    """將暫存檔內容寫成頂層物件中的清單，spools 為 [(暫存檔, 筆數), ...]"""
+    f.write(f'  {json.dumps(key)}: [')
+    empty = True
+    for spool, count in spools:
+        if not count:
+            continue
+        spool.seek(0)
+        spool.read(2)  # 略過第一筆前的逗號與換行
+        f.write('\n' if empty else ',\n')
+        shutil.copyfileobj(spool, f)
+        empty = False
+    f.write(']' if empty else '\n  ]')
+
+def stream_parking_data(uspace_file=USPACE_CSV, external_file=EXTERNAL_CSV, filename='parking_data.json',
+                        chunk_size=CHUNK_SIZE, distance_threshold=50, name_similarity=None, on_chunk=None):
+    """以固定大小的批次串流處理CSV，並寫出與 build_parking_data + save_parking_data 相同的檔案
     
-    print(f"\n資料處理完成！")
-    print(f"USpace停車場: {len(uspace_std)} 筆")
-    print(f"外部停車場: {len(external_deduped)} 筆")
-    print(f"總計: {len(combined_data)} 筆")
+    每批資料依序清洗、標準化、去重後以輸出格式暫存到磁碟，最後再依序複製到 JSON 檔，
+    記憶體中只保留一個批次，以及去重時比對用的USpace座標與名稱；
+    後者是整個流程中唯一隨資料量成長的部分（外部停車場都要與全部USpace停車場比對）。
+    on_chunk(records) 會在每批記錄確定後被呼叫（USpace在前、外部在後）。
+    回傳統計資訊，無法載入時回傳None。
+    """
+    for source_file in [uspace_file, external_file]:
+        if not os.path.exists(source_file):
+            print(f"找不到檔案: {source_file}")
+            return None
+    
+    uspace_spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+    external_spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+    with uspace_spool, external_spool:
+        # USpace：逐批處理並保留去重需要的欄位
+        print("串流處理USpace停車場資料...")
+        uspace_raw_count = 0
+        uspace_lats, uspace_lons, uspace_names = [], [], []
+        with instrumentation.stage('stream_uspace') as metrics:
+            for chunk in iter_chunks(iter_csv_rows(uspace_file), chunk_size):
+                uspace_raw_count += len(chunk)
+                records = list(iter_standardized_uspace(iter_clean_coordinates(chunk)))
+                for record in records:
+                    uspace_lats.append(record['lat'])
+                    uspace_lons.append(record['lon'])
+                    uspace_names.append(record['name'])
+                _spool_records(uspace_spool, records)
+                if on_chunk:
+                    on_chunk(records)
+            metrics['rows_in'] = uspace_raw_count
+            metrics['rows_out'] = len(uspace_lats)
+        
+        if not uspace_raw_count:
+            print("無法載入USpace資料！")
+            return None
+        print(f"USpace原始資料: {uspace_raw_count} 筆，清洗後: {len(uspace_lats)} 筆")
+        
+        # 外部停車場：逐批清洗、標準化並與USpace比對去重
+        print("串流處理外部停車場資料...")
+        external_raw_count = 0
+        external_clean_count = 0
+        external_count = 0
+        duplicate_count = 0
+        progress = instrumentation.Progress(label='外部停車場處理進度')
+        with instrumentation.stage('stream_external') as metrics:
+            for chunk in iter_chunks(iter_csv_rows(external_file), chunk_size):
+                external_raw_count += len(chunk)
+                records = list(iter_standardized_external(iter_clean_coordinates(chunk)))
+                external_clean_count += len(records)
+                duplicates = find_duplicate_pairs(
+                    [record['lat'] for record in records], [record['lon'] for record in records],
+                    [record['name'] for record in records],
+                    uspace_lats, uspace_lons, uspace_names,
+                    distance_threshold, name_similarity
+                )
+                for i, j, distance in duplicates:
+                    instrumentation.log(f"發現重複: {records[i]['name']} <-> {uspace_names[j]} (距離: {distance:.1f}m)")
+                
+                duplicate_ids = {i for i, _, _ in duplicates}
+                records = [record for i, record in enumerate(records) if i not in duplicate_ids]
+                duplicate_count += len(duplicate_ids)
+                external_count += len(records)
+                _spool_records(external_spool, records)
+                if on_chunk:
+                    on_chunk(records)
+                progress.update(len(chunk))
+            progress.close()
+            metrics['rows_in'] = external_raw_count
+            metrics['rows_out'] = external_count
+        
+        if not external_raw_count:
+            print("無法載入外部資料！")
+            return None
+        print(f"外部原始資料: {external_raw_count} 筆，清洗後: {external_clean_count} 筆")
+        print(f"移除 {duplicate_count} 個重複停車場")
+        print(f"外部停車場去重後數量: {external_count}")
+        
+        statistics = {
+            'uspace_count': len(uspace_lats),
+            'external_count': external_count,
+            'total_count': len(uspace_lats) + external_count
+        }
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('{\n')
+            uspace_part = (uspace_spool, statistics['uspace_count'])
+            external_part = (external_spool, statistics['external_count'])
+            _write_record_list(f, 'uspace_parking', [uspace_part])
+            f.write(',\n')
+            _write_record_list(f, 'external_parking', [external_part])
+            f.write(',\n')
+            _write_record_list(f, 'combined', [uspace_part, external_part])
+            f.write(',\n  "statistics": ')
+            f.write(json.dumps(statistics, indent=2).replace('\n', '\n  '))
+            f.write('\n}')
+    
+    return statistics
+
+def write_parking_outputs(uspace_file=USPACE_CSV, external_file=EXTERNAL_CSV, chunk_size=CHUNK_SIZE,
+                          name_similarity=None, force_store=False):
+    """串流清洗CSV並寫出 parking_data.json、精簡格式、彙總與資料庫
+    
+    回傳 (統計資訊, 彙總立方體)，無法載入時回傳 (None, None)。
+    """
+    # 精簡格式、彙總與資料庫都在每批記錄確定後隨即累積：精簡格式的欄位暫存到磁碟，
+    # 彙總只累積最細分組的度量（大小只與城市、區域等組合數有關），資料庫逐批寫入暫存檔。
+    # 整個流程中隨資料量成長的只有去重時比對用的USpace座標與名稱（見 stream_parking_data）
+    store_file = store_filename('parking_data.json')
+    partial_store_file = f'{store_file}.partial'
+    rollup = RollupBuilder()
+    
+    # 資料庫已由相同內容的來源CSV與相同參數建立時沿用，不重新建立
+    store_sources = [uspace_file, external_file] + ([BUILDINGS_CSV] if os.path.exists(BUILDINGS_CSV) else [])
+    store_params = {'name_similarity': name_similarity}
+    store_current = not force_store and store_is_current(store_file, store_sources, store_params)
+    store_context = contextlib.nullcontext() if store_current else ParkingStore.create(partial_store_file)
+    
+    with ParkingTableWriter() as writer, store_context as store:
+        def collect(records):
+            table = ParkingTable.from_records(records)
+            writer.append(table)
+            if store is not None:
+                store.append_parking_table(table)
+            rollup.add(table)
+        
+        statistics = stream_parking_data(uspace_file, external_file, chunk_size=chunk_size,
+                                         name_similarity=name_similarity, on_chunk=collect)
+        if statistics is None:
+            if store is not None:
+                store.close()
+                os.remove(partial_store_file)
+            return None, None
+        
+        # 同時產生地圖頁面優先載入的精簡格式，避免與 parking_data.json 內容不一致
+        with instrumentation.stage('compact_formats', rows_in=writer.count):
+            writer.write_binary('parking_data.bin')
+            writer.write_columnar('parking_data.columnar.json')
+        
+        # 城市/區域/來源/價格帶彙總只建立一次，摘要直接查詢彙總結果
+        with instrumentation.stage('rollup', rows_in=writer.count) as record:
+            cube = rollup.build()
+            cube.save(rollup_filename('parking_data.json'))
+            record['rows_out'] = len(cube.cells)
+        
+        # 匯入建物資料後取代原本的資料庫，供地圖伺服器與 parking_store 以索引查詢
+        with instrumentation.stage('parking_store', rows_in=writer.count):
+            if store is None:
+                print(f"資料庫 {store_file} 已是最新，略過匯入")
+            else:
+                if os.path.exists(BUILDINGS_CSV):
+                    store.import_buildings(BUILDINGS_CSV)
+                store.record_sources(store_sources, store_params)
+    if store is not None:
+        os.replace(partial_store_file, store_file)
+    return statistics, cube
+
+def main():
+    parser = argparse.ArgumentParser(description='清洗、標準化並去重停車場CSV，輸出 parking_data.json')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='串流處理時每批的列數（影響記憶體用量）')
+    parser.add_argument('--name-similarity', type=float, default=None,
+                        help='去重時另以名稱 bigram 相似度判斷，指定門檻（例如0.5）；預設不使用')
+    parser.add_argument('--force-store', action='store_true', help='來源與參數未變更也重新建立資料庫')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+    
+    print("開始處理停車場資料...")
     
-    # 統計城市分布
-    city_count = {}
-    for item in combined_data:
-        city = item['city']
-        city_count[city] = city_count.get(city, 0) + 1
+    statistics, cube = write_parking_outputs(chunk_size=args.chunk_size, name_similarity=args.name_similarity,
+                                             force_store=args.force_store)
+    if statistics is None:
+        return
+    
+    print(f"\n資料處理完成！")
+    print(f"USpace停車場: {statistics['uspace_count']} 筆")
+    print(f"外部停車場: {statistics['external_count']} 筆")
+    print(f"總計: {statistics['total_count']} 筆")
     
     print(f"\n城市分布:")
-    for city, count in sorted(city_count.items()):
-        print(f"  {city}: {count}")
+    for city, cell in sorted(cube.breakdown('city').items()):
+        print(f"  {city}: {cell['count']}")
+    
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
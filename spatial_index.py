@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+import heapq
+import math
+
+import numpy as np
+
+from geo_utils import EARTH_RADIUS, haversine_to_many
+
+EARTH_RADIUS_KM = EARTH_RADIUS['km']
+# 球面上任兩點的最大距離（半個大圓）
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+def radius_to_degree_span(lat, radius_km):
+    """計算半徑範圍在緯度/經度方向上的最大角度跨度（度）
+    
+    以球面距離推導的保守上界，確保半徑內的點一定落在此外接框內。
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_span = math.degrees(angular)
+    
+    # 外接框內離赤道最遠的緯度，其cos值最小，經度跨度最大
+    max_abs_lat = min(abs(lat) + lat_span, 90.0)
+    cos_lat = math.cos(math.radians(max_abs_lat))
+    ratio = math.sin(angular / 2) / cos_lat if cos_lat > 0 else 1.0
+    if ratio >= 1.0:
+        lon_span = 180.0
+    else:
+        lon_span = math.degrees(2 * math.asin(ratio))
+    
+    return lat_span, lon_span
+
+class GridIndex:
+    """經緯度網格空間索引，用於快速找出半徑內的候選點"""
+    
+    def __init__(self, points, cell_size_km=1.0):
+        """points 為 (lat, lon) 序列，索引值即為該點在序列中的位置"""
+        self.cell_size_km = cell_size_km
+        self.cell_size_deg = math.degrees(cell_size_km / EARTH_RADIUS_KM)
+        self.cells = {}
+        
+        lats = []
+        lons = []
+        for lat, lon in points:
+            try:
+                lats.append(float(lat))
+                lons.append(float(lon))
+            except (ValueError, TypeError):
+                # 座標無效的點不進入索引，與原本逐一計算時略過的行為相同
+                lats.append(np.nan)
+                lons.append(np.nan)
+        self.lats = np.array(lats, dtype=np.float64)
+        self.lons = np.array(lons, dtype=np.float64)
+        
+        valid = np.flatnonzero(~np.isnan(self.lats) & ~np.isnan(self.lons))
+        self.valid_count = len(valid)
+        rows = np.floor(self.lats[valid] / self.cell_size_deg).astype(np.int64)
+        cols = np.floor(self.lons[valid] / self.cell_size_deg).astype(np.int64)
+        for i, row, col in zip(valid.tolist(), rows.tolist(), cols.tolist()):
+            self.cells.setdefault((row, col), []).append(i)
+    
+    def __len__(self):
+        return len(self.lats)
+    
+    def _cell_of(self, lat, lon):
+        return (math.floor(lat / self.cell_size_deg), math.floor(lon / self.cell_size_deg))
+    
+    def query_radius_candidates(self, lat, lon, radius_km):
+        """回傳可能位於半徑內的點索引（依原始順序排序）
+        
+        只做外接框篩選，呼叫端仍需以精確距離確認。
+        """
+        lat_span, lon_span = radius_to_degree_span(lat, radius_km)
+        min_lat, max_lat = lat - lat_span, lat + lat_span
+        min_lon, max_lon = lon - lon_span, lon + lon_span
+        
+        row_start, col_start = self._cell_of(min_lat, min_lon)
+        row_end, col_end = self._cell_of(max_lat, max_lon)
+        
+        cell_members = []
+        if (row_end - row_start + 1) * (col_end - col_start + 1) > len(self.cells):
+            # 外接框涵蓋的格子比有資料的格子還多時，改為逐一檢查有資料的格子
+            for (row, col), members in self.cells.items():
+                if row_start <= row <= row_end and col_start <= col <= col_end:
+                    cell_members.extend(members)
+        else:
+            for row in range(row_start, row_end + 1):
+                for col in range(col_start, col_end + 1):
+                    members = self.cells.get((row, col))
+                    if members:
+                        cell_members.extend(members)
+        
+        if not cell_members:
+            return np.empty(0, dtype=np.int64)
+        
+        candidates = np.array(cell_members, dtype=np.int64)
+        cand_lats = self.lats[candidates]
+        cand_lons = self.lons[candidates]
+        in_box = ((cand_lats >= min_lat) & (cand_lats <= max_lat) &
+                  (cand_lons >= min_lon) & (cand_lons <= max_lon))
+        
+        # 保持與原始逐一掃描相同的順序
+        return np.sort(candidates[in_box])
+    
+    def query_nearest(self, lat, lon, k, max_radius_km=None, mask=None):
+        """查詢距離最近的 k 個點，回傳 (索引陣列, 距離陣列km)，依距離由近到遠排序
+        
+        從一個網格大小的半徑開始，每次加倍搜尋範圍，直到範圍內已有 k 個點；
+        範圍外的點距離必定大於半徑，因此不會比已找到的點更近。
+        最後以大小為 k 的堆積選出最近的點，不對全部候選排序。
+        mask 為布林陣列時只考慮 mask 為 True 的點；max_radius_km 限制最大搜尋距離。
+        距離相同時以索引較小者優先。
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if k <= 0 or self.valid_count == 0:
+            return empty
+        
+        limit = MAX_DISTANCE_KM if max_radius_km is None else min(max_radius_km, MAX_DISTANCE_KM)
+        radius = min(self.cell_size_km, limit)
+        while True:
+            candidates = self.query_radius_candidates(lat, lon, radius)
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            distances = haversine_to_many(lat, lon, self.lats[candidates], self.lons[candidates])
+            within = distances <= radius
+            if np.count_nonzero(within) >= k or radius >= limit:
+                break
+            radius = min(radius * 2, limit)
+        
+        nearest = heapq.nsmallest(k, zip(distances[within].tolist(), candidates[within].tolist()))
+        if not nearest:
+            return empty
+        nearest_distances, nearest_indices = zip(*nearest)
+        return np.array(nearest_indices, dtype=np.int64), np.array(nearest_distances, dtype=np.float64)
+
+def candidate_pairs_within(lats_a, lons_a, lats_b, lons_b, radius_km):
+    """以網格合併找出兩組點之間可能位於半徑內的點對
+    
+    回傳 (index_a, index_b) 兩個陣列，依 index_a、index_b 排序；
+    只做外接框篩選，呼叫端仍需以精確距離確認。
+    """
+    lats_a = np.asarray(lats_a, dtype=np.float64)
+    lons_a = np.asarray(lons_a, dtype=np.float64)
+    lats_b = np.asarray(lats_b, dtype=np.float64)
+    lons_b = np.asarray(lons_b, dtype=np.float64)
+    
+    valid_a = np.flatnonzero(~np.isnan(lats_a) & ~np.isnan(lons_a))
+    valid_b = np.flatnonzero(~np.isnan(lats_b) & ~np.isnan(lons_b))
+    if len(valid_a) == 0 or len(valid_b) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    
+    # 網格大小取最大經緯度跨度，使半徑內的點只可能落在相鄰的3x3格內
+    max_abs_lat = max(np.abs(lats_a[valid_a]).max(), np.abs(lats_b[valid_b]).max())
+    lat_span, lon_span = radius_to_degree_span(max_abs_lat, radius_km)
+    
+    def cell_keys(lats, lons):
+        rows = np.floor(lats / lat_span).astype(np.int64)
+        cols = np.floor(lons / lon_span).astype(np.int64)
+        return rows, cols
+    
+    rows_a, cols_a = cell_keys(lats_a[valid_a], lons_a[valid_a])
+    rows_b, cols_b = cell_keys(lats_b[valid_b], lons_b[valid_b])
+    
+    col_offset = min(cols_a.min(), cols_b.min()) - 1
+    col_range = max(cols_a.max(), cols_b.max()) - col_offset + 2
+    keys_b = rows_b * col_range + (cols_b - col_offset)
+    order_b = np.argsort(keys_b, kind='stable')
+    sorted_keys_b = keys_b[order_b]
+    
+    pairs_a = []
+    pairs_b = []
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            target = (rows_a + d_row) * col_range + (cols_a + d_col - col_offset)
+            start = np.searchsorted(sorted_keys_b, target, side='left')
+            end = np.searchsorted(sorted_keys_b, target, side='right')
+            counts = end - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # 將每個a點對應的區段 [start, end) 展開為點對
+            owner = np.repeat(np.arange(len(target)), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            pairs_a.append(owner)
+            pairs_b.append(order_b[start[owner] + offsets])
+    
+    if not pairs_a:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    
+    index_a = valid_a[np.concatenate(pairs_a)]
+    index_b = valid_b[np.concatenate(pairs_b)]
+    
+    in_box = ((np.abs(lats_a[index_a] - lats_b[index_b]) <= lat_span) &
+              (np.abs(lons_a[index_a] - lons_b[index_b]) <= lon_span))
+    index_a = index_a[in_box]
+    index_b = index_b[in_box]
+    
+    order = np.lexsort((index_b, index_a))
+    return index_a[order], index_b[order]
@@ -1,26 +1,482 @@
 #!/usr/bin/env python3
+import argparse
+import gzip
 import http.server
-import socketserver
+import io
+import json
 import os
+import selectors
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
 
-# 切換到當前目錄
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+from cluster_tiles import ClusterTileCache, parse_tile_path
+from parking_api import DATA_FILE, ParkingApi
+from parking_store import ParkingStore
+from static_assets import AssetCache, RangeNotSatisfiable, accepts_gzip, cache_control, parse_range
 
 PORT = 8000
+# 處理請求的執行緒數量，即同時進行中的請求上限；
+# 保持連線（keep-alive）而沒有請求的連線交給 IdleConnections 等待，不占用執行緒
+WORKERS = 16
+# 保持連線在沒有新請求時的逾時秒數，逾時後關閉連線（閒置期間只占用一個檔案描述子）
+KEEPALIVE_TIMEOUT = 15
+# 請求開始後讀取請求或寫出回應的逾時秒數，避免慢速客戶端長時間占用執行緒
+REQUEST_TIMEOUT = 10
+# 停止伺服器時等待進行中請求完成的最長秒數
+SHUTDOWN_TIMEOUT = 10
+# 由 simple_data_cleaner 或 pipeline 產生的 SQLite 資料庫
+STORE_FILE = 'parking_data.db'
+STORE_PREFIX = '/api/store/'
+# 範圍查詢每頁最多回傳的筆數
+STORE_PAGE_LIMIT = 1000
+# 記憶體內索引查詢（依地圖範圍與篩選條件分頁回傳）
+PARKING_API_PATH = '/api/parking'
+# JSON 回應大於此大小且客戶端接受時以 gzip 傳送；查詢結果每次不同，使用最快的壓縮等級
+JSON_GZIP_MIN_SIZE = 1024
+JSON_GZIP_LEVEL = 1
+
+def store_query(table, params):
+    """查詢資料庫：有 lat/lon/radius 時做半徑查詢，否則依 bbox 與城市、區域、來源條件查詢"""
+    filters = {field: params[field] for field in ('city', 'district', 'source') if field in params}
+    with ParkingStore(STORE_FILE) as store:
+        if 'lat' in params and 'lon' in params:
+            query = store.query_radius if table == 'parking' else store.query_buildings_radius
+            results = query(float(params['lat']), float(params['lon']), float(params.get('radius', 1)), **filters)
+            return {'count': len(results), 'results': [
+                dict(record, distance=round(distance, 4)) for record, distance in results
+            ]}
+        query = store.query if table == 'parking' else store.query_buildings
+        limit = min(int(params.get('limit', STORE_PAGE_LIMIT)), STORE_PAGE_LIMIT)
+        offset = int(params.get('offset', 0))
+        results = query(bbox=params.get('bbox'), limit=limit, offset=offset, **filters)
+        return {'count': len(results), 'offset': offset, 'results': results}
 
 class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1：回應都帶 Content-Length，同一連線可連續處理多個請求
+    protocol_version = 'HTTP/1.1'
+    timeout = REQUEST_TIMEOUT
+    # 標頭與內容分次寫出，關閉 Nagle 以免保持連線時每個請求多等一次延遲確認
+    disable_nagle_algorithm = True
+    
     def end_headers(self):
         # 添加 CORS 標頭
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
+    
+    def handle(self):
+        """處理連線上已到達的請求；保持連線但暫無請求時返回，由伺服器交給閒置等待"""
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+            while not self.close_connection and self.request_pending():
+                self.handle_one_request()
+        except BaseException:
+            self.close_connection = True
+            raise
+    
+    def resume(self):
+        """閒置的保持連線有新請求到達時，由工作執行緒繼續處理"""
+        try:
+            self.handle()
+        finally:
+            self.finish()
+    
+    def request_pending(self):
+        """連線上是否已有下一個請求的資料（不等待）"""
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+    
+    def finish(self):
+        # 保持連線的讀寫串流留給下一個請求，連線結束時才由 close() 關閉
+        if self.close_connection:
+            self.close()
+    
+    def close(self):
+        super().finish()
+    
+    def handle_one_request(self):
+        super().handle_one_request()
+        # 伺服器停止中時，處理完目前的請求就關閉連線
+        if self.server.stopping.is_set():
+            self.close_connection = True
+    
+    def do_OPTIONS(self):
+        """CORS 預檢請求"""
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith(STORE_PREFIX):
+            self.handle_store(url)
+        elif url.path in (PARKING_API_PATH, PARKING_API_PATH + '/facets'):
+            self.handle_parking_api(url)
+        elif url.path.startswith('/tiles/'):
+            self.handle_tile(url)
+        else:
+            super().do_GET()
+    
+    def send_head(self):
+        """靜態檔案：預先壓縮的內容、ETag / Last-Modified 驗證、Range 部分內容與 Cache-Control；目錄仍由預設處理"""
+        self.file_range = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+        asset = self.server.assets.get(path)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return None
+        
+        # Range 以原檔的位元組為準，有 Range 時不使用壓縮內容
+        range_header = self.headers.get('Range')
+        compressed = (asset.gzip_body is not None and range_header is None
+                      and accepts_gzip(self.headers.get('Accept-Encoding')))
+        etag = asset.gzip_etag if compressed else asset.etag
+        # If-None-Match 優先於 If-Modified-Since
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            not_modified = asset.matches(if_none_match)
+        else:
+            not_modified = asset.not_modified_since(self.headers.get('If-Modified-Since'))
+        # If-Range 不符（檔案已變更）時忽略 Range，回應完整檔案
+        byte_range = None
+        if not not_modified and range_header is not None and asset.if_range_matches(self.headers.get('If-Range')):
+            try:
+                byte_range = parse_range(range_header, asset.size)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{asset.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+        
+        if not_modified:
+            self.send_response(304)
+        else:
+            self.send_response(206 if byte_range else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', cache_control(path, urlparse(self.path).query))
+        self.send_header('Accept-Ranges', 'bytes')
+        if asset.gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        if not_modified:
+            self.end_headers()
+            return None
+        
+        self.send_header('Content-Type', asset.content_type)
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(asset.gzip_body)))
+            self.end_headers()
+            return io.BytesIO(asset.gzip_body)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        start, end = byte_range or (0, os.fstat(f.fileno()).st_size - 1)
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{asset.size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.file_range = (start, end - start + 1)
+        return f
+    
+    def copyfile(self, source, outputfile):
+        """實體檔案以 sendfile 由核心直接送出（不經過 Python 緩衝區複製），只送出 Range 指定的部分"""
+        if self.file_range is None or not hasattr(source, 'fileno'):
+            super().copyfile(source, outputfile)
+            return
+        offset, count = self.file_range
+        if count > 0:
+            # socket.sendfile 在支援的平台上使用 os.sendfile，否則退回一般的 send
+            self.connection.sendfile(source, offset, count)
+    
+    def handle_store(self, url):
+        """/api/store/parking 或 /api/store/buildings 的索引查詢"""
+        table = url.path[len(STORE_PREFIX):]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if table not in ('parking', 'buildings'):
+            self.send_json_error(404, f"未知的資料表: {table}")
+            return
+        if not os.path.exists(STORE_FILE):
+            self.send_json_error(503, f"找不到資料庫 {STORE_FILE}，請先執行 simple_data_cleaner.py 或 pipeline.py")
+            return
+        try:
+            payload = store_query(table, params)
+        except ValueError as e:
+            self.send_json_error(400, str(e))
+            return
+        self.send_json(payload)
+    
+    def handle_parking_api(self, url):
+        """/api/parking 範圍與條件查詢，/api/parking/facets 篩選選項"""
+        params = {key: ','.join(values) for key, values in parse_qs(url.query).items()}
+        api = self.server.parking_api
+        try:
+            if url.path.endswith('/facets'):
+                payload = api.facets()
+            else:
+                payload = api.query(params)
+        except FileNotFoundError:
+            self.send_json_error(503, f"找不到資料檔 {api.filename}，請先執行 simple_data_cleaner.py 或 pipeline.py")
+            return
+        except ValueError as e:
+            self.send_json_error(400, str(e))
+            return
+        self.send_json(payload)
+    
+    def handle_tile(self, url):
+        """/tiles/{z}/{x}/{y}.json：圖磚範圍內的聚合點（可加上與 /api/parking 相同的篩選條件）"""
+        params = {key: ','.join(values) for key, values in parse_qs(url.query).items()}
+        try:
+            coordinates = parse_tile_path(url.path)
+            if coordinates is None:
+                self.send_json_error(404, f"未知的圖磚路徑: {url.path}")
+                return
+            payload = self.server.cluster_tiles.tile(*coordinates, params)
+        except FileNotFoundError:
+            self.send_json_error(503, f"找不到資料檔 {self.server.parking_api.filename}，請先執行 simple_data_cleaner.py 或 pipeline.py")
+            return
+        except ValueError as e:
+            self.send_json_error(400, str(e))
+            return
+        self.send_json(payload)
+    
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Cache-Control', 'no-store')
+        if len(body) >= JSON_GZIP_MIN_SIZE and accepts_gzip(self.headers.get('Accept-Encoding')):
+            body = gzip.compress(body, compresslevel=JSON_GZIP_LEVEL)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_json_error(self, status, message):
+        """API 的錯誤回應：{"error": 訊息}，客戶端可直接以 JSON 解析"""
+        self.log_error("code %d, message %s", status, message)
+        self.send_json({'error': message}, status)
+
+class IdleConnections:
+    """等待下一個請求的保持連線，以 selector 集中監看，不占用工作執行緒
+    
+    連線可讀時交回 on_ready 排入執行緒池；超過 timeout 秒沒有請求或停止時交給 on_close 關閉。
+    """
+    
+    def __init__(self, on_ready, on_close, timeout=KEEPALIVE_TIMEOUT):
+        self.on_ready = on_ready
+        self.on_close = on_close
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.closed = False
+        # 其他執行緒加入連線時喚醒 select
+        self.wakeup, self.wakeup_sender = socket.socketpair()
+        self.wakeup_sender.setblocking(False)
+        self.selector.register(self.wakeup, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run, name='http-idle', daemon=True)
+        self.thread.start()
+    
+    def add(self, handler):
+        """加入閒置連線；已停止時回傳False，由呼叫端關閉連線"""
+        with self.lock:
+            if self.closed:
+                return False
+            self.pending.append(handler)
+        self.notify()
+        return True
+    
+    def notify(self):
+        try:
+            self.wakeup_sender.send(b'\0')
+        except BlockingIOError:
+            # 喚醒訊號尚未讀取，select 仍會返回
+            pass
+    
+    def run(self):
+        deadlines = {}
+        while True:
+            with self.lock:
+                closed = self.closed
+                pending, self.pending = self.pending, []
+            now = time.monotonic()
+            for handler in pending:
+                self.selector.register(handler.connection, selectors.EVENT_READ, handler)
+                deadlines[handler] = now + self.timeout
+            if closed:
+                break
+            
+            timeout = max(min(deadlines.values()) - now, 0) if deadlines else None
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    self.wakeup.recv(4096)
+                    continue
+                self.selector.unregister(key.fileobj)
+                del deadlines[key.data]
+                self.on_ready(key.data)
+            
+            now = time.monotonic()
+            for handler in [handler for handler, deadline in deadlines.items() if deadline <= now]:
+                self.selector.unregister(handler.connection)
+                del deadlines[handler]
+                self.on_close(handler)
+        
+        for handler in deadlines:
+            self.selector.unregister(handler.connection)
+            self.on_close(handler)
+        self.selector.close()
+        self.wakeup.close()
+        self.wakeup_sender.close()
+    
+    def close(self):
+        """關閉所有閒置連線並停止監看"""
+        with self.lock:
+            self.closed = True
+        self.notify()
+        self.thread.join()
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """以固定大小的執行緒池處理請求的 HTTP 伺服器
+    
+    主執行緒只負責接受連線，每個請求交給執行緒池處理，
+    單一慢速下載不會阻擋其他客戶端。保持連線在請求之間交給 IdleConnections，
+    因此閒置的瀏覽器連線不會占滿執行緒池；workers 只限制同時進行中的請求數。
+    重新啟動時可立即重用埠號。
+    """
+    
+    allow_reuse_address = True
+    
+    def __init__(self, server_address, handler_class, workers=WORKERS, assets=None, parking_api=None):
+        super().__init__(server_address, handler_class)
+        self.assets = assets or AssetCache(os.getcwd())
+        self.parking_api = parking_api or ParkingApi(DATA_FILE)
+        self.cluster_tiles = ClusterTileCache(self.parking_api)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self.stopping = threading.Event()
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        self.idle = IdleConnections(self.resume_connection, self.end_connection)
+    
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        self.executor.submit(self.process_request_thread, request, client_address)
+    
+    def finish_request(self, request, client_address):
+        return self.RequestHandlerClass(request, client_address, self)
+    
+    def resume_connection(self, handler):
+        try:
+            self.executor.submit(self.process_request_thread, handler.request, handler.client_address, handler)
+        except RuntimeError:
+            # 執行緒池已停止
+            self.end_connection(handler)
+    
+    def process_request_thread(self, request, client_address, handler=None):
+        try:
+            if handler is None:
+                handler = self.finish_request(request, client_address)
+            else:
+                handler.resume()
+        except ConnectionError:
+            # 客戶端中途斷線（例如關閉頁面），不需記錄錯誤
+            pass
+        except Exception:
+            self.handle_error(request, client_address)
+        else:
+            # 保持連線時交給閒置等待，下一個請求到達後再排入執行緒池
+            if not handler.close_connection and self.idle.add(handler):
+                return
+            handler.close()
+        self.release_request(request)
+    
+    def end_connection(self, handler):
+        handler.close()
+        self.release_request(handler.request)
+    
+    def release_request(self, request):
+        with self.connections_lock:
+            self.connections.discard(request)
+        self.shutdown_request(request)
+    
+    def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        """停止後的收尾：關閉閒置連線與進行中連線的讀取端，等待進行中的請求完成"""
+        self.stopping.set()
+        self.idle.close()
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            # 只關閉讀取端：等待下一個請求的連線立即結束，正在回應的請求仍可寫完
+            try:
+                connection.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        done = threading.Event()
+        threading.Thread(target=lambda: (self.executor.shutdown(wait=True), done.set()), daemon=True).start()
+        return done.wait(timeout)
 
-with socketserver.TCPServer(("", PORT), CustomHTTPRequestHandler) as httpd:
-    print(f"伺服器已啟動於 http://localhost:{PORT}")
-    print(f"請在瀏覽器中開啟 http://localhost:{PORT}/parking_map.html")
+def serve(port=PORT, workers=WORKERS, bind=''):
+    # 啟動時先壓縮靜態檔案，之後的請求直接使用壓縮結果
+    assets = AssetCache(os.getcwd())
+    count, original, compressed = assets.warm()
+    print(f"已預先壓縮 {count} 個靜態檔案（{original / 1024 / 1024:.1f}MB -> {compressed / 1024 / 1024:.1f}MB）")
+    # 查詢索引與各縮放層級的聚合在啟動時建立，第一個地圖請求不必等待
+    parking_api = ParkingApi(DATA_FILE)
+    server = PooledHTTPServer((bind, port), CustomHTTPRequestHandler, workers, assets, parking_api)
+    try:
+        tiles = server.cluster_tiles.get_tiles()
+        print(f"已建立查詢索引與聚合圖磚（{len(tiles.index)} 筆停車場，0-{tiles.max_zoom} 層）")
+    except FileNotFoundError:
+        print(f"找不到 {DATA_FILE}，{PARKING_API_PATH} 與 /tiles/ 將於資料產生後啟用")
+    
+    # SIGTERM 與 Ctrl+C 相同，都是停止接受新連線後再等待進行中的請求
+    def request_shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, request_shutdown)
+    
+    print(f"伺服器已啟動於 http://localhost:{port}（{workers} 個工作執行緒）")
+    print(f"請在瀏覽器中開啟 http://localhost:{port}/parking_map.html")
     print("按 Ctrl+C 停止伺服器")
     try:
-        httpd.serve_forever()
+        server.serve_forever()
     except KeyboardInterrupt:
-        print("\n伺服器已停止")
\ No newline at end of file
+        pass
+    finally:
+        server.server_close()
+        if server.drain():
+            print("\n伺服器已停止")
+        else:
+            print(f"\n伺服器已停止（{SHUTDOWN_TIMEOUT} 秒內仍有未完成的請求）")
+
+def main():
+    parser = argparse.ArgumentParser(description='停車場地圖伺服器（靜態檔案與資料庫查詢）')
+    parser.add_argument('--port', type=int, default=PORT, help=f'埠號（預設 {PORT}）')
+    parser.add_argument('--workers', type=int, default=WORKERS, help=f'工作執行緒數量，即同時處理的請求上限（預設 {WORKERS}；閒置的保持連線不占用執行緒）')
+    parser.add_argument('--bind', default='', help='綁定的位址（預設所有介面）')
+    args = parser.parse_args()
+    
+    # 切換到當前目錄
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    serve(args.port, args.workers, args.bind)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+import email.utils
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 預先壓縮的檔案類型；圖片等已壓縮的格式不再壓縮
+COMPRESSIBLE_EXTENSIONS = ('.html', '.htm', '.json', '.csv', '.js', '.css', '.txt', '.svg', '.bin')
+# 小於此大小的檔案壓縮效益有限，直接傳送原檔
+MIN_COMPRESS_SIZE = 1024
+# 大於此大小的檔案（大型 .bin/.csv/.json 資料）不讀入記憶體也不壓縮，以 sendfile 直接傳送原檔
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024
+# 快取中壓縮內容的總大小上限，超過時淘汰最久未使用的檔案
+GZIP_CACHE_BUDGET = 64 * 1024 * 1024
+GZIP_LEVEL = 6
+# 不壓縮的檔案逐塊計算 ETag 雜湊，不整個讀入記憶體
+HASH_BLOCK_SIZE = 1 << 20
+
+# 檔名含內容雜湊（例如 app.3f2a9c1d.js）或網址帶 ?v= 版本參數時，內容不會變動，可長期快取
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 其餘檔案每次都以 ETag / Last-Modified 向伺服器確認，未變更時回應304
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+class RangeNotSatisfiable(ValueError):
+    """Range 要求的起點超出檔案大小（回應416）"""
+
+class StaticAsset:
+    """單一靜態檔案的快取資訊：大小、修改時間、ETag 與預先壓縮的內容
+    
+    只有要預先壓縮的檔案（不超過 MAX_COMPRESS_SIZE）會整個讀入記憶體，其餘檔案逐塊計算雜湊。
+    """
+    
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.content_type = guess_type(path)
+        self.gzip_body = None
+        self.gzip_etag = None
+        if not is_compressible(path, stat.st_size):
+            self.digest = file_digest(path)
+            self.etag = f'"{self.digest}"'
+            return
+        
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.digest = hashlib.sha1(content).hexdigest()[:20]
+        self.etag = f'"{self.digest}"'
+        compressed = gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+        if len(compressed) < len(content):
+            self.gzip_body = compressed
+            self.gzip_etag = f'"{self.digest}-gz"'
+    
+    @property
+    def cached_bytes(self):
+        """快取中占用的壓縮內容大小"""
+        return len(self.gzip_body) if self.gzip_body is not None else 0
+    
+    def is_stale(self):
+        """檔案的大小或修改時間已改變（需重新計算）"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_size != self.size or stat.st_mtime != self.mtime
+    
+    @property
+    def last_modified(self):
+        return email.utils.formatdate(self.mtime, usegmt=True)
+    
+    def matches(self, if_none_match):
+        """If-None-Match 是否符合任一內容版本（原檔或壓縮檔）"""
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        if '*' in tags:
+            return True
+        current = {self.etag, self.gzip_etag}
+        return any((tag[2:] if tag.startswith('W/') else tag) in current for tag in tags)
+    
+    def not_modified_since(self, if_modified_since):
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        return since is not None and int(self.mtime) <= since.timestamp()
+    
+    def if_range_matches(self, if_range):
+        """If-Range 是否仍指向目前的內容；不符時應回應完整檔案而非部分內容
+        
+        ETag 只接受強比對（弱 ETag 一律不符），日期須與 Last-Modified 完全相同。
+        """
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('W/'):
+            return False
+        if if_range.startswith('"'):
+            return if_range == self.etag
+        return if_range == self.last_modified
+
+def file_digest(path):
+    """檔案內容的 SHA-1 雜湊（ETag 使用前20字元），逐塊讀取"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()[:20]
+
+def guess_type(path):
+    content_type, _ = mimetypes.guess_type(path)
+    if content_type is None:
+        return 'application/octet-stream'
+    if content_type.startswith('text/') or content_type in ('application/json', 'application/javascript'):
+        return f'{content_type}; charset=utf-8'
+    return content_type
+
+def is_compressible(path, size):
+    return (MIN_COMPRESS_SIZE <= size <= MAX_COMPRESS_SIZE
+            and os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS)
+
+def accepts_gzip(accept_encoding):
+    """Accept-Encoding 是否接受 gzip（q=0 表示拒絕）"""
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token.strip().lower() in ('gzip', '*'):
+            quality = params.strip()
+            if quality.startswith('q='):
+                try:
+                    return float(quality[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+def parse_range(range_header, size):
+    """解析 Range 標頭，回傳 (起點, 終點)（含終點）
+    
+    只支援單一 bytes 範圍（bytes=起點-終點、bytes=起點-、bytes=-長度）；
+    格式不符或要求多個範圍時回傳None，由呼叫端回應完整檔案。
+    範圍完全落在檔案之外時拋出 RangeNotSatisfiable。
+    """
+    unit, _, ranges = (range_header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, dash, last = (part.strip() for part in ranges.partition('-'))
+    if not dash or not (first or last) or any(part and not part.isdigit() for part in (first, last)):
+        return None
+    if not first:
+        # 檔案最後的 N 個位元組
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(range_header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(range_header)
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+def cache_control(path, query=''):
+    """依檔名或版本參數決定 Cache-Control"""
+    if HASHED_NAME_PATTERN.search(os.path.basename(path)) or re.search(r'(^|&)v=', query):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+class AssetCache:
+    """靜態檔案快取：啟動時預先壓縮，檔案變更時於下次請求重新計算
+    
+    壓縮內容的總大小不超過 budget，超過時依最近使用順序（LRU）淘汰，
+    被淘汰的檔案於下次請求時重新讀取壓縮。
+    """
+    
+    def __init__(self, root, budget=GZIP_CACHE_BUDGET):
+        self.root = os.path.abspath(root)
+        self.budget = budget
+        self.assets = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+    
+    def get(self, path):
+        """取得檔案的快取資訊，檔案不存在時回傳None"""
+        path = os.path.abspath(path)
+        with self.lock:
+            asset = self.assets.get(path)
+            if asset is not None:
+                self.assets.move_to_end(path)
+        if asset is not None and not asset.is_stale():
+            return asset
+        try:
+            asset = StaticAsset(path)
+        except OSError:
+            return None
+        with self.lock:
+            self._store(path, asset)
+        return asset
+    
+    def _store(self, path, asset):
+        """加入快取並淘汰最久未使用的檔案，直到壓縮內容總大小不超過上限（呼叫端持有 lock）"""
+        previous = self.assets.pop(path, None)
+        if previous is not None:
+            self.cached_bytes -= previous.cached_bytes
+        self.assets[path] = asset
+        self.cached_bytes += asset.cached_bytes
+        while self.cached_bytes > self.budget and len(self.assets) > 1:
+            _, evicted = self.assets.popitem(last=False)
+            self.cached_bytes -= evicted.cached_bytes
+    
+    def warm(self):
+        """預先處理根目錄下可壓縮的檔案，回傳快取中的 (檔案數, 原始大小, 壓縮後大小)"""
+        for entry in os.scandir(self.root):
+            if entry.is_file() and is_compressible(entry.path, entry.stat().st_size):
+                self.get(entry.path)
+        with self.lock:
+            compressed_assets = [asset for asset in self.assets.values() if asset.gzip_body is not None]
+        return (len(compressed_assets), sum(asset.size for asset in compressed_assets),
+                sum(asset.cached_bytes for asset in compressed_assets))
@@ -0,0 +1,69 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pipeline
+
+def write_module(directory, name, source):
+    with open(os.path.join(directory, f'{name}.py'), 'w', encoding='utf-8') as f:
+        f.write(source)
+
+def load_module(directory, name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class PipelineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        patcher = mock.patch.object(pipeline, 'PROJECT_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        # stage_module -> helper（函數內匯入）-> constants（from ... import 常數）
+        write_module(self.directory, 'constants', 'EDGES = (30, 50)\n')
+        write_module(self.directory, 'helper', 'from constants import EDGES\n')
+        write_module(self.directory, 'stage_module',
+                     'import json\n\ndef edges():\n    import helper\n    return helper.EDGES\n')
+        self.runs = 0
+    
+    def stages(self):
+        def run():
+            self.runs += 1
+            return self.runs
+        
+        module = load_module(self.directory, 'stage_module')
+        return {'result': {'deps': [], 'run': run, 'params': {}, 'sources': [], 'modules': [module],
+                           'artifact': None}}
+    
+    def test_module_closure_includes_indirect_imports(self):
+        module = load_module(self.directory, 'stage_module')
+        self.assertEqual(pipeline.module_closure([module]), ['constants.py', 'helper.py', 'stage_module.py'])
+    
+    def test_indirect_dependency_change_misses_cache(self):
+        pipeline.run_pipeline(self.stages(), ['result'])
+        pipeline.run_pipeline(self.stages(), ['result'])
+        self.assertEqual(self.runs, 1)
+        
+        write_module(self.directory, 'constants', 'EDGES = (30, 60)\n')
+        pipeline.run_pipeline(self.stages(), ['result'])
+        self.assertEqual(self.runs, 2)
+
+class PipelineStagesTest(unittest.TestCase):
+    def test_price_histogram_in_histogram_stage_keys(self):
+        # 價格區間的邊界改變時，使用價格區間的階段都要重新計算
+        stages = pipeline.build_stages(parking_json='parking_data.json')
+        for name in ['rollup', 'area_reports', 'area_analysis', 'area_analysis_filtered',
+                     'price_range_analysis', 'filtered_price_analysis']:
+            self.assertIn('price_histogram.py', pipeline.module_closure(stages[name]['modules']), name)
+
+if __name__ == '__main__':
+    unittest.main()
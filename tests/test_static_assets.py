@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import static_assets
+from static_assets import AssetCache
+
+def write_file(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+class AssetCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def test_large_file_is_not_compressed(self):
+        path = write_file(self.directory, 'data.bin', b'0' * 4096)
+        with mock.patch.object(static_assets, 'MAX_COMPRESS_SIZE', 2048):
+            asset = AssetCache(self.directory).get(path)
+        self.assertIsNone(asset.gzip_body)
+        self.assertEqual(asset.size, 4096)
+    
+    def test_budget_evicts_least_recently_used(self):
+        paths = [write_file(self.directory, f'{name}.json', name.encode() * 4096) for name in 'abc']
+        cache = AssetCache(self.directory)
+        cache.get(paths[0])
+        size = cache.cached_bytes
+        cache.budget = size * 2
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual(list(cache.assets), [paths[0], paths[2]])
+        self.assertLessEqual(cache.cached_bytes, cache.budget)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,196 +1,164 @@
 #!/usr/bin/env python3
-import json
+import argparse
 import csv
-import math
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """計算兩點間的距離（公里）"""
-    R = 6371  # 地球半径（公里）
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * 
-         math.sin(delta_lon/2) * math.sin(delta_lon/2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+import instrumentation
+from area_engine import SEARCH_RADIUS_KM, nearest_entries, run_area_reports
+from parking_table import read_parking_data
+from price_histogram import histogram_columns, histogram_fieldnames, histogram_text, price_histogram
+from quantile_sketch import quantile_fieldnames
+from ring_analysis import circle_area_km2, parse_radii, ring_fieldnames
 
-def analyze_uspace_areas():
-    """分析每個USpace停車場周邊3公里內的外部停車場"""
+RESULT_CSV = 'uspace_area_analysis.csv'
+
+def load_parking_data(filename='parking_data_fixed.json'):
+    """載入停車場資料（可為 parking_data.json、欄式JSON、二進位格式或 SQLite 資料庫）
     
+    SQLite 資料庫在此只是輸入格式，仍會整份讀入：每個USpace停車場都要與3公里內的
+    外部停車場比對，分析需要全部資料，半徑查詢由記憶體內的空間索引處理。
+    """
     print("載入停車場資料...")
-    with open('parking_data_fixed.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    uspace_parking = data['uspace_parking']
-    external_parking = data['external_parking']
-    
-    print(f"USpace停車場數量: {len(uspace_parking)}")
-    print(f"外部停車場數量: {len(external_parking)}")
+    return read_parking_data(filename)
+
+def summarize_nearby(uspace, nearby):
+    """彙整單一USpace停車場周邊3公里內的外部停車場
+    
+    nearby 為 [(外部停車場, 距離km), ...]，由分析引擎以共用的候選搜尋提供。
+    """
+    uspace_lat = uspace['lat']
+    uspace_lon = uspace['lon']
+    uspace_name = uspace['name']
+    uspace_city = uspace['city']
+    uspace_district = uspace['district']
+    uspace_address = uspace['address']
+    uspace_day_rate = uspace['day_rate']
+    uspace_night_rate = uspace['night_rate']
+    uspace_space_number = uspace['space_number']
+    
+    # 3公里內的外部停車場
+    nearby_external = []
+    
+    for external, distance in nearby:
+        nearby_external.append({
+            'name': external['name'],
+            'distance': distance,
+            'day_rate': external['day_rate'],
+            'night_rate': external['night_rate'],
+            'monthly_rate': external['monthly_rate'],
+            'space_number': external['space_number']
+        })
     
-    results = []
+    # 計算統計資料
+    total_external_count = len(nearby_external)
     
-    for i, uspace in enumerate(uspace_parking):
-        if i % 50 == 0:
-            print(f"處理進度: {i}/{len(uspace_parking)}")
-        
-        uspace_lat = uspace['lat']
-        uspace_lon = uspace['lon']
-        uspace_name = uspace['name']
-        uspace_city = uspace['city']
-        uspace_district = uspace['district']
-        uspace_address = uspace['address']
-        uspace_day_rate = uspace['day_rate']
-        uspace_night_rate = uspace['night_rate']
-        uspace_space_number = uspace['space_number']
-        
-        # 找出3公里內的外部停車場
-        nearby_external = []
-        
-        for external in external_parking:
-            try:
-                external_lat = external['lat']
-                external_lon = external['lon']
-                
-                # 計算距離
-                distance = calculate_distance(uspace_lat, uspace_lon, external_lat, external_lon)
-                
-                if distance <= 3.0:  # 3公里內
-                    nearby_external.append({
-                        'name': external['name'],
-                        'distance': distance,
-                        'day_rate': external['day_rate'],
-                        'night_rate': external['night_rate'],
-                        'monthly_rate': external['monthly_rate'],
-                        'space_number': external['space_number']
-                    })
-            except (ValueError, TypeError):
-                continue
-        
-        # 計算統計資料
-        total_external_count = len(nearby_external)
-        
-        if total_external_count > 0:
-            # 總車格數
-            total_spaces = sum(ext['space_number'] for ext in nearby_external if ext['space_number'] and ext['space_number'] > 0)
-            
-            # 平均臨停費率（日間）
-            day_rates = [ext['day_rate'] for ext in nearby_external if ext['day_rate'] and ext['day_rate'] > 0]
-            avg_day_rate = sum(day_rates) / len(day_rates) if day_rates else 0
-            
-            # 平均夜間費率
-            night_rates = [ext['night_rate'] for ext in nearby_external if ext['night_rate'] and ext['night_rate'] > 0]
-            avg_night_rate = sum(night_rates) / len(night_rates) if night_rates else 0
-            
-            # 平均月租金額
-            monthly_rates = [ext['monthly_rate'] for ext in nearby_external if ext['monthly_rate'] and ext['monthly_rate'] > 0]
-            avg_monthly_rate = sum(monthly_rates) / len(monthly_rates) if monthly_rates else 0
-            
-            # 最近距離
-            min_distance = min(ext['distance'] for ext in nearby_external)
-            
-            # 最遠距離
-            max_distance = max(ext['distance'] for ext in nearby_external)
-            
-        else:
-            total_spaces = 0
-            avg_day_rate = 0
-            avg_night_rate = 0
-            avg_monthly_rate = 0
-            min_distance = 0
-            max_distance = 0
-        
-        # 價格比較
-        uspace_vs_external_day = 0
-        uspace_vs_external_night = 0
-        
-        if avg_day_rate > 0 and uspace_day_rate > 0:
-            uspace_vs_external_day = ((uspace_day_rate - avg_day_rate) / avg_day_rate) * 100
+    if total_external_count > 0:
+        # 總車格數
+        total_spaces = sum(ext['space_number'] for ext in nearby_external if ext['space_number'] and ext['space_number'] > 0)
         
-        if avg_night_rate > 0 and uspace_night_rate > 0:
-            uspace_vs_external_night = ((uspace_night_rate - avg_night_rate) / avg_night_rate) * 100
+        # 平均臨停費率（日間）
+        day_rates = [ext['day_rate'] for ext in nearby_external if ext['day_rate'] and ext['day_rate'] > 0]
+        avg_day_rate = sum(day_rates) / len(day_rates) if day_rates else 0
         
-        # 計算周邊停車場價格區間分布
-        price_ranges = {
-            '0-30元': 0,
-            '31-50元': 0,
-            '51-80元': 0,
-            '81-120元': 0,
-            '121-200元': 0,
-            '200元以上': 0,
-            '無收費資訊': 0
-        }
+        # 平均夜間費率
+        night_rates = [ext['night_rate'] for ext in nearby_external if ext['night_rate'] and ext['night_rate'] > 0]
+        avg_night_rate = sum(night_rates) / len(night_rates) if night_rates else 0
         
-        for ext in nearby_external:
-            day_rate = ext['day_rate']
-            if not day_rate or day_rate <= 0:
-                price_ranges['無收費資訊'] += 1
-            elif day_rate <= 30:
-                price_ranges['0-30元'] += 1
-            elif day_rate <= 50:
-                price_ranges['31-50元'] += 1
-            elif day_rate <= 80:
-                price_ranges['51-80元'] += 1
-            elif day_rate <= 120:
-                price_ranges['81-120元'] += 1
-            elif day_rate <= 200:
-                price_ranges['121-200元'] += 1
-            else:
-                price_ranges['200元以上'] += 1
+        # 平均月租金額
+        monthly_rates = [ext['monthly_rate'] for ext in nearby_external if ext['monthly_rate'] and ext['monthly_rate'] > 0]
+        avg_monthly_rate = sum(monthly_rates) / len(monthly_rates) if monthly_rates else 0
         
-        # 格式化價格區間字串
-        price_range_summary = []
-        for range_name, count in price_ranges.items():
-            if count > 0:
-                price_range_summary.append(f"{range_name}:{count}場")
+        # 最近距離
+        min_distance = min(ext['distance'] for ext in nearby_external)
         
-        price_range_text = '; '.join(price_range_summary) if price_range_summary else '無資料'
-        
-        # 添加結果
-        results.append({
-            'uspace_id': uspace['id'],
-            'uspace_name': uspace_name,
-            'uspace_city': uspace_city,
-            'uspace_district': uspace_district,
-            'uspace_address': uspace_address,
-            'uspace_lat': uspace_lat,
-            'uspace_lon': uspace_lon,
-            'uspace_space_number': uspace_space_number,
-            'uspace_day_rate': uspace_day_rate,
-            'uspace_night_rate': uspace_night_rate,
-            '周邊3km內外部停車場數量': total_external_count,
-            '周邊外部停車場總車格數': total_spaces,
-            '周邊平均日間臨停費率': round(avg_day_rate, 2) if avg_day_rate > 0 else 0,
-            '周邊平均夜間臨停費率': round(avg_night_rate, 2) if avg_night_rate > 0 else 0,
-            '周邊平均月租金額': round(avg_monthly_rate, 2) if avg_monthly_rate > 0 else 0,
-            '周邊停車場價格區間分布': price_range_text,
-            '最近外部停車場距離km': round(min_distance, 2) if min_distance > 0 else 0,
-            '最遠外部停車場距離km': round(max_distance, 2) if max_distance > 0 else 0,
-            'USpace日間費率vs周邊差異百分比': round(uspace_vs_external_day, 2),
-            'USpace夜間費率vs周邊差異百分比': round(uspace_vs_external_night, 2),
-            '競爭密度_每平方公里外部停車場數': round(total_external_count / (3.14 * 3 * 3), 2),  # 3km半徑圓形面積
-            '周邊停車場詳細清單': '; '.join([f"{ext['name']}({ext['distance']:.2f}km,日:{ext['day_rate']},夜:{ext['night_rate']},月:{ext['monthly_rate']})" for ext in nearby_external[:5]])  # 只顯示前5個
-        })
-    
-    return results
+        # 最遠距離
+        max_distance = max(ext['distance'] for ext in nearby_external)
+    
+    else:
+        total_spaces = 0
+        avg_day_rate = 0
+        avg_night_rate = 0
+        avg_monthly_rate = 0
+        min_distance = 0
+        max_distance = 0
+    
+    # 價格比較
+    uspace_vs_external_day = 0
+    uspace_vs_external_night = 0
+    
+    if avg_day_rate > 0 and uspace_day_rate > 0:
+        uspace_vs_external_day = ((uspace_day_rate - avg_day_rate) / avg_day_rate) * 100
+    
+    if avg_night_rate > 0 and uspace_night_rate > 0:
+        uspace_vs_external_night = ((uspace_night_rate - avg_night_rate) / avg_night_rate) * 100
+    
+    # 計算周邊停車場價格區間分布
+    price_ranges = price_histogram([ext['day_rate'] for ext in nearby_external], include_no_rate=True)
+    price_range_text = histogram_text(price_ranges)
+    
+    # 回傳結果
+    return {
+        'uspace_id': uspace['id'],
+        'uspace_name': uspace_name,
+        'uspace_city': uspace_city,
+        'uspace_district': uspace_district,
+        'uspace_address': uspace_address,
+        'uspace_lat': uspace_lat,
+        'uspace_lon': uspace_lon,
+        'uspace_space_number': uspace_space_number,
+        'uspace_day_rate': uspace_day_rate,
+        'uspace_night_rate': uspace_night_rate,
+        '周邊3km內外部停車場數量': total_external_count,
+        '周邊外部停車場總車格數': total_spaces,
+        '周邊平均日間臨停費率': round(avg_day_rate, 2) if avg_day_rate > 0 else 0,
+        '周邊平均夜間臨停費率': round(avg_night_rate, 2) if avg_night_rate > 0 else 0,
+        '周邊平均月租金額': round(avg_monthly_rate, 2) if avg_monthly_rate > 0 else 0,
+        '周邊停車場價格區間分布': price_range_text,
+        **histogram_columns(price_ranges),
+        '最近外部停車場距離km': round(min_distance, 2) if min_distance > 0 else 0,
+        '最遠外部停車場距離km': round(max_distance, 2) if max_distance > 0 else 0,
+        'USpace日間費率vs周邊差異百分比': round(uspace_vs_external_day, 2),
+        'USpace夜間費率vs周邊差異百分比': round(uspace_vs_external_night, 2),
+        '競爭密度_每平方公里外部停車場數': round(total_external_count / circle_area_km2(SEARCH_RADIUS_KM), 2),  # 3km半徑圓形面積
+        '周邊停車場詳細清單': '; '.join([f"{ext['name']}({ext['distance']:.2f}km,日:{ext['day_rate']},夜:{ext['night_rate']},月:{ext['monthly_rate']})" for ext in nearest_entries(nearby_external)])  # 只顯示最近的5個
+    }
+
+# 供 area_engine 使用的報表定義：納入所有外部停車場
+REPORT = {
+    'predicate': None,
+    'metrics': summarize_nearby
+}
 
-def save_to_csv(results):
-    """儲存結果到CSV檔案"""
-    filename = 'uspace_area_analysis.csv'
+def analyze_uspace_areas(data=None, workers=1, radii=None):
+    """分析每個USpace停車場周邊3公里內的外部停車場
     
+    radii 為額外輸出的半徑圈清單（公里，由小到大），例如 [1, 3, 5]。
+    """
+    
+    if data is None:
+        data = load_parking_data()
+    
+    uspace_parking = data['uspace_parking']
+    external_parking = data['external_parking']
+    
+    print(f"USpace停車場數量: {len(uspace_parking)}")
+    print(f"外部停車場數量: {len(external_parking)}")
+    
+    return run_area_reports(data, {'area': REPORT}, workers, radii)['area']
+
+def save_to_csv(results, filename=RESULT_CSV, radii=None):
+    """儲存結果到CSV檔案，指定 radii 時附加各半徑圈的欄位"""
     fieldnames = [
         'uspace_id', 'uspace_name', 'uspace_city', 'uspace_district', 'uspace_address',
         'uspace_lat', 'uspace_lon', 'uspace_space_number', 'uspace_day_rate', 'uspace_night_rate',
         '周邊3km內外部停車場數量', '周邊外部停車場總車格數', 
         '周邊平均日間臨停費率', '周邊平均夜間臨停費率', '周邊平均月租金額',
+        *quantile_fieldnames('周邊'),
         '周邊停車場價格區間分布',
+        *histogram_fieldnames(include_no_rate=True),
         '最近外部停車場距離km', '最遠外部停車場距離km',
         'USpace日間費率vs周邊差異百分比', 'USpace夜間費率vs周邊差異百分比',
         '競爭密度_每平方公里外部停車場數', '周邊停車場詳細清單'
-    ]
+    ] + ring_fieldnames(radii or [])
     
     with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -222,18 +190,31 @@ def generate_summary_stats(results):
     print(f"日間費率低於周邊: {lower_day_rate} ({lower_day_rate/total_uspace*100:.1f}%)")
 
 def main():
+    parser = argparse.ArgumentParser(description='USpace停車場周邊分析')
+    parser.add_argument('--workers', type=int, default=1, help='平行計算的行程數（預設1，不平行）')
+    parser.add_argument('--radii', type=parse_radii,
+                        help='額外輸出的半徑圈（公里，以逗號分隔），例如 1,3,5')
+    parser.add_argument('--data', default='parking_data_fixed.json',
+                        help='停車場資料檔（parking_data.json、欄式JSON、二進位格式或 SQLite 資料庫，皆整份讀入）')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
+    
     print("開始USpace停車場周邊分析...")
     
     # 執行分析
-    results = analyze_uspace_areas()
+    results = analyze_uspace_areas(load_parking_data(args.data), workers=args.workers, radii=args.radii)
     
     # 儲存CSV
-    csv_filename = save_to_csv(results)
+    csv_filename = save_to_csv(results, radii=args.radii)
     
     # 生成統計摘要
     generate_summary_stats(results)
     
     print(f"\n分析完成！請查看 {csv_filename}")
+    
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,226 +1,248 @@
 #!/usr/bin/env python3
-import json
+import argparse
 import csv
-import math
+import os
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """計算兩點間的距離（公里）"""
-    R = 6371  # 地球半径（公里）
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(delta_lat/2) * math.sin(delta_lat/2) + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * 
-         math.sin(delta_lon/2) * math.sin(delta_lon/2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+import instrumentation
+from area_engine import SEARCH_RADIUS_KM, analyze_uspace, build_context, nearest_entries, run_area_reports
+from incremental_analysis import (build_snapshot, diff_external, find_affected_uspace,
+                                  load_snapshot, records_hash, save_snapshot)
+from parking_table import read_parking_data
+from price_histogram import histogram_columns, histogram_fieldnames, histogram_text, price_histogram
+from quantile_sketch import quantile_fieldnames
+from ring_analysis import circle_area_km2, parse_radii, ring_fieldnames
 
-def analyze_uspace_areas():
-    """分析每個USpace停車場周邊3公里內的外部停車場（僅包含有臨停服務的）"""
+RESULT_CSV = 'uspace_area_analysis_filtered.csv'
+STATE_FILE = 'uspace_area_analysis_filtered_state.json'
+
+FIELDNAMES = [
+    'uspace_id', 'uspace_name', 'uspace_city', 'uspace_district', 'uspace_address',
+    'uspace_lat', 'uspace_lon', 'uspace_space_number', 'uspace_day_rate', 'uspace_night_rate', 'uspace_max_rate',
+    '周邊3km內有臨停服務停車場數量', '周邊外部停車場總車格數', 
+    '周邊平均日間最高費率', '周邊平均日間臨停費率', '周邊平均夜間臨停費率', '周邊平均月租金額',
+    *quantile_fieldnames('周邊'),
+    '周邊停車場價格區間分布_按最高費率',
+    *histogram_fieldnames(),
+    '最近外部停車場距離km', '最遠外部停車場距離km',
+    'USpace最高費率vs周邊差異百分比', 'USpace日間費率vs周邊差異百分比',
+    '競爭密度_每平方公里外部停車場數', '周邊停車場詳細清單'
+]
+
+def load_parking_data(filename='parking_data_fixed.json'):
+    """載入停車場資料（可為 parking_data.json、欄式JSON、二進位格式或 SQLite 資料庫）
     
+    SQLite 資料庫在此只是輸入格式，仍會整份讀入：每個USpace停車場都要與3公里內的
+    外部停車場比對，分析需要全部資料，半徑查詢由記憶體內的空間索引處理。
+    """
     print("載入停車場資料...")
-    with open('parking_data_fixed.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    return read_parking_data(filename)
+
+def has_hourly_rate(parking):
+    """是否提供臨停服務（有日間或夜間臨停費率），純月租制停車場不納入"""
+    return parking.get('day_rate', 0) > 0 or parking.get('night_rate', 0) > 0
+
+def max_hourly_rate(parking):
+    """日間最高金額（日間和夜間取較高者）"""
+    return max(parking.get('day_rate', 0) or 0, parking.get('night_rate', 0) or 0)
+
+def summarize_nearby(uspace, nearby):
+    """彙整單一USpace停車場周邊3公里內有臨停服務的外部停車場
     
-    uspace_parking = data['uspace_parking']
-    external_parking = data['external_parking']
+    nearby 為 [(外部停車場, 距離km), ...]，由分析引擎以共用的候選搜尋提供，
+    且已依 has_hourly_rate 過濾。
+    """
+    uspace_lat = uspace['lat']
+    uspace_lon = uspace['lon']
+    uspace_name = uspace['name']
+    uspace_city = uspace['city']
+    uspace_district = uspace['district']
+    uspace_address = uspace['address']
+    uspace_day_rate = uspace['day_rate']
+    uspace_night_rate = uspace['night_rate']
+    uspace_space_number = uspace['space_number']
+    uspace_max_rate = max(uspace_day_rate or 0, uspace_night_rate or 0)
     
-    # 過濾掉純月租制停車場（日間費率為0的）
-    external_with_hourly = []
-    for parking in external_parking:
-        day_rate = parking.get('day_rate', 0)
-        night_rate = parking.get('night_rate', 0)
-        
-        # 只保留有日間或夜間臨停費率的停車場
-        if day_rate > 0 or night_rate > 0:
-            # 計算日間最高金額（日間和夜間取較高者）
-            max_rate = max(day_rate or 0, night_rate or 0)
-            parking['max_hourly_rate'] = max_rate
-            external_with_hourly.append(parking)
+    # 3公里內有臨停服務的外部停車場
+    nearby_external = []
     
-    print(f"USpace停車場數量: {len(uspace_parking)}")
-    print(f"原始外部停車場數量: {len(external_parking)}")
-    print(f"有臨停服務的外部停車場數量: {len(external_with_hourly)}")
-    print(f"過濾掉純月租制停車場: {len(external_parking) - len(external_with_hourly)}個")
+    for external, distance in nearby:
+        nearby_external.append({
+            'name': external['name'],
+            'distance': distance,
+            'day_rate': external['day_rate'],
+            'night_rate': external['night_rate'],
+            'max_hourly_rate': max_hourly_rate(external),
+            'monthly_rate': external['monthly_rate'],
+            'space_number': external['space_number']
+        })
     
-    results = []
+    # 計算統計資料
+    total_external_count = len(nearby_external)
     
-    for i, uspace in enumerate(uspace_parking):
-        if i % 50 == 0:
-            print(f"處理進度: {i}/{len(uspace_parking)}")
-        
-        uspace_lat = uspace['lat']
-        uspace_lon = uspace['lon']
-        uspace_name = uspace['name']
-        uspace_city = uspace['city']
-        uspace_district = uspace['district']
-        uspace_address = uspace['address']
-        uspace_day_rate = uspace['day_rate']
-        uspace_night_rate = uspace['night_rate']
-        uspace_space_number = uspace['space_number']
-        uspace_max_rate = max(uspace_day_rate or 0, uspace_night_rate or 0)
-        
-        # 找出3公里內的外部停車場（僅限有臨停服務的）
-        nearby_external = []
+    if total_external_count > 0:
+        # 總車格數
+        total_spaces = sum(ext['space_number'] for ext in nearby_external if ext['space_number'] and ext['space_number'] > 0)
         
-        for external in external_with_hourly:
-            try:
-                external_lat = external['lat']
-                external_lon = external['lon']
-                
-                # 計算距離
-                distance = calculate_distance(uspace_lat, uspace_lon, external_lat, external_lon)
-                
-                if distance <= 3.0:  # 3公里內
-                    nearby_external.append({
-                        'name': external['name'],
-                        'distance': distance,
-                        'day_rate': external['day_rate'],
-                        'night_rate': external['night_rate'],
-                        'max_hourly_rate': external['max_hourly_rate'],
-                        'monthly_rate': external['monthly_rate'],
-                        'space_number': external['space_number']
-                    })
-            except (ValueError, TypeError):
-                continue
+        # 平均日間最高費率
+        max_rates = [ext['max_hourly_rate'] for ext in nearby_external if ext['max_hourly_rate'] and ext['max_hourly_rate'] > 0]
+        avg_max_rate = sum(max_rates) / len(max_rates) if max_rates else 0
         
-        # 計算統計資料
-        total_external_count = len(nearby_external)
+        # 平均日間費率
+        day_rates = [ext['day_rate'] for ext in nearby_external if ext['day_rate'] and ext['day_rate'] > 0]
+        avg_day_rate = sum(day_rates) / len(day_rates) if day_rates else 0
         
-        if total_external_count > 0:
-            # 總車格數
-            total_spaces = sum(ext['space_number'] for ext in nearby_external if ext['space_number'] and ext['space_number'] > 0)
-            
-            # 平均日間最高費率
-            max_rates = [ext['max_hourly_rate'] for ext in nearby_external if ext['max_hourly_rate'] and ext['max_hourly_rate'] > 0]
-            avg_max_rate = sum(max_rates) / len(max_rates) if max_rates else 0
-            
-            # 平均日間費率
-            day_rates = [ext['day_rate'] for ext in nearby_external if ext['day_rate'] and ext['day_rate'] > 0]
-            avg_day_rate = sum(day_rates) / len(day_rates) if day_rates else 0
-            
-            # 平均夜間費率
-            night_rates = [ext['night_rate'] for ext in nearby_external if ext['night_rate'] and ext['night_rate'] > 0]
-            avg_night_rate = sum(night_rates) / len(night_rates) if night_rates else 0
-            
-            # 平均月租金額
-            monthly_rates = [ext['monthly_rate'] for ext in nearby_external if ext['monthly_rate'] and ext['monthly_rate'] > 0]
-            avg_monthly_rate = sum(monthly_rates) / len(monthly_rates) if monthly_rates else 0
-            
-            # 最近距離
-            min_distance = min(ext['distance'] for ext in nearby_external)
-            
-            # 最遠距離
-            max_distance = max(ext['distance'] for ext in nearby_external)
-            
-        else:
-            total_spaces = 0
-            avg_max_rate = 0
-            avg_day_rate = 0
-            avg_night_rate = 0
-            avg_monthly_rate = 0
-            min_distance = 0
-            max_distance = 0
+        # 平均夜間費率
+        night_rates = [ext['night_rate'] for ext in nearby_external if ext['night_rate'] and ext['night_rate'] > 0]
+        avg_night_rate = sum(night_rates) / len(night_rates) if night_rates else 0
         
-        # 價格比較（使用最高費率比較）
-        uspace_vs_external_max = 0
-        uspace_vs_external_day = 0
+        # 平均月租金額
+        monthly_rates = [ext['monthly_rate'] for ext in nearby_external if ext['monthly_rate'] and ext['monthly_rate'] > 0]
+        avg_monthly_rate = sum(monthly_rates) / len(monthly_rates) if monthly_rates else 0
         
-        if avg_max_rate > 0 and uspace_max_rate > 0:
-            uspace_vs_external_max = ((uspace_max_rate - avg_max_rate) / avg_max_rate) * 100
+        # 最近距離
+        min_distance = min(ext['distance'] for ext in nearby_external)
         
-        if avg_day_rate > 0 and uspace_day_rate > 0:
-            uspace_vs_external_day = ((uspace_day_rate - avg_day_rate) / avg_day_rate) * 100
-        
-        # 計算周邊停車場價格區間分布（使用最高費率）
-        price_ranges = {
-            '0-30元': 0,
-            '31-50元': 0,
-            '51-80元': 0,
-            '81-120元': 0,
-            '121-200元': 0,
-            '200元以上': 0
-        }
-        
-        for ext in nearby_external:
-            max_rate = ext['max_hourly_rate']
-            if max_rate <= 30:
-                price_ranges['0-30元'] += 1
-            elif max_rate <= 50:
-                price_ranges['31-50元'] += 1
-            elif max_rate <= 80:
-                price_ranges['51-80元'] += 1
-            elif max_rate <= 120:
-                price_ranges['81-120元'] += 1
-            elif max_rate <= 200:
-                price_ranges['121-200元'] += 1
-            else:
-                price_ranges['200元以上'] += 1
-        
-        # 格式化價格區間字串
-        price_range_summary = []
-        for range_name, count in price_ranges.items():
-            if count > 0:
-                price_range_summary.append(f"{range_name}:{count}場")
-        
-        price_range_text = '; '.join(price_range_summary) if price_range_summary else '無資料'
-        
-        # 添加結果
-        results.append({
-            'uspace_id': uspace['id'],
-            'uspace_name': uspace_name,
-            'uspace_city': uspace_city,
-            'uspace_district': uspace_district,
-            'uspace_address': uspace_address,
-            'uspace_lat': uspace_lat,
-            'uspace_lon': uspace_lon,
-            'uspace_space_number': uspace_space_number,
-            'uspace_day_rate': uspace_day_rate,
-            'uspace_night_rate': uspace_night_rate,
-            'uspace_max_rate': uspace_max_rate,
-            '周邊3km內有臨停服務停車場數量': total_external_count,
-            '周邊外部停車場總車格數': total_spaces,
-            '周邊平均日間最高費率': round(avg_max_rate, 2) if avg_max_rate > 0 else 0,
-            '周邊平均日間臨停費率': round(avg_day_rate, 2) if avg_day_rate > 0 else 0,
-            '周邊平均夜間臨停費率': round(avg_night_rate, 2) if avg_night_rate > 0 else 0,
-            '周邊平均月租金額': round(avg_monthly_rate, 2) if avg_monthly_rate > 0 else 0,
-            '周邊停車場價格區間分布_按最高費率': price_range_text,
-            '最近外部停車場距離km': round(min_distance, 2) if min_distance > 0 else 0,
-            '最遠外部停車場距離km': round(max_distance, 2) if max_distance > 0 else 0,
-            'USpace最高費率vs周邊差異百分比': round(uspace_vs_external_max, 2),
-            'USpace日間費率vs周邊差異百分比': round(uspace_vs_external_day, 2),
-            '競爭密度_每平方公里外部停車場數': round(total_external_count / (3.14 * 3 * 3), 2),
-            '周邊停車場詳細清單': '; '.join([f"{ext['name']}({ext['distance']:.2f}km,最高:{ext['max_hourly_rate']},日:{ext['day_rate']},夜:{ext['night_rate']},月:{ext['monthly_rate']})" for ext in nearby_external[:5]])
-        })
+        # 最遠距離
+        max_distance = max(ext['distance'] for ext in nearby_external)
+    
+    else:
+        total_spaces = 0
+        avg_max_rate = 0
+        avg_day_rate = 0
+        avg_night_rate = 0
+        avg_monthly_rate = 0
+        min_distance = 0
+        max_distance = 0
     
-    return results
+    # 價格比較（使用最高費率比較）
+    uspace_vs_external_max = 0
+    uspace_vs_external_day = 0
+    
+    if avg_max_rate > 0 and uspace_max_rate > 0:
+        uspace_vs_external_max = ((uspace_max_rate - avg_max_rate) / avg_max_rate) * 100
+    
+    if avg_day_rate > 0 and uspace_day_rate > 0:
+        uspace_vs_external_day = ((uspace_day_rate - avg_day_rate) / avg_day_rate) * 100
+    
+    # 計算周邊停車場價格區間分布（使用最高費率）
+    price_ranges = price_histogram([ext['max_hourly_rate'] for ext in nearby_external])
+    price_range_text = histogram_text(price_ranges)
+    
+    # 回傳結果
+    return {
+        'uspace_id': uspace['id'],
+        'uspace_name': uspace_name,
+        'uspace_city': uspace_city,
+        'uspace_district': uspace_district,
+        'uspace_address': uspace_address,
+        'uspace_lat': uspace_lat,
+        'uspace_lon': uspace_lon,
+        'uspace_space_number': uspace_space_number,
+        'uspace_day_rate': uspace_day_rate,
+        'uspace_night_rate': uspace_night_rate,
+        'uspace_max_rate': uspace_max_rate,
+        '周邊3km內有臨停服務停車場數量': total_external_count,
+        '周邊外部停車場總車格數': total_spaces,
+        '周邊平均日間最高費率': round(avg_max_rate, 2) if avg_max_rate > 0 else 0,
+        '周邊平均日間臨停費率': round(avg_day_rate, 2) if avg_day_rate > 0 else 0,
+        '周邊平均夜間臨停費率': round(avg_night_rate, 2) if avg_night_rate > 0 else 0,
+        '周邊平均月租金額': round(avg_monthly_rate, 2) if avg_monthly_rate > 0 else 0,
+        '周邊停車場價格區間分布_按最高費率': price_range_text,
+        **histogram_columns(price_ranges),
+        '最近外部停車場距離km': round(min_distance, 2) if min_distance > 0 else 0,
+        '最遠外部停車場距離km': round(max_distance, 2) if max_distance > 0 else 0,
+        'USpace最高費率vs周邊差異百分比': round(uspace_vs_external_max, 2),
+        'USpace日間費率vs周邊差異百分比': round(uspace_vs_external_day, 2),
+        '競爭密度_每平方公里外部停車場數': round(total_external_count / circle_area_km2(SEARCH_RADIUS_KM), 2),
+        '周邊停車場詳細清單': '; '.join([f"{ext['name']}({ext['distance']:.2f}km,最高:{ext['max_hourly_rate']},日:{ext['day_rate']},夜:{ext['night_rate']},月:{ext['monthly_rate']})" for ext in nearest_entries(nearby_external)])
+    }
+
+# 供 area_engine 使用的報表定義：只納入有臨停服務的外部停車場
+REPORT = {
+    'predicate': has_hourly_rate,
+    'metrics': summarize_nearby
+}
 
-def save_to_csv(results):
-    """儲存結果到CSV檔案"""
-    filename = 'uspace_area_analysis_filtered.csv'
-    
-    fieldnames = [
-        'uspace_id', 'uspace_name', 'uspace_city', 'uspace_district', 'uspace_address',
-        'uspace_lat', 'uspace_lon', 'uspace_space_number', 'uspace_day_rate', 'uspace_night_rate', 'uspace_max_rate',
-        '周邊3km內有臨停服務停車場數量', '周邊外部停車場總車格數', 
-        '周邊平均日間最高費率', '周邊平均日間臨停費率', '周邊平均夜間臨停費率', '周邊平均月租金額',
-        '周邊停車場價格區間分布_按最高費率',
-        '最近外部停車場距離km', '最遠外部停車場距離km',
-        'USpace最高費率vs周邊差異百分比', 'USpace日間費率vs周邊差異百分比',
-        '競爭密度_每平方公里外部停車場數', '周邊停車場詳細清單'
-    ]
+def analyze_uspace_areas(data=None, workers=1, radii=None):
+    """分析每個USpace停車場周邊3公里內的外部停車場（僅包含有臨停服務的）
+    
+    radii 為額外輸出的半徑圈清單（公里，由小到大），例如 [1, 3, 5]。
+    """
     
+    if data is None:
+        data = load_parking_data()
+    
+    uspace_parking = data['uspace_parking']
+    external_parking = data['external_parking']
+    
+    hourly_count = sum(1 for parking in external_parking if has_hourly_rate(parking))
+    
+    print(f"USpace停車場數量: {len(uspace_parking)}")
+    print(f"原始外部停車場數量: {len(external_parking)}")
+    print(f"有臨停服務的外部停車場數量: {hourly_count}")
+    print(f"過濾掉純月租制停車場: {len(external_parking) - hourly_count}個")
+    
+    return run_area_reports(data, {'filtered': REPORT}, workers, radii)['filtered']
+
+def save_to_csv(results, filename=RESULT_CSV, radii=None):
+    """儲存結果到CSV檔案，指定 radii 時附加各半徑圈的欄位"""
     with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES + ring_fieldnames(radii or []))
         writer.writeheader()
         writer.writerows(results)
     
     print(f"過濾後的分析結果已儲存到 {filename}")
     return filename
 
+def update_analysis_incremental(data=None, csv_file=RESULT_CSV, state_file=STATE_FILE, radii=None):
+    """增量更新分析結果：只重算異動外部停車場半徑內的USpace停車場
+    
+    與前次快照比對外部停車場的 id 與內容雜湊，直接修補既有CSV中受影響的列。
+    沒有快照、USpace清單或半徑圈設定變更、CSV與快照不一致時，改為完整重新分析。
+    回傳更新後的完整結果列。
+    """
+    if data is None:
+        data = load_parking_data()
+    
+    uspace_parking = data['uspace_parking']
+    external_parking = data['external_parking']
+    
+    search_radius = max([SEARCH_RADIUS_KM] + list(radii or []))
+    previous_snapshot = load_snapshot(state_file)
+    existing_rows = None
+    existing_fieldnames = None
+    if os.path.exists(csv_file):
+        with open(csv_file, 'r', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            existing_rows = list(reader)
+            existing_fieldnames = reader.fieldnames
+    
+    if (previous_snapshot is None or existing_rows is None or
+        previous_snapshot.get('radius_km') != search_radius or
+        existing_fieldnames != FIELDNAMES + ring_fieldnames(radii or []) or
+        previous_snapshot.get('uspace_hash') != records_hash(uspace_parking) or
+        [row['uspace_id'] for row in existing_rows] != [uspace['id'] for uspace in uspace_parking]):
+        print("找不到可用的前次分析快照，改為完整重新分析...")
+        results = analyze_uspace_areas(data, radii=radii)
+        save_to_csv(results, csv_file, radii)
+        save_snapshot(build_snapshot(uspace_parking, external_parking, search_radius), state_file)
+        return results
+    
+    added, removed, changed, positions = diff_external(previous_snapshot, external_parking)
+    print(f"外部停車場異動: 新增 {len(added)}、移除 {len(removed)}、變更 {len(changed)}")
+    
+    affected = find_affected_uspace(uspace_parking, positions, search_radius)
+    print(f"需要重新計算的USpace停車場: {len(affected)}/{len(uspace_parking)}")
+    
+    if affected:
+        context = build_context(external_parking, {'filtered': REPORT}, radii)
+        for i in instrumentation.track(affected):
+            existing_rows[i] = analyze_uspace(uspace_parking[i], *context)['filtered']
+        save_to_csv(existing_rows, csv_file, radii)
+    
+    save_snapshot(build_snapshot(uspace_parking, external_parking, search_radius), state_file)
+    return existing_rows
+
 def generate_summary_stats(results):
     """生成統計摘要"""
     total_uspace = len(results)
@@ -243,18 +265,41 @@ def generate_summary_stats(results):
     print(f"最高費率低於周邊: {lower_max_rate} ({lower_max_rate/total_uspace*100:.1f}%)")
 
 def main():
-    print("開始USpace停車場周邊分析（過濾純月租制停車場）...")
+    parser = argparse.ArgumentParser(description='USpace停車場周邊分析（過濾純月租制停車場）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='只重新計算外部停車場異動範圍內的USpace停車場，並修補既有CSV')
+    parser.add_argument('--workers', type=int, default=1, help='平行計算的行程數（預設1，不平行）')
+    parser.add_argument('--radii', type=parse_radii,
+                        help='額外輸出的半徑圈（公里，以逗號分隔），例如 1,3,5')
+    parser.add_argument('--data', default='parking_data_fixed.json',
+                        help='停車場資料檔（parking_data.json、欄式JSON、二進位格式或 SQLite 資料庫，皆整份讀入）')
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure_from_args(args)
     
-    # 執行分析
-    results = analyze_uspace_areas()
+    print("開始USpace停車場周邊分析（過濾純月租制停車場）...")
     
-    # 儲存CSV
-    csv_filename = save_to_csv(results)
+    data = load_parking_data(args.data)
     
-    # 生成統計摘要
-    generate_summary_stats(results)
+    if args.incremental:
+        update_analysis_incremental(data, radii=args.radii)
+        print(f"\n增量更新完成！請查看 {RESULT_CSV}")
+    else:
+        # 執行分析
+        results = analyze_uspace_areas(data, workers=args.workers, radii=args.radii)
+        
+        # 儲存CSV
+        csv_filename = save_to_csv(results, radii=args.radii)
+        search_radius = max([SEARCH_RADIUS_KM] + (args.radii or []))
+        save_snapshot(build_snapshot(data['uspace_parking'], data['external_parking'], search_radius), STATE_FILE)
+        
+        # 生成統計摘要
+        generate_summary_stats(results)
+        
+        print(f"\n過濾後分析完成！請查看 {csv_filename}")
     
-    print(f"\n過濾後分析完成！請查看 {csv_filename}")
+    if args.metrics:
+        instrumentation.write_metrics(args.metrics)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file